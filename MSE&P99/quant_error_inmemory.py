@@ -0,0 +1,46 @@
+import os, sys
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from quant_utils.error_analysis import load_baseline_weights, parse_config, analyze, write_reports
+from quant_utils.quant_weight import set_compute_dtype
+
+# Script: quantization error of all MatMul/Gemm weights for many configs, without exporting
+#         the quantized models. The fp16 baseline is read once and re-quantized in memory,
+#         the reports have the layout of quant_error_multi_weight.py / plot.py.
+
+TARGET_INIT = "model.decoder.layers.0.self_attn.k_proj.weight"
+
+
+def main(args):
+    base_fp = os.path.join(args.baseline_dir, "model.onnx")
+    configs = [parse_config(c) for c in args.configs]
+    set_compute_dtype(args.quant_compute_dtype)
+
+    weights = load_baseline_weights(base_fp)
+    if not weights:
+        print("[Error] No MatMul/Gemm weights found.")
+        return
+    if args.target_init not in weights:
+        print(f"[warn] {args.target_init} not in baseline, no single-weight report")
+
+    mem_budget = args.quant_mem_budget_mb * 2**20 if args.quant_mem_budget_mb else None
+    multi, elwise, single, model = analyze(weights, configs, target=args.target_init,
+                                    num_workers=args.num_workers, mem_budget=mem_budget)
+    write_reports(multi, elwise, single, args.output_dir, model)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--baseline_dir", required=True)
+    p.add_argument("--configs", nargs="+", required=True,
+                   help="<datatype>:<group size>[:<bits>], e.g. int4:128 int4_asym:-1 fp4:none")
+    p.add_argument("--output_dir", default="../multi_weight_result")
+    p.add_argument("--target_init", default=TARGET_INIT,
+                   help="tensor of the single-weight report (plot.py layout)")
+    p.add_argument("--num_workers", type=int, default=1,
+                   help="threads quantizing weights in parallel")
+    p.add_argument("--quant_mem_budget_mb", type=int, default=None)
+    p.add_argument("--quant_compute_dtype", type=str, default="fp16", choices=["fp16", "fp32"])
+    args = p.parse_args()
+    main(args)
@@ -0,0 +1,24 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+# same reports as quant_error_multi_weight.sh, without exporting any quantized model
+RESULT_DIR="../multi_weight_result"
+BASELINE_DIR="../onnx_graph/facebook__opt-1.3b/fp16_baseline"
+
+# granularity: per-group(128), per-channel(-1, as export_and_quant.sh)
+DTYPES=("int8" "int8_asym" "int4" "int4_asym" "fp4" "fp8_e3m4" "fp8_e4m3")
+GROUPSIZES=(128 -1)
+
+CONFIGS=()
+for GS in "${GROUPSIZES[@]}"; do
+  for DTYPE in "${DTYPES[@]}"; do
+    CONFIGS+=("${DTYPE}:${GS}")
+  done
+done
+
+python quant_error_inmemory.py \
+  --baseline_dir "$BASELINE_DIR" \
+  --configs      "${CONFIGS[@]}" \
+  --output_dir   "$RESULT_DIR"
+
+echo "[Done] reports → ${RESULT_DIR}"
@@ -1,41 +1,27 @@
-import os
+import os, sys
 import argparse
-import onnx
 import numpy as np
 import csv
-from onnx import TensorProto
 
-# Script: Compute quant error for all MatMul/Gemm weights across entire initializer set
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from quant_utils.onnx_reader import OnnxReader
+from quant_utils.graph_index import load_index
+from quant_utils.error_sketch import sketch_layers, quantile_row, QUANTILE_FIELDS
 
-import argparse
-import onnx
-import numpy as np
-import csv
-from onnx import TensorProto
+# Script: Compute quant error for all MatMul/Gemm weights across entire initializer set
 
 # Script: Compute quantization error for all MatMul/Gemm weights
 
-# ONNX -> NumPy dtype mapping
-DTYPE_MAP = {
-    TensorProto.FLOAT:   np.float32,
-    TensorProto.FLOAT16: np.float16,
-    TensorProto.DOUBLE:  np.float64,
-    TensorProto.INT8:    np.int8,
-    TensorProto.UINT8:   np.uint8,
-    TensorProto.INT32:   np.int32,
-    TensorProto.INT64:   np.int64,
-}
-
-
+# MatMul/Gemm weight index (cached next to the model) + memory-mapped initializers
 def load_initializers(model_path: str):
-    model = onnx.load(model_path)
-    return {init.name: init for init in model.graph.initializer}, model
+    index = load_index(model_path)
+    return OnnxReader(model_path, index), index
 
-# raw bytes in TensorProto object -> numpy array
-def proto_to_array(init: onnx.TensorProto):
-    dtype = DTYPE_MAP[init.data_type]
-    arr = np.frombuffer(init.raw_data, dtype=dtype).reshape(init.dims)
-    return arr.astype(np.float32)
+# initializer -> numpy array (zero-copy view of the mapped file)
+# as_dtype=None keeps the stored dtype
+def proto_to_array(inits: OnnxReader, name: str, as_dtype=np.float32):
+    arr = inits.get(name)
+    return arr if as_dtype is None else arr.astype(as_dtype)
 
 # model path parsing
 def parse_quant_config(model_path: str):
@@ -52,92 +38,53 @@ def parse_quant_config(model_path: str):
     return "baseline", base, None, None
 
 
-def compute_mse(a: np.ndarray, b: np.ndarray):
-    a32, b32 = a.astype(np.float32), b.astype(np.float32)
-    diff = a32 - b32
-    return float(np.mean(diff * diff))
-
+def compute_errors(a: np.ndarray, b: np.ndarray, grouping, gs, accum_dtype=np.float64):
+    # squared error computed once in accum_dtype: fp16 inputs are cast inside the
+    # subtraction (no float copies of a / b), every MSE below is a reduction of it
+    sq = np.subtract(a, b, dtype=accum_dtype)
+    np.square(sq, out=sq)
 
-def compute_errors(a: np.ndarray, b: np.ndarray, grouping, gs):
     # 1) per-tensor MSE
-    mse_tensor = compute_mse(a, b)
+    mse_tensor = float(sq.mean())
 
-    # 2) per-channel or per-group vector MSE (2D only)
+    # 2) per-channel or per-group vector MSE (2D only), one reduction per tensor
     per_vec = None
     if grouping == "per-channel" and a.ndim == 2:
-        _, C = a.shape
-        per_vec = [compute_mse(a[:, c], b[:, c]) for c in range(C)]
+        per_vec = sq.mean(axis=0)                               # [C] column MSE
     elif grouping == "per-group" and a.ndim == 2:
-        _, C = a.shape
+        K, C = a.shape
         assert gs and C % gs == 0, "group size mismatch"
-        G = C // gs
-        per_vec = []
-        for g in range(G):
-            slice_a = a[:, g*gs:(g+1)*gs]
-            slice_b = b[:, g*gs:(g+1)*gs]
-            per_vec.append(compute_mse(slice_a, slice_b))
+        per_vec = sq.reshape(K, C // gs, gs).mean(axis=(0, 2))  # [G] column-block MSE
 
     result = {"mse_tensor": mse_tensor}
     if per_vec is not None:
-        vec = np.array(per_vec)
+        vec = per_vec
         result.update({
             "mse_rep": float(vec.mean()),
             "mse_p99": float(np.percentile(vec, 99)),
         })
     return result
 
-# Sort weights for GeMM, MatMul 
-def find_compute_weights(model):
-    # Identify initializers used in MatMul/Gemm
-    initializer_map = {init.name: init for init in model.graph.initializer}
-    matmul_nodes = [n for n in model.graph.node if n.op_type in ("MatMul", "Gemm")]
-    # transpose output -> node lookup table
-    output_to_node = {}
-    for node in model.graph.node:
-        for out_name in node.output:
-            output_to_node[out_name] = node
-
-    compute_weights = set()
-    for node in matmul_nodes:
-        if len(node.input) < 2:
-            continue
-        inp = node.input[1] # input[0] : A, GeMM node's input B
-        # Case A) GeMM: second input is used as a weight initializer
-        if inp in initializer_map:
-            compute_weights.add(inp)
-        # Case B) MatMul: input B is used as "Transpose" node's output,
-        #                 "Transpose" nodes gets weight initializer as an input and returns that output
-        else:
-            tn = output_to_node.get(inp)
-            if tn and tn.op_type == "Transpose":
-                w_name = tn.input[0]
-                if w_name in initializer_map:
-                    compute_weights.add(w_name)
-    return compute_weights
-
-
-def main(baseline_dir, quant_dir, output_csv):
+def main(baseline_dir, quant_dir, output_csv, fp32_accum=False, quantile_csv=None, num_workers=1):
     # Load baseline and quant models + initializers
     base_fp = os.path.join(baseline_dir, "model.onnx")
     quant_fp = os.path.join(quant_dir,    "model.onnx")
 
-    base_inits,     base_model  = load_initializers(base_fp)
-    quant_inits,    quant_model = load_initializers(quant_fp)
-
-    # Compute set of weight names involved in MatMul/Gemm
-    compute_weights = find_compute_weights(base_model)
+    # MatMul/Gemm weights of the baseline (graph index)
+    base_inits,     compute_weights = load_initializers(base_fp)
+    quant_inits,    _               = load_initializers(quant_fp)
 
     grouping, dtype, bits, gs = parse_quant_config(quant_fp)
+    accum_dtype = np.float32 if fp32_accum else np.float64
     rows = []
+    # filter only compute_weights present in both baseline and quant
+    names = [name for name in compute_weights if name in quant_inits]
 
-    for name, init_base in base_inits.items():
-        # filter only compute_weights present in both baseline and quant
-        if name not in compute_weights or name not in quant_inits:
-            continue
+    for name in names:
 
-        arr_base  = proto_to_array(init_base)
-        arr_quant = proto_to_array(quant_inits[name])
-        stats = compute_errors(arr_base, arr_quant, grouping, gs)
+        arr_base  = proto_to_array(base_inits, name, None)
+        arr_quant = proto_to_array(quant_inits, name, None)
+        stats = compute_errors(arr_base, arr_quant, grouping, gs, accum_dtype)
 
         row = {
             "initializer": name,
@@ -163,11 +110,31 @@ def main(baseline_dir, quant_dir, output_csv):
 
     print(f"[Done] report saved -> {output_csv}")
 
+    if quantile_csv:
+        # |error| P50 / P99 / P99.9 per layer and over the whole model: streaming sketches
+        # fed chunk by chunk from the mapped weights, per-layer sketches merged into the model one
+        per_layer, total = sketch_layers(
+            [(name, base_inits.get(name), quant_inits.get(name)) for name in names], num_workers)
+        q_rows = [quantile_row(name, sk) for name, sk in per_layer.items()]
+        q_rows.append(quantile_row("(model)", total))
+        with open(quantile_csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=QUANTILE_FIELDS)
+            writer.writeheader()
+            writer.writerows(q_rows)
+        print(f"[Done] quantile report saved -> {quantile_csv}")
+
 
 if __name__ == "__main__":
     p = argparse.ArgumentParser()
     p.add_argument("--baseline_dir", required=True)
     p.add_argument("--quant_dir",    required=True)
     p.add_argument("--output_csv",   default="all_weights_error_filtered.csv")
+    p.add_argument("--fp32_accum",   action="store_true",
+                   help="accumulate squared errors in float32 (half the memory of the float64 default)")
+    p.add_argument("--quantile_csv", default=None,
+                   help="also write per-layer and whole-model |error| P50/P99/P99.9 (streaming sketch)")
+    p.add_argument("--num_workers",  type=int, default=1,
+                   help="threads sketching layers in parallel for --quantile_csv")
     args = p.parse_args()
-    main(args.baseline_dir, args.quant_dir, args.output_csv)
+    main(args.baseline_dir, args.quant_dir, args.output_csv, args.fp32_accum,
+         args.quantile_csv, args.num_workers)
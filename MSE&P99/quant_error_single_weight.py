@@ -1,34 +1,23 @@
-import os
+import os, sys
 import argparse
-import onnx
 import numpy as np
 import csv
 import matplotlib.pyplot as plt
-from onnx import TensorProto
-import matplotlib.pyplot as plt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from quant_utils.onnx_reader import OnnxReader
 # --------------------
 # initializer 
 TARGET_INIT = "model.decoder.layers.0.self_attn.k_proj.weight"
 
-# ONNX → NumPy dtype mapping
-DTYPE_MAP = {
-    TensorProto.FLOAT:   np.float32,
-    TensorProto.FLOAT16: np.float16,
-    TensorProto.DOUBLE:  np.float64,
-    TensorProto.INT8:    np.int8,
-    TensorProto.UINT8:   np.uint8,
-    TensorProto.INT32:   np.int32,
-    TensorProto.INT64:   np.int64,
-}
-
+# graph only, initializers are memory-mapped views of the external data file
 def load_initializers(model_path: str):
-    model = onnx.load(model_path)
-    return {init.name: init for init in model.graph.initializer}
+    return OnnxReader(model_path)
 
-def proto_to_array(init: onnx.TensorProto):
-    dtype = DTYPE_MAP[init.data_type]
-    arr = np.frombuffer(init.raw_data, dtype=dtype)
-    return arr.reshape(init.dims).astype(np.float32)
+# as_dtype=None keeps the stored dtype (zero-copy view)
+def proto_to_array(inits: OnnxReader, name: str, as_dtype=np.float32):
+    arr = inits.get(name)
+    return arr if as_dtype is None else arr.astype(as_dtype)
 
 def parse_quant_config(model_path: str):
     parts = model_path.split(os.sep)
@@ -43,52 +32,46 @@ def parse_quant_config(model_path: str):
     base = os.path.basename(os.path.dirname(model_path))
     return "baseline", base, None, None
 
-def compute_mse(a: np.ndarray, b: np.ndarray):
-    diff = a - b
-    return float(np.mean(diff*diff))
+def compute_errors(a: np.ndarray, b: np.ndarray, grouping, gs, accum_dtype=np.float64):
+    # squared error computed once in accum_dtype: fp16 inputs are cast inside the
+    # subtraction (no float copies of a / b), every MSE below is a reduction of it
+    sq = np.subtract(a, b, dtype=accum_dtype)
+    np.square(sq, out=sq)
 
-def compute_errors(a: np.ndarray, b: np.ndarray, grouping, gs):
     # 1) per-tensor (global) MSE
-    mse_tensor = compute_mse(a, b)
+    mse_tensor = float(sq.mean())
 
-    # 2) per-channel or per-group vector of MSEs
+    # 2) per-channel or per-group vector of MSEs, one reduction per tensor
     per_vec = None
     if grouping == "per-channel" and a.ndim == 2:
         # Row as “# of channels” [K,C]
-        K, _ = a.shape
-        per_vec = [ compute_mse(a[k,:], b[k,:]) for k in range(K) ]
-
+        per_vec = sq.mean(axis=1)
     elif grouping == "per-group" and a.ndim == 2:
-        K, C = a.shape          
+        K, C = a.shape
         assert gs and C % gs == 0, "group size mismatch"
-        G = C // gs     # [K,g,gs(=128)]
-        per_vec=[]
-        for k in range(K):
-            for g  in range(G):
-                start, end = g*gs, (g+1)*gs
-                per_vec.append(
-                    compute_mse(a[k, start:end], b[k, start:end])
-                )
+        G = C // gs     # [K,g,gs(=128)] -> (k, g) order
+        per_vec = sq.reshape(K, G, gs).mean(axis=2).reshape(-1)
 
     # 3) representative (mean of per_vec), plus percentiles
     result = {"mse_tensor": mse_tensor}
     if per_vec is not None:
-        vec = np.array(per_vec)
-        result["per_vec"]   = vec.tolist()
+        vec = per_vec
+        result["per_vec"]   = vec
         result["mse_rep"]   = float(vec.mean())
         result["mse_p99"]   = float(np.percentile(vec, 99))
 
-    plt.hist(np.abs(per_vec), bins = 200)
-    plt.title(f"{grouping} MSE distribution")
+        plt.hist(np.abs(per_vec), bins = 200)
+        plt.title(f"{grouping} MSE distribution")
     return result
 
-def main(baseline_dir, quant_dirs, output_csv):
+def main(baseline_dir, quant_dirs, output_csv, fp32_accum=False):
     # load baseline
     base_path  = os.path.join(baseline_dir, "model.onnx")
     base_inits = load_initializers(base_path)
     if TARGET_INIT not in base_inits:
         raise ValueError(f"{TARGET_INIT} not in baseline.")
-    arr_base = proto_to_array(base_inits[TARGET_INIT])
+    arr_base = proto_to_array(base_inits, TARGET_INIT, None)
+    accum_dtype = np.float32 if fp32_accum else np.float64
 
     rows = []
     for qdir in quant_dirs:
@@ -101,9 +84,9 @@ def main(baseline_dir, quant_dirs, output_csv):
         if TARGET_INIT not in quant_inits:
             print(f"[warn] skip {qdir}")
             continue
-        arr_quant = proto_to_array(quant_inits[TARGET_INIT])
+        arr_quant = proto_to_array(quant_inits, TARGET_INIT, None)
 
-        stats = compute_errors(arr_base, arr_quant, grouping, gs)
+        stats = compute_errors(arr_base, arr_quant, grouping, gs, accum_dtype)
 
         row = {
             "datatype":    dtype,
@@ -146,5 +129,7 @@ if __name__ == "__main__":
     p.add_argument("--baseline_dir", required=True)
     p.add_argument("--quant_dirs", nargs="+", required=True)
     p.add_argument("--output_csv", default="single_weight_error.csv")
+    p.add_argument("--fp32_accum", action="store_true",
+                   help="accumulate squared errors in float32 (half the memory of the float64 default)")
     args = p.parse_args()
-    main(args.baseline_dir, args.quant_dirs, args.output_csv)
+    main(args.baseline_dir, args.quant_dirs, args.output_csv, args.fp32_accum)
@@ -1,8 +1,11 @@
-import onnx
+import os, sys
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.ticker import MultipleLocator
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from quant_utils.onnx_reader import read_initializer
+
 class QuantizationErrorAnalyzer:
     
     # 1) ONNX file path
@@ -104,11 +107,11 @@ class QuantizationErrorAnalyzer:
             
     def _load_weight(self, onnx_path: str, tensor_name: str) -> np.ndarray:
         print(f"Load '{tensor_name}' from path '{onnx_path}'")
-        model = onnx.load(onnx_path)
-        for init in model.graph.initializer:
-            if init.name == tensor_name:
-                return onnx.numpy_helper.to_array(init).astype(np.float32)
-        raise KeyError(f"cannot find '{tensor_name}' in path"'{onnx_path}'"")
+        # only this initializer is read (memory-mapped external data)
+        try:
+            return read_initializer(onnx_path, tensor_name).astype(np.float32)
+        except KeyError:
+            raise KeyError(f"cannot find '{tensor_name}' in path"'{onnx_path}'"") from None
 
     def get_p99_error(self) -> float:
         return np.percentile(self.abs_elementwise_error, 99)
@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 import argparse
-import onnx
+import os, sys
 import numpy as np
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from quant_utils.onnx_reader import read_initializer
+
 def parse_args():
     p = argparse.ArgumentParser(
         description="Compute and plot bucketed quantization error between FP16 and another quant format")
@@ -22,11 +25,8 @@ def parse_args():
     return p.parse_args()
 
 def load_weight(onnx_path: str, tensor_name: str) -> np.ndarray:
-    model = onnx.load(onnx_path)
-    for init in model.graph.initializer:
-        if init.name == tensor_name:
-            return onnx.numpy_helper.to_array(init)
-    raise KeyError(f"Initializer '{tensor_name}' not found in {onnx_path}")
+    # read-only view of the memory-mapped initializer, other tensors are not loaded
+    return read_initializer(onnx_path, tensor_name)
 
 def main():
     args = parse_args()
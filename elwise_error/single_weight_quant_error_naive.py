@@ -1,8 +1,11 @@
-import onnx
+import os, sys
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.ticker import MultipleLocator
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from quant_utils.onnx_reader import read_initializer
+
 # ───────────────────────────────────────────────────────────────
 # 1) ONNX model file(.onnx) path configuration
 # ───────────────────────────────────────────────────────────────
@@ -46,11 +49,8 @@ tensor_name = 'model.decoder.layers.0.self_attn.k_proj.weight'
 # 3) initializer to numpy array 
 # ───────────────────────────────────────────────────────────────
 def load_weight(onnx_path: str, tensor_name: str) -> np.ndarray:
-    model = onnx.load(onnx_path)
-    for init in model.graph.initializer:
-        if init.name == tensor_name:
-            return onnx.numpy_helper.to_array(init)
-    raise KeyError(f"Initializer '{tensor_name}' not found in {onnx_path}")
+    # read-only view of the memory-mapped initializer, other tensors are not loaded
+    return read_initializer(onnx_path, tensor_name)
 
 # ───────────────────────────────────────────────────────────────
 # 4) weight load
@@ -8,7 +8,8 @@ import math
 from tqdm import tqdm
 from transformers import AutoTokenizer
 from datasets import load_dataset
-from onnxruntime import InferenceSession
+from onnxruntime import InferenceSession, SessionOptions
+from quant_utils.sweep_manifest import SweepManifest, eval_inputs, config_key, clip_tag, artifact_files
 
 def batch_nll_and_count(logits: np.ndarray, ids: np.ndarray, mask: np.ndarray):
     # logits: (1, L, V), ids & mask: (1, L)
@@ -48,23 +49,57 @@ def parse_args():
                    help="Quant datatype, e.g. int4, int4_asym, fp4, fp8_e5m2")
     p.add_argument("--wq_groupsize",      type=int, default=128,
                    help="Quant group size; 0 or -1 → per-channel")
+    p.add_argument("--quant_clip_grid",   type=int, default=0,
+                   help="clipping-search grid the model was exported with (0 = absmax)")
+    p.add_argument("--quant_clip_min",    type=float, default=0.5)
+    p.add_argument("--quant_clip_norm",   type=float, default=2.0)
+    p.add_argument("--export_format",     type=str, default="fakequant",
+                   choices=["fakequant","qdq","matmulnbits"],
+                   help="Which exported graph to evaluate (see export_and_quant.py)")
+    p.add_argument("--resume",            action="store_true",
+                   help="reuse the PPL recorded in onnx_graph/<model>/manifest.json when the graph, "
+                        "dataset and eval code are unchanged")
+    p.add_argument("--ort_threads",       type=int, default=0,
+                   help="ONNX Runtime intra-op threads (0 = ORT default)")
     return p.parse_args()
 
+def load_corpus(tokenizer, dataset):
+    # wikitext test split, tokenized once: (1, total_tokens)
+    ds = load_dataset("wikitext", dataset, split="test")
+    enc = tokenizer("\n\n".join(ds["text"]), return_tensors="pt")
+    return enc.input_ids.numpy()
+
+def eval_ppl(onnx_path, input_ids, seqlen=1024, sess_options=None, desc=None):
+    """
+        perplexity of one ONNX graph over input_ids in seqlen windows
+        return (ppl, tok/s, MiB on disk)
+    """
+    nsamples = input_ids.size // seqlen
+    sess = InferenceSession(onnx_path, sess_options, providers=["CPUExecutionProvider"])
+
+    total_nll = 0.0
+    total_tok = 0.0
+    t0 = time.perf_counter()
+
+    for i in tqdm(range(nsamples), desc=desc or f"[eval] {onnx_path}"):
+        batch = input_ids[:, i*seqlen:(i+1)*seqlen]
+        mask  = np.ones_like(batch, dtype=np.int64)
+        logits = sess.run(None, {"input_ids": batch})[0]
+        nll, ntoks = batch_nll_and_count(logits, batch, mask)
+        total_nll += nll
+        total_tok += ntoks
+
+    elapsed = time.perf_counter() - t0
+    ppl = math.exp(total_nll / total_tok)
+    # graph + the external data it references (.data or model.onnx.tensors/), no sidecars
+    size_mb = sum(os.path.getsize(p) for p in artifact_files(onnx_path)) / 2**20
+    return ppl, nsamples * seqlen / elapsed, size_mb
+
 def main():
     args = parse_args()
     MODEL = args.model_name
     DATASET = args.dataset
 
-    # tokenizer + dataset 
-    tokenizer = AutoTokenizer.from_pretrained(
-        MODEL, use_fast=False, trust_remote_code=True
-    )
-    ds = load_dataset("wikitext", DATASET, split="test")
-    enc = tokenizer("\n\n".join(ds["text"]), return_tensors="pt")
-    input_ids = enc.input_ids.numpy()    # shape (1, total_tokens)
-    seqlen = 1024
-    nsamples = input_ids.size // seqlen
-
     # pick ONNX model(s) based on CLI flags 
     model_slug = MODEL.replace("/", "__")
     root = os.path.join("onnx_graph", model_slug)
@@ -72,31 +107,40 @@ def main():
     if args.wq_datatype:
         grouping = "per-channel" if args.wq_groupsize in (0,-1) else "per-group"
         gs_name  = "none" if args.wq_groupsize in (0,-1) else str(args.wq_groupsize)
-        subdir = os.path.join(root, grouping, args.wq_datatype, f"w_{args.wq_bits}_gs_{gs_name}")
-        onnx_paths = [os.path.join(subdir, "model.onnx")]
+        subdir = os.path.join(root, grouping, args.wq_datatype, f"w_{args.wq_bits}_gs_{gs_name}{clip_tag(args)}")
+        onnx_name = "model.onnx" if args.export_format == "fakequant" else f"model_{args.export_format}.onnx"
+        onnx_paths = [os.path.join(subdir, onnx_name)]
     else:
         base_dir = "fp16_baseline" if args.baseline_datatype=="fp16" else "fp32_baseline"
         onnx_paths = [os.path.join(root, base_dir, "model.onnx")]
 
     # ── run evaluation ──
+    manifest = SweepManifest.for_model(root)
+    sess_options = SessionOptions()
+    if args.ort_threads > 0:
+        sess_options.intra_op_num_threads = args.ort_threads
+    input_ids = None
     for onnx_path in onnx_paths:
         cfg_dir = os.path.relpath(os.path.dirname(onnx_path), root)
         print(f"\n[Eval] Configuration: {cfg_dir}")
-        sess = InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
-
-        total_nll = 0.0
-        total_tok = 0.0
-
-        for i in tqdm(range(nsamples), desc=f"[eval] {cfg_dir}"):
-            batch = input_ids[:, i*seqlen:(i+1)*seqlen]
-            mask  = np.ones_like(batch, dtype=np.int64)
-            logits = sess.run(None, {"input_ids": batch})[0]
-            nll, ntoks = batch_nll_and_count(logits, batch, mask)
-            total_nll += nll
-            total_tok += ntoks
-
-        ppl = math.exp(total_nll / total_tok)
-        print(f"{cfg_dir:40s} PPL: {ppl:.3f}")
+        key = config_key(onnx_path, root)
+        inputs = eval_inputs(MODEL, manifest.artifact_sha(key, onnx_path), DATASET)
+        results = manifest.eval_done(key, inputs) if args.resume else None
+        if results is None:
+            if input_ids is None:
+                # tokenizer + dataset, only when something is evaluated
+                tokenizer = AutoTokenizer.from_pretrained(
+                    MODEL, use_fast=False, trust_remote_code=True
+                )
+                input_ids = load_corpus(tokenizer, DATASET)
+            ppl, tok_s, size_mb = eval_ppl(onnx_path, input_ids, sess_options=sess_options,
+                                           desc=f"[eval] {cfg_dir}")
+            results = {"ppl": ppl, "tok_s": tok_s, "size_mb": size_mb}
+            manifest.record_eval(key, {"model": MODEL}, inputs, results)
+        else:
+            print("[Skip] up to date, recorded result")
+        print(f"{cfg_dir:40s} PPL: {results['ppl']:.3f}  "
+              f"({results['tok_s']:.1f} tok/s, {results['size_mb']:.1f} MiB on disk)")
 
 if __name__ == "__main__":
     main()
@@ -16,6 +16,9 @@ MODELS=(
 WQ_BIT_LIST=(3 5 6 7)
 WQ_GROUPSIZE_LIST=(128 -1)
 
+# --resume: reuse the PPL recorded in onnx_graph/<model>/manifest.json for unchanged graphs
+declare -a EVAL_ARGS=(--resume)
+
 for MODEL in "${MODELS[@]}"; do
   echo
   echo "======================================================================"
@@ -59,7 +62,8 @@ for MODEL in "${MODELS[@]}"; do
           --dataset "${DATASET}" \
           --wq_bits "${WQ_BIT}" \
           --wq_datatype "${DTYPE}" \
-          --wq_groupsize "${GS}"
+          --wq_groupsize "${GS}" \
+          ${EVAL_ARGS[@]+"${EVAL_ARGS[@]}"}
       done
     done
   done
@@ -1,12 +1,18 @@
 # export_and_quant.py
 
-import os, argparse
+import os, time, shutil, argparse
 import torch
 import onnx 
-from onnx import save_model
+from onnx import save_model, numpy_helper
 from onnx.external_data_helper import convert_model_to_external_data
 from transformers import AutoModelForCausalLM, AutoTokenizer, AutoConfig
-from quant_utils.quant_weight import quant_model
+from quant_utils.quant_weight import (quant_model, dump_initializers, set_compute_dtype,
+                                      set_clip_search, clip_grid)
+from quant_utils.lowbit_linear import EXPORT_FORMATS
+from quant_utils.stream_quant import CheckpointReader
+from quant_utils.onnx_patch import patch_quantized_onnx
+from quant_utils.artifact_store import TensorStore, dedup_onnx
+from quant_utils.sweep_manifest import SweepManifest, export_inputs, config_key, clip_tag
 from optimum.onnxruntime import ORTModelForCausalLM
 
 def parse_args():
@@ -22,8 +28,125 @@ def parse_args():
     p.add_argument("--baseline_datatype", type=str, default=None,
                    help="baseline datatype, example: fp16, fp32")
     p.add_argument("--wq_groupsize", type=int, default=128)
+    p.add_argument("--quant_workers", type=int, default=1,
+                   help="threads quantizing Linear layers in parallel (1 = sequential)")
+    p.add_argument("--quant_max_inflight", type=int, default=None,
+                   help="max layers quantized but not yet written back (default 2*quant_workers)")
+    p.add_argument("--quant_mem_budget_mb", type=int, default=None,
+                   help="MiB of kernel temporaries per layer, large weights are quantized in row tiles")
+    p.add_argument("--quant_compute_dtype", type=str, default="fp16", choices=["fp16", "fp32"],
+                   help="arithmetic of the INT/FP quant kernels (fp16: original rounding bit for bit)")
+    p.add_argument("--quant_clip_grid", type=int, default=0,
+                   help="clipping ratios searched per channel/group for the scale (0 = absmax scaling); "
+                        "the search is tiled to --quant_mem_budget_mb, 512 MiB per worker by default")
+    p.add_argument("--quant_clip_min", type=float, default=0.5,
+                   help="smallest clipping ratio of the grid")
+    p.add_argument("--quant_clip_norm", type=float, default=2.0,
+                   help="p of the |deq - w|^p error minimized by the clipping search")
+    p.add_argument("--error_report", action="store_true",
+                   help="write per-layer weight MSE / P99 computed during quantization "
+                        "to <out_dir>/quant_error.csv")
+    p.add_argument("--export_format", type=str, default="fakequant", choices=EXPORT_FORMATS,
+                   help="fakequant: dequantized weights, qdq: DequantizeLinear+MatMul, "
+                        "matmulnbits: com.microsoft MatMulNBits (qdq/matmulnbits: int only)")
+    p.add_argument("--stream_quant", action="store_true",
+                   help="no model load per config: every MatMul/Gemm weight is read from the memory-mapped "
+                        "safetensors shards, quantized and written into a copy of the fp16 baseline graph "
+                        "(+ weight_q dump). The baseline is exported once per model from a full fp16 load. "
+                        "fakequant only, not fp8_e5m2 (fp32 graph: full export)")
+    p.add_argument("--patch_baseline", action="store_true",
+                   help="no re-export: copy the fp16 baseline graph (exported first if missing) and "
+                        "write only a new model.onnx.data with the quantized MatMul/Gemm weights "
+                        "(fakequant only, no weight_q dump)")
+    p.add_argument("--tensor_store", type=str, default=None,
+                   help="content-addressed tensor store, e.g. onnx_graph/.store: every distinct tensor "
+                        "is kept once and the export links it instead of writing a model.onnx.data")
+    p.add_argument("--resume", action="store_true",
+                   help="skip the export when onnx_graph/<model>/manifest.json records it with the same "
+                        "model revision, quant code and options and its files are unchanged")
     return p.parse_args()
 
+def load_causal_lm(model_name, torch_dtype=None):
+    return AutoModelForCausalLM.from_pretrained(
+        model_name,
+        torch_dtype=torch_dtype,
+        low_cpu_mem_usage=True,
+        device_map="cpu",
+        trust_remote_code =True,
+        attn_implementation = "eager"
+    )
+
+def quant_dir(model_dir, bits, dtype, groupsize, tag=""):
+    # onnx_graph/<model_slug>/{per-group,per-channel}/<dtype>/w_<bits>_gs_<size><tag>
+    gs = groupsize if groupsize is not None else -1
+    grouping = "per-group" if gs > 0 else "per-channel"
+    gs_name = str(gs) if gs > 0 else "none"
+    return os.path.join(model_dir, grouping, dtype, f"w_{bits}_gs_{gs_name}{tag}")
+
+def export_onnx(model, model_name, out_path, export_format="fakequant", tokenizer=None):
+    onnx_name = os.path.basename(out_path)
+    # dummy input (dynamic axes)
+    if tokenizer is None:
+        tokenizer = AutoTokenizer.from_pretrained(
+            model_name, use_fast=False, trust_remote_code=True   # use_fast ? pure python tokenizer : rust based tokenizer
+        )
+    dummy = tokenizer("Hello, world!", return_tensors="pt").input_ids
+
+    # ONNX export
+    torch.onnx.export(
+        model,
+        (dummy,),
+        out_path,
+        input_names=["input_ids"], 
+        output_names=["logits"],
+        dynamic_axes={"input_ids": {0:"batch",1:"seq_len"},
+                      "logits":    {0:"batch",1:"seq_len"}},
+        opset_version=17, # 20 for gold server
+        do_constant_folding=False,
+        custom_opsets={"com.microsoft": 1} if export_format == "matmulnbits" else None,
+        # TorchScript exporter: the qdq / matmulnbits symbolic() methods (lowbit_linear.py)
+        # are ignored by the dynamo exporter, the default of newer torch
+        dynamo=False
+    )
+    model_onnx = onnx.load(out_path)
+    # quantization metadata (weight_q / weight_scale / ...) rides along as unused initializers
+    present = {init.name for init in model_onnx.graph.initializer}
+    model_onnx.graph.initializer.extend(
+        numpy_helper.from_array(arr, name)
+        for name, arr in dump_initializers(model).items() if name not in present)
+    convert_model_to_external_data(
+        model_onnx,
+        all_tensors_to_one_file=True,
+        location=f"{onnx_name}.data",
+        size_threshold=1024
+    )
+
+    save_model(model_onnx, out_path)
+
+def store_export(out_path, store):
+    """ move an export into the tensor store (no-op without one) """
+    if store is None:
+        return
+    logical, added = dedup_onnx(out_path, store)
+    print(f"[Store] {out_path}: {logical / 2**20:.1f} MiB of tensors, {added / 2**20:.1f} MiB new in {store.root}")
+
+def ensure_baseline(model_dir, model_name, model=None, tokenizer=None):
+    """ fp16 baseline graph of model_dir, exported first if missing (model: already loaded fp16) """
+    base_path = os.path.join(model_dir, "fp16_baseline", "model.onnx")
+    if not os.path.exists(base_path):
+        print(f"[Export] fp16 baseline → {base_path}")
+        t0 = time.perf_counter()
+        os.makedirs(os.path.dirname(base_path), exist_ok=True)
+        base = model if model is not None else load_causal_lm(model_name, torch.float16).half()
+        base.eval()
+        export_onnx(base, model_name, base_path, tokenizer=tokenizer)
+        del base
+        SweepManifest.for_model(model_dir).record_export(
+            config_key(base_path, model_dir),
+            {"model": model_name, "bits": 16, "dtype": "fp16", "group_size": None, "export_format": "fakequant"},
+            export_inputs(model_name, 16, "fp16", None, mode="baseline"), base_path, time.perf_counter() - t0)
+    return base_path
+
 def main():
     args = parse_args()
     MODEL = args.model_name
@@ -48,42 +171,74 @@ def main():
         elif cfg["bits"] == 32 :
             out_dir = os.path.join(model_dir, "fp32_baseline")
     else:
-        # granularity 
-        gs = cfg["groupsize"] if cfg["groupsize"] is not None else -1
-        grouping = "per-group" if gs > 0 else "per-channel"
-        # group size
-        gs_name = str(gs) if gs > 0 else "none"
-        # datatype (ex: int4_asym, int4_sym, fp4 등)
-        dtype = cfg["dtype"]
-        bits  = cfg["bits"]
-        # directory: grouping / dtype / w_<bits>_gs_<gs_name>
-        out_dir = os.path.join(
-            model_dir,
-            grouping,
-            dtype,
-            f"w_{bits}_gs_{gs_name}"
-        )
+        # directory: grouping / dtype (ex: int4_asym, int4_sym, fp4 등) / w_<bits>_gs_<gs_name>
+        out_dir = quant_dir(model_dir, cfg["bits"], cfg["dtype"], cfg["groupsize"], clip_tag(args))
     os.makedirs(out_dir, exist_ok=True)
-    out_path = os.path.join(out_dir, "model.onnx")
+    # fake-quant graph keeps the model.onnx name, real low-bit graphs sit next to it
+    onnx_name = "model.onnx" if args.export_format == "fakequant" else f"model_{args.export_format}.onnx"
+    out_path = os.path.join(out_dir, onnx_name)
+
+    set_compute_dtype(args.quant_compute_dtype)
+    mem_budget = args.quant_mem_budget_mb * 2**20 if args.quant_mem_budget_mb else None
+    error_report = os.path.join(out_dir, "quant_error.csv") if args.error_report else None
+    store = TensorStore(args.tensor_store) if args.tensor_store else None
+    if args.quant_clip_grid > 0:
+        set_clip_search(clip_grid(args.quant_clip_grid, args.quant_clip_min),
+                        norm=args.quant_clip_norm, mem_budget=mem_budget)
+
+    # up-to-date check against the manifest (recorded whether or not --resume is given)
+    patch = args.patch_baseline and cfg["dtype"] is not None
+    stream = args.stream_quant and cfg["dtype"] is not None
+    mode = "baseline" if cfg["dtype"] is None else "patch" if patch else "stream" if stream else "full"
+    manifest = SweepManifest.for_model(model_dir, store)
+    key = config_key(out_path, model_dir)
+    config = {"model": MODEL, "bits": cfg["bits"], "dtype": cfg["dtype"] or cfg["name"] or "fp16",
+              "group_size": cfg["groupsize"], "export_format": args.export_format}
+    def inputs():
+        # revision looked up again after the export: the checkpoint may just have been downloaded
+        return export_inputs(MODEL, cfg["bits"], config["dtype"], cfg["groupsize"], args.export_format,
+                             mode, args.quant_compute_dtype,
+                             (args.quant_clip_grid, args.quant_clip_min, args.quant_clip_norm),
+                             error_report is not None)
+    if args.resume and manifest.export_done(key, inputs()):
+        print(f"[Skip] {out_path} is up to date")
+        if store is not None:   # exported before the store was used: moved in now
+            store_export(out_path, store)
+            manifest.relocate(key)
+        return
+    t0 = time.perf_counter()
+
+    # 3') patch / stream mode: quantized weights written into a copy of the fp16 baseline export,
+    #     read from the baseline itself (patch) or from the checkpoint shards (stream)
+    if patch or stream:
+        flag = "--patch_baseline" if patch else "--stream_quant"
+        if args.export_format != "fakequant" or (patch and args.stream_quant):
+            raise ValueError(f"{flag} only supports --export_format fakequant"
+                             + (" without --stream_quant" if patch else ""))
+        if cfg["dtype"] == "fp8_e5m2":
+            raise ValueError(f"fp8_e5m2 is exported in fp32, the fp16 baseline graph cannot be patched ({flag})")
+        base_path = ensure_baseline(model_dir, MODEL)
+        ckpt = CheckpointReader(MODEL) if stream else None
+        if stream and os.path.isdir(os.path.join(out_dir, "checkpoint")):
+            shutil.rmtree(os.path.join(out_dir, "checkpoint"))      # full-size HF checkpoint of older runs
+        out_path = patch_quantized_onnx(
+            base_path, out_dir, cfg["bits"], cfg["dtype"], cfg["groupsize"],
+            num_workers=args.quant_workers, max_inflight=args.quant_max_inflight,
+            mem_budget=mem_budget, error_report=error_report, store=store,
+            load_weight=ckpt and ckpt.weight, dump=stream)
+        if ckpt is not None and ckpt.misses:
+            print(f"[Warn] {ckpt.misses} weights not found in {ckpt.dir}, quantized from the baseline graph")
+        manifest.record_export(key, config, inputs(), out_path, time.perf_counter() - t0)
+        if store is not None:
+            manifest.relocate(config_key(base_path, model_dir))   # baseline moved into the store
+        print(f"[Export] {cfg['dtype']} ({'patched' if patch else 'streamed'}) → {out_path}")
+        return
 
     # 3) model load
     if cfg["name"] == "fp16":
-        model = AutoModelForCausalLM.from_pretrained(
-            MODEL,
-            torch_dtype=torch.float16,
-            low_cpu_mem_usage=True,
-            device_map="cpu",
-            trust_remote_code =True,
-            attn_implementation = "eager"
-        )
+        model = load_causal_lm(MODEL, torch.float16)
     else:
-        model = AutoModelForCausalLM.from_pretrained(
-            MODEL,
-            low_cpu_mem_usage=True,
-            device_map="cpu",
-            trust_remote_code =True,
-            attn_implementation = "eager"
-        )
+        model = load_causal_lm(MODEL)
     if cfg["dtype"] == "fp8_e5m2":   # overflow issue is occured if fp8_e5m2 is casted to fp16
         model = model.float()
     else:
@@ -91,39 +246,18 @@ def main():
     
     # 4) quantization
     if cfg["dtype"] is not None:
-        quant_model(model, cfg["bits"], cfg["dtype"], cfg["groupsize"])
+        quant_model(model, cfg["bits"], cfg["dtype"], cfg["groupsize"],
+                    num_workers=args.quant_workers, max_inflight=args.quant_max_inflight,
+                    export_format=args.export_format, mem_budget=mem_budget,
+                    error_report=error_report)
     
     # model = model.float() 
     model.eval()
 
-    # 5) dummy input (dynamic axes)
-    tokenizer = AutoTokenizer.from_pretrained(
-        MODEL, use_fast=False, trust_remote_code=True   # use_fast ? pure python tokenizer : rust based tokenizer
-    )
-    dummy = tokenizer("Hello, world!", return_tensors="pt").input_ids
-
-    # 6) ONNX export
-    out_path = os.path.join(out_dir, "model.onnx")
-    torch.onnx.export(
-        model,
-        (dummy,),
-        out_path,
-        input_names=["input_ids"], 
-        output_names=["logits"],
-        dynamic_axes={"input_ids": {0:"batch",1:"seq_len"},
-                      "logits":    {0:"batch",1:"seq_len"}},
-        opset_version=17, # 20 for gold server
-        do_constant_folding=False
-    )
-    model_onnx = onnx.load(out_path)
-    convert_model_to_external_data(
-        model_onnx,
-        all_tensors_to_one_file=True,
-        location="model.onnx.data",
-        size_threshold=1024
-    )
-
-    save_model(model_onnx, out_path)
+    # 5), 6) ONNX export
+    export_onnx(model, MODEL, out_path, args.export_format)
+    store_export(out_path, store)
+    manifest.record_export(key, config, inputs(), out_path, time.perf_counter() - t0)
     if "bits" == 16:
         selected_dtype ="name"
     else:
@@ -23,6 +23,12 @@ declare -a wq_bit_list=(5)
 # group size: per-group(128), per-channel(-1)
 declare -a wq_groupsize_list=(128 -1)
 
+# extra export options, e.g. (--patch_baseline): export the fp16 baseline once and only
+# rewrite model.onnx.data per config (fakequant, no weight_q dump, not for fp8_e5m2),
+# (--tensor_store onnx_graph/.store): keep every distinct tensor once, configs link into it
+# --resume: configs recorded as up to date in onnx_graph/<model>/manifest.json are skipped
+declare -a export_args=(--resume)
+
 for model in "${model_list[@]}"; do
 
   # ─── Baseline ─────────────────────────────
@@ -61,7 +67,8 @@ for model in "${model_list[@]}"; do
           --model_name "${model}" \
           --wq_bits ${wq_bit} \
           --wq_datatype "${dtype}" \
-          --wq_groupsize ${gs}
+          --wq_groupsize ${gs} \
+          ${export_args[@]+"${export_args[@]}"}
       done
     done
   done
@@ -1,45 +1,24 @@
 # onnx_analysis.py
-import onnx, numpy as np, os
+import numpy as np, os
 import torch
-from onnx import TensorProto
 from quant_utils.quant_weight import quant_int, quant_int_asym, quant_datatype
+from quant_utils.bitpack import unpack_codes
+from quant_utils.onnx_reader import OnnxReader
+from quant_utils.graph_index import load_index
 
 def analyze_quant_initializers(model_path: str):
     print(f"\n=== Analyzing initializers in {model_path} ===\n")
-    model = onnx.load(model_path)
-    initializer_map = {init.name: init for init in model.graph.initializer}
+    # graph only, tensor values are memory-mapped from the external data file on demand
+    reader = OnnxReader(model_path)
+    model = reader.model
+    initializer_map = reader.inits
 
-    # 1) MatMul/Gemm node
-    matmul_nodes = [n for n in model.graph.node if n.op_type in ("MatMul", "Gemm")]
+    # 1), 2) MatMul/Gemm weight initializers (graph index, cached next to the model)
+    index = load_index(model_path, model)
+    compute_weights = set(index)
+    # [out, in] of every layer, also for exporter-renamed weights (onnx::MatMul_*)
+    layer_dims = {e.layer: list(e.shape)[::-1] if e.transposed else list(e.shape) for e in index.values()}
 
-    # transpose output -> node lookup table
-    output_to_node = {}
-    for n in model.graph.node:
-        for out_name in n.output:
-            output_to_node[out_name] = n 
-    
-    
-    # 2) weight initializer tracking
-    compute_weights = set()
-    for n in matmul_nodes:
-        if len(n.input) < 2:
-            continue
-        inp = n.input[1]
-        
-        # case A) GeMM : input B is used as a weight initializer
-        if inp in initializer_map:
-            compute_weights.add(inp)
-            continue
-        
-        # case B) MatMul: input B is used as a "Transpose" node's output, 
-        #                 "Transpose" node gets weight initializer as an input and returns that output
-        tn = output_to_node.get(inp)
-        if tn is not None and tn.op_type == "Transpose":
-            # Check if the "Transpose" node's input is weight initializer
-            w_name = tn.input[0]
-            if w_name in initializer_map:
-                compute_weights.add(w_name)
-                
     # 3) weight / bias / weight_q 
     weight_inits = [init for init in model.graph.initializer
                     if any(k in init.name.lower() for k in ("weight", "bias", "weight_q", "weight_scale", "weight_zp"))]
@@ -55,35 +34,39 @@ def analyze_quant_initializers(model_path: str):
             gs = None if gs_s == "none" else int(gs_s)
             break
 
-    # 5) onnx dtype → numpy dtype
-    dtype_map = {TensorProto.FLOAT  : np.float32,
-                 TensorProto.FLOAT16: np.float16,
-                 TensorProto.DOUBLE : np.float64,
-                 TensorProto.UINT8  : np.uint8,
-                 TensorProto.INT8   : np.int8,
-                 TensorProto.INT32  : np.int32,
-                 TensorProto.INT64  : np.int64}
-
-    # 6) initializer loop
+    # 5) initializer loop
     for init in weight_inits:
         name, is_compute, dims      = init.name, init.name in compute_weights, list(init.dims)
-        np_dtype, raw               = dtype_map.get(init.data_type), init.raw_data
+        np_dtype                    = reader.dtype(name)
 
         print(f"--- Initializer: {name} ---")
         print(f"Used in MatMul/Gemm? {'YES' if is_compute else 'no'}")
         print(f"Shape         : {dims}")
         print(f"DataType enum : {init.data_type}")
 
-        if not raw or np_dtype is None:
+        if np_dtype is None:
             print("!! Cannot parse raw_data.\n"); continue
 
-        arr       = np.frombuffer(raw, dtype=np_dtype).reshape(dims)
+        arr       = reader.get(name)
         print(f"Raw elements  : {arr.size} (expected {int(np.prod(dims))})")
 
         # ─────────────────────────────────────────────────────────────
         #  (A) quantized tensor (weight_q) 
         # ─────────────────────────────────────────────────────────────      
         if name.endswith('.weight_q'):
+            # packed bitstream (quant_utils.bitpack) -> unsigned codes, reshaped by the matching weight
+            w_init = initializer_map.get(name[:-2])
+            kc = layer_dims.get(name[:-len(".weight_q")]) or (w_init is not None and list(w_init.dims))
+            if arr.ndim == 1 and bits is not None and kc:
+                K, C = kc
+                arr = unpack_codes(torch.from_numpy(arr.copy()), bits, K * C).numpy()
+                arr = arr.reshape(K, C // gs, gs) if gs else arr.reshape(K, C)
+                # pack indices -> q values: codebook entries (FP), signed codes (sym INT)
+                codebook = initializer_map.get(name[:-2] + "_codebook")
+                if codebook is not None:
+                    arr = reader.get(codebook.name)[arr]
+                elif name[:-2] + "_zp" not in initializer_map:
+                    arr = arr.astype(np.int16) - 2 ** (bits - 1)
             # arr may be either [K, C] (per-channel) or [K, G, S] (per-group)
             if arr.ndim == 3:
                 K, G, S = arr.shape
@@ -92,7 +75,7 @@ def analyze_quant_initializers(model_path: str):
                         sample = arr[ch, g, :32].tolist()
                         print(f"Ch{ch:4d} Gr{g:4d}: q_vals={sample}…")
                     print()                    
-            else:
+            elif arr.ndim == 2:
                 K, C = arr.shape
                 for ch in range(min(K, 16)):
                     sample = arr[ch, :32].tolist()
@@ -100,7 +83,7 @@ def analyze_quant_initializers(model_path: str):
                     if ch == 16:
                         break
 
-            print(f"Min / Max      : {arr.min():.0f} / {arr.max():.0f}\n")
+            print(f"Min / Max      : {arr.min():g} / {arr.max():g}\n")
 
         if name.endswith('weight_scale') or name.endswith('weight_zp'):
             if arr.ndim == 1:   # per-channel
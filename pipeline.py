@@ -0,0 +1,173 @@
+# pipeline.py
+# export → eval → analysis of many configs as parallel subprocesses:
+# every job is export_and_quant.py / eval.py / quant_error_multi_weight.py with --resume
+# (manifest.json), admitted under a node memory budget from its estimated peak memory.
+
+import os, sys, json, glob, math, struct, argparse
+from quant_utils.job_scheduler import Job, Scheduler, mem_available, GiB
+from quant_utils.onnx_reader import OnnxReader
+from quant_utils.sweep_manifest import hf_snapshot_dir, clip_tag
+from sweep import sweep_configs
+from export_and_quant import quant_dir
+
+# peak memory model, in copies of the weights (bytes = params * bytes/param * copies)
+LOAD_BYTES = 4          # load_causal_lm() without torch_dtype materializes fp32
+EXPORT_COPIES = 4       # module + torch.onnx.export proto + onnx.load + external-data conversion
+PATCH_COPIES = 0.5      # memory-mapped fp16 baseline, one layer at a time
+EVAL_COPIES = 2         # ORT initializers + prepacked MatMul weights
+ANALYSIS_COPIES = 1     # two mapped graphs, touched layer by layer
+LOGIT_COPIES = 6        # (1, seqlen, vocab) fp32 logits + batch_nll_and_count temporaries
+OVERHEAD = 1 * GiB      # interpreter, torch / ORT runtime
+ST_BYTES = {"F64": 8, "F32": 4, "I64": 8, "I32": 4, "F16": 2, "BF16": 2, "I16": 2, "I8": 1, "U8": 1, "BOOL": 1}
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="Run export / eval / analysis jobs in parallel under a memory budget."
+    )
+    p.add_argument("--model_names", type=str, nargs="+", required=True)
+    p.add_argument("--wq_bits", type=int, nargs="+", default=[4])
+    p.add_argument("--wq_datatypes", type=str, nargs="+", default=None,
+                   help="datatypes to run (default: every datatype of each bit width, see sweep.DATATYPES)")
+    p.add_argument("--wq_groupsizes", type=int, nargs="+", default=[128, -1])
+    p.add_argument("--dataset", type=str, default="wikitext-2-raw-v1")
+    p.add_argument("--no_eval", action="store_true", help="export only")
+    p.add_argument("--eval_baseline", action="store_true")
+    p.add_argument("--analysis", action="store_true",
+                   help="per-weight MSE / P99 and |error| quantiles against the fp16 baseline (fakequant)")
+    p.add_argument("--export_format", type=str, default="fakequant", choices=["fakequant", "qdq", "matmulnbits"])
+    p.add_argument("--patch_baseline", action="store_true",
+                   help="fakequant configs patched into the fp16 baseline export (not fp8_e5m2)")
+    p.add_argument("--tensor_store", type=str, default=None)
+    p.add_argument("--quant_compute_dtype", type=str, default="fp16", choices=["fp16", "fp32"])
+    p.add_argument("--quant_clip_grid", type=int, default=0)
+    p.add_argument("--quant_clip_min", type=float, default=0.5)
+    p.add_argument("--quant_clip_norm", type=float, default=2.0)
+    p.add_argument("--mem_budget_gb", type=float, default=None,
+                   help="memory for all running jobs (default: 90%% of MemAvailable)")
+    p.add_argument("--mem_scale", type=float, default=1.0,
+                   help="multiplier of every estimate (compare peak / est in the summary)")
+    p.add_argument("--params_b", type=float, default=None,
+                   help="parameter count in billions for models neither exported nor in the HF cache")
+    p.add_argument("--cores", type=int, default=None, help="cores to split between jobs (default: all)")
+    p.add_argument("--max_parallel", type=int, default=None, help="max concurrent jobs (default: cores)")
+    p.add_argument("--log_dir", type=str, default="logs")
+    return p.parse_args()
+
+def model_size(model_name, model_dir, params_b=None):
+    """
+        (parameters, vocab size) without loading the model: fp16 baseline export,
+        else safetensors headers / .bin sizes of the local checkpoint, else params_b
+    """
+    vocab = 50272
+    snapshot = hf_snapshot_dir(model_name)
+    if snapshot and os.path.exists(os.path.join(snapshot, "config.json")):
+        with open(os.path.join(snapshot, "config.json")) as f:
+            vocab = json.load(f).get("vocab_size", vocab)
+
+    base = os.path.join(model_dir, "fp16_baseline", "model.onnx")
+    if os.path.exists(base):
+        with OnnxReader(base) as r:
+            return sum(math.prod(r.shape(n)) for n in r), vocab
+    if snapshot:
+        params = 0
+        for path in glob.glob(os.path.join(snapshot, "*.safetensors")):
+            with open(path, "rb") as f:
+                header = json.loads(f.read(struct.unpack("<Q", f.read(8))[0]))
+            for name, t in header.items():
+                if name != "__metadata__":
+                    start, end = t["data_offsets"]
+                    params += (end - start) // ST_BYTES.get(t["dtype"], 2)
+        if params == 0:     # pickled checkpoint, fp16 assumed
+            params = sum(os.path.getsize(p) for p in glob.glob(os.path.join(snapshot, "*.bin"))) // 2
+        if params:
+            return params, vocab
+    if params_b is None:
+        raise SystemExit(f"size of {model_name} unknown (not exported, not in the HF cache): pass --params_b")
+    return int(params_b * 1e9), vocab
+
+def estimates(params, vocab, seqlen=1024):
+    """ estimated peak bytes per job kind; fp8_e5m2 runs in float32 """
+    def export(dtype, patch=False):
+        if patch:
+            return params * 2 * PATCH_COPIES + OVERHEAD
+        elem = 4 if dtype == "fp8_e5m2" else 2
+        return max(params * LOAD_BYTES, params * elem * EXPORT_COPIES) + OVERHEAD
+    def evaluate(dtype):
+        elem = 4 if dtype == "fp8_e5m2" else 2
+        return params * elem * EVAL_COPIES + LOGIT_COPIES * seqlen * vocab * 4 + OVERHEAD
+    def analysis():
+        return params * 2 * ANALYSIS_COPIES + OVERHEAD
+    return export, evaluate, analysis
+
+def config_args(args, model_name, bits, dtype, gs):
+    a = ["--model_name", model_name, "--wq_bits", str(bits), "--wq_datatype", dtype, "--wq_groupsize", str(gs),
+         "--export_format", args.export_format]
+    if args.quant_clip_grid > 0:
+        a += ["--quant_clip_grid", str(args.quant_clip_grid), "--quant_clip_min", str(args.quant_clip_min),
+              "--quant_clip_norm", str(args.quant_clip_norm)]
+    return a
+
+def build_jobs(args):
+    py = sys.executable
+    store = ["--tensor_store", args.tensor_store] if args.tensor_store else []
+    jobs = []
+    for MODEL in args.model_names:
+        slug = MODEL.replace("/", "__")
+        model_dir = os.path.join("onnx_graph", slug)
+        params, vocab = model_size(MODEL, model_dir, args.params_b)
+        export_mem, eval_mem, analysis_mem = estimates(params, vocab)
+        scale = lambda b: int(b * args.mem_scale)
+        print(f"[Plan] {MODEL}: {params / 1e9:.2f} B params, vocab {vocab}")
+
+        base = None
+        if args.patch_baseline or args.analysis or args.eval_baseline:
+            base = Job(f"{slug}/fp16_baseline/export", "export",
+                       [py, "export_and_quant.py", "--model_name", MODEL, "--resume"] + store,
+                       scale(export_mem("fp16")))
+            jobs.append(base)
+            if args.eval_baseline and not args.no_eval:
+                jobs.append(Job(f"{slug}/fp16_baseline/eval", "eval",
+                                [py, "eval.py", "--model_name", MODEL, "--dataset", args.dataset, "--resume"],
+                                scale(eval_mem("fp16")), deps=[base], thread_arg="--ort_threads"))
+
+        for bits, dtype, gs in sweep_configs(args):
+            cfg = os.path.relpath(quant_dir(model_dir, bits, dtype, gs, clip_tag(args)), "onnx_graph")
+            cargs = config_args(args, MODEL, bits, dtype, gs)
+            patch = args.patch_baseline and args.export_format == "fakequant" and dtype != "fp8_e5m2"
+            export = Job(f"{cfg}/export", "export",
+                         [py, "export_and_quant.py"] + cargs + ["--resume",
+                          "--quant_compute_dtype", args.quant_compute_dtype]
+                         + (["--patch_baseline"] if patch else []) + store,
+                         scale(export_mem(dtype, patch)), deps=[base] if patch else [])
+            jobs.append(export)
+            if not args.no_eval:
+                jobs.append(Job(f"{cfg}/eval", "eval",
+                                [py, "eval.py"] + cargs + ["--dataset", args.dataset, "--resume"],
+                                scale(eval_mem(dtype)), deps=[export], thread_arg="--ort_threads"))
+            if args.analysis and args.export_format == "fakequant":
+                out_dir = os.path.join("onnx_graph", cfg)
+                jobs.append(Job(f"{cfg}/analysis", "analysis",
+                                [py, os.path.join("MSE&P99", "quant_error_multi_weight.py"),
+                                 "--baseline_dir", os.path.join(model_dir, "fp16_baseline"),
+                                 "--quant_dir", out_dir,
+                                 "--output_csv", os.path.join(out_dir, "weight_error.csv"),
+                                 "--quantile_csv", os.path.join(out_dir, "weight_error_quantiles.csv")],
+                                scale(analysis_mem()), deps=[base, export], thread_arg="--num_workers"))
+    return jobs
+
+def main():
+    args = parse_args()
+    avail = mem_available()
+    if args.mem_budget_gb:
+        budget = int(args.mem_budget_gb * GiB)
+    elif avail:
+        budget = int(avail * 0.9)
+    else:
+        raise SystemExit("MemAvailable unknown: pass --mem_budget_gb")
+    jobs = build_jobs(args)
+    print(f"[Plan] {len(jobs)} jobs, memory budget {budget / GiB:.1f} GiB")
+    ok = Scheduler(jobs, budget, cores=args.cores, max_parallel=args.max_parallel, log_dir=args.log_dir).run()
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
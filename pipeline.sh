@@ -0,0 +1,17 @@
+#!/bin/bash
+set -euo pipefail
+
+# data save directory 
+export HF_HOME="results_quant"
+
+# export → eval → analysis jobs in parallel under the node memory budget
+# (default 90% of MemAvailable); job logs in logs/, finished configs skipped via manifest.json
+python pipeline.py \
+  --model_names "facebook/opt-1.3b" "microsoft/phi-2" \
+  --wq_bits 4 8 \
+  --wq_groupsizes 128 -1 \
+  --dataset "wikitext-2-raw-v1" \
+  --eval_baseline \
+  --patch_baseline \
+  --analysis \
+  --log_dir "logs"
@@ -1,74 +1,37 @@
 import os, gc
-import onnx
 import numpy as np
 import matplotlib.pyplot as plt
-from onnx import TensorProto
+from quant_utils.onnx_reader import OnnxReader
+from quant_utils.graph_index import load_index
 
 # —————————————— 설정 ——————————————
 BASELINE_ONNX = "onnx_graph/facebook__opt-1.3b/fp16_baseline/model.onnx"
-DTYPE_MAP = {
-    TensorProto.FLOAT:   np.float32,
-    TensorProto.FLOAT16: np.float16,
-    TensorProto.DOUBLE:  np.float64,
-    TensorProto.UINT8:   np.uint8,
-    TensorProto.INT8:    np.int8,
-    TensorProto.INT32:   np.int32,
-    TensorProto.INT64:   np.int64,
-}
 BINS       = 200
 CHUNK_SIZE = 500_000
 
-def load_model_and_inits(path):
-    model = onnx.load(path)
-    inits = {init.name: init for init in model.graph.initializer}
-    return model, inits
-
-def find_compute_weights(model, inits):
-    init_map = set(inits)
-    nodes = [n for n in model.graph.node if n.op_type in ("MatMul","Gemm")]
-    out2node = {out: n for n in model.graph.node for out in n.output}
-    W = set()
-    for n in nodes:
-        if len(n.input)<2: continue
-        inp = n.input[1]
-        if inp in init_map:
-            W.add(inp)
-        else:
-            tn = out2node.get(inp)
-            if tn and tn.op_type=="Transpose" and tn.input[0] in init_map:
-                W.add(tn.input[0])
-    return sorted(W)
-
 def main():
     # 1) load
-    model, inits = load_model_and_inits(BASELINE_ONNX)
-    compute_ws   = find_compute_weights(model, inits)
+    # MatMul/Gemm weights from the cached graph index, values memory-mapped
+    index        = load_index(BASELINE_ONNX)
+    inits        = OnnxReader(BASELINE_ONNX, index)
+    compute_ws   = sorted(index)
 
     # 2) 각 weight 수(원소) 구하고 offsets 계산
-    lengths = [int(np.prod(inits[name].dims)) for name in compute_ws]
+    lengths = [int(np.prod(inits.shape(name))) for name in compute_ws]
     offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
 
     # ──────────── 두-패스 히스토그램 계산 ────────────
     # 2.1) global min/max
     gmin, gmax = np.inf, -np.inf
     for name in compute_ws:
-        init     = inits[name]
-        dtype    = DTYPE_MAP[init.data_type]
-        raw_buf  = init.raw_data
-        N        = int(np.prod(init.dims))
+        flat     = inits.get(name).reshape(-1)
+        N        = flat.size
         step     = CHUNK_SIZE
-        itemsize = np.dtype(dtype).itemsize
 
         pos = 0
         while pos < N:
             L = min(step, N-pos)
-            arr = (
-                np.frombuffer(raw_buf,
-                             dtype=dtype,
-                             count=L,
-                             offset=pos*itemsize)
-                .astype(np.float32)
-            )
+            arr = flat[pos:pos+L].astype(np.float32)
             gmin, gmax = min(gmin, arr.min()), max(gmax, arr.max())
             pos += L
             del arr
@@ -78,23 +41,14 @@ def main():
     counts    = np.zeros(BINS, dtype=np.int64)
 
     for name in compute_ws:
-        init     = inits[name]
-        dtype    = DTYPE_MAP[init.data_type]
-        raw_buf  = init.raw_data
-        N        = int(np.prod(init.dims))
+        flat     = inits.get(name).reshape(-1)
+        N        = flat.size
         step     = CHUNK_SIZE
-        itemsize = np.dtype(dtype).itemsize
 
         pos = 0
         while pos < N:
             L = min(step, N-pos)
-            arr = (
-                np.frombuffer(raw_buf,
-                             dtype=dtype,
-                             count=L,
-                             offset=pos*itemsize)
-                .astype(np.float32)
-            )
+            arr = flat[pos:pos+L].astype(np.float32)
             ct, _ = np.histogram(arr, bins=bin_edges)
             counts += ct
             pos += L
@@ -105,12 +59,9 @@ def main():
     # ──────────── scatter plot ────────────
     plt.figure(figsize=(12,4))
     for idx, name in enumerate(compute_ws):
-        init     = inits[name]
-        dtype    = DTYPE_MAP[init.data_type]
-        raw_buf  = init.raw_data
-        N        = int(np.prod(init.dims))
+        flat     = inits.get(name).reshape(-1)
+        N        = flat.size
         step     = CHUNK_SIZE
-        itemsize = np.dtype(dtype).itemsize
         
 
         print(f"[{idx+1}/{len(compute_ws)}] Plotting {name} ({N} elems)")
@@ -118,13 +69,7 @@ def main():
         pos = 0
         while pos < N:
             L = min(step, N-pos)
-            arr = (
-                np.frombuffer(raw_buf,
-                             dtype=dtype,
-                             count=L,
-                             offset=pos*itemsize)
-                .astype(np.float32)
-            )
+            arr = flat[pos:pos+L].astype(np.float32)
 
             # density→alpha
             raw_idx    = np.clip(np.digitize(arr, bin_edges)-1, 0, BINS-1)
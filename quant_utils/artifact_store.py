@@ -0,0 +1,132 @@
+import os, shutil, hashlib
+import numpy as np
+import onnx
+from onnx import TensorProto
+from quant_utils.onnx_reader import OnnxReader
+
+# =======================================================================
+#  Content-addressed tensor store for exported ONNX models
+#
+#  every quantized config used to carry a full model.onnx.data although only
+#  the MatMul/Gemm weights differ. Here each external tensor is stored once
+#  under its sha256 (<store>/objects/ab/<sha256>.bin) and a config only holds
+#    <dir>/model.onnx                         graph, one external file per tensor
+#    <dir>/model.onnx.tensors/<sha256>.bin    hard links into the store
+#  -> disk use and page cache grow with the number of distinct tensors.
+#  (hard links need the store on the same filesystem, else files are copied)
+#  onnxruntime and OnnxReader read such a graph as is; onnx.load() with external
+#  data / onnx.checker refuse multiply-linked files (hardlink guard), load the
+#  graph with load_external_data=False instead
+# =======================================================================
+
+TENSORS_SUFFIX = ".tensors"
+
+
+class TensorStore:
+    def __init__(self, root: str):
+        self.root = root
+        self.bytes_written = 0      # new objects written through this instance
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.root, "objects", digest[:2], f"{digest}.bin")
+
+    def put(self, arr: np.ndarray) -> str:
+        """ store the raw bytes of arr once, return their sha256 (dtype / shape live in the graph) """
+        buf = memoryview(np.ascontiguousarray(arr)).cast("B")
+        digest = hashlib.sha256(buf).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(buf)
+            os.replace(tmp, path)
+            self.bytes_written += buf.nbytes
+        return digest
+
+    def link(self, digest: str, dst: str):
+        """ dst -> stored object (hard link, copy across filesystems) """
+        if os.path.exists(dst):
+            return
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        try:
+            os.link(self.object_path(digest), dst)
+        except OSError:
+            shutil.copyfile(self.object_path(digest), dst)
+
+    def usage(self):
+        """ (number of stored tensors, bytes) """
+        n, total = 0, 0
+        for d, _, files in os.walk(os.path.join(self.root, "objects")):
+            for f in files:
+                if f.endswith(".bin"):
+                    n += 1
+                    total += os.path.getsize(os.path.join(d, f))
+        return n, total
+
+
+def tensors_dir(onnx_path: str) -> str:
+    # relative to the graph: external data locations must stay inside the model directory
+    return os.path.basename(onnx_path) + TENSORS_SUFFIX
+
+
+def _set_external(init: TensorProto, location: str, length: int, offset: int = 0):
+    del init.external_data[:]
+    for k, v in (("location", location), ("offset", str(offset)), ("length", str(length))):
+        entry = init.external_data.add()
+        entry.key, entry.value = k, v
+    init.data_location = TensorProto.EXTERNAL
+
+
+def _save_graph(model: onnx.ModelProto, onnx_path: str):
+    # tensors carry no raw_data: only the graph is written
+    tmp = onnx_path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(model.SerializeToString())
+    os.replace(tmp, onnx_path)
+
+
+def is_deduped(reader: OnnxReader) -> bool:
+    prefix = tensors_dir(reader.path) + "/"
+    locs = [e.value for init in reader.model.graph.initializer
+            if init.data_location == TensorProto.EXTERNAL
+            for e in init.external_data if e.key == "location"]
+    return bool(locs) and all(loc.startswith(prefix) for loc in locs)
+
+
+def stored_digest(init: TensorProto) -> str:
+    """ sha256 of a deduplicated initializer (its file name) """
+    loc = next(e.value for e in init.external_data if e.key == "location")
+    return os.path.basename(loc)[:-len(".bin")]
+
+
+def dedup_onnx(onnx_path: str, store: TensorStore):
+    """
+        Move every external tensor of onnx_path into store and rewrite the graph to
+        per-tensor files linked from it; the old .data file(s) are removed.
+        return (bytes of external tensors, bytes newly added to the store)
+    """
+    reader = OnnxReader(onnx_path)
+    if is_deduped(reader):
+        return 0, 0
+    model, tdir = reader.model, tensors_dir(onnx_path)
+    old_locs, logical, written = set(), 0, store.bytes_written
+    for init in model.graph.initializer:
+        if init.data_location != TensorProto.EXTERNAL:
+            continue
+        old_locs.update(e.value for e in init.external_data if e.key == "location")
+        arr = reader.get(init.name)
+        digest = store.put(arr)
+        logical += arr.nbytes
+        store.link(digest, os.path.join(reader.base_dir, tdir, f"{digest}.bin"))
+        _set_external(init, f"{tdir}/{digest}.bin", arr.nbytes)
+        del arr
+    reader.close()
+    _save_graph(model, onnx_path)
+    for loc in old_locs:
+        try:
+            os.remove(os.path.join(reader.base_dir, loc))
+        except FileNotFoundError:
+            pass
+    return logical, store.bytes_written - written
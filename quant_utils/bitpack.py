@@ -0,0 +1,78 @@
+import torch
+import torch.nn.functional as F
+
+# =======================================================================
+#  Dense bit packing of low-bit codes (uint8 bitstream)
+#
+#  layout: little-endian bitstream, element i occupies bits [i*b, (i+1)*b)
+#    8-bit : stored as is
+#    4-bit : nibble packing, low nibble = even element
+#    else  : every 8 codes -> b bytes
+# =======================================================================
+
+_CHUNK_BLOCKS = 1 << 18     # 8-code blocks handled per step, bounds the int64 temporaries
+
+
+def packed_nbytes(numel: int, bits: int) -> int:
+    return (numel * bits + 7) // 8 if bits in (4, 8) else -(-numel // 8) * bits
+
+
+@torch.no_grad()
+def pack_codes(codes: torch.Tensor, bits: int) -> torch.Tensor:
+    """
+        codes: unsigned integer codes in [0, 2**bits-1], any shape (flattened row-major)
+        return: 1-D uint8 tensor of packed_nbytes(codes.numel(), bits) bytes
+    """
+    if not 1 <= bits <= 8:
+        raise ValueError(f"Currently only support 1- to 8-bit packing, not {bits}-bit")
+    flat = codes.reshape(-1)
+    if bits == 8:
+        return flat.to(torch.uint8)
+
+    if bits == 4:
+        flat = flat.to(torch.uint8)
+        if flat.numel() % 2:
+            flat = F.pad(flat, (0, 1))
+        pairs = flat.view(-1, 2)
+        return pairs[:, 0] | (pairs[:, 1] << 4)
+
+    n = flat.numel()
+    n_blocks = -(-n // 8)
+    out = torch.empty(n_blocks * bits, dtype=torch.uint8, device=flat.device)
+    code_shift = torch.arange(8, device=flat.device, dtype=torch.int64) * bits
+    byte_shift = torch.arange(bits, device=flat.device, dtype=torch.int64) * 8
+    for b0 in range(0, n_blocks, _CHUNK_BLOCKS):
+        b1 = min(b0 + _CHUNK_BLOCKS, n_blocks)
+        blk = flat[b0 * 8:b1 * 8].to(torch.int64)
+        if blk.numel() < (b1 - b0) * 8:
+            blk = F.pad(blk, (0, (b1 - b0) * 8 - blk.numel()))
+        word = (blk.view(-1, 8) << code_shift).sum(dim=1)       # fields are disjoint: sum == or
+        out[b0 * bits:b1 * bits] = ((word.unsqueeze(1) >> byte_shift) & 0xFF).reshape(-1).to(torch.uint8)
+    return out
+
+
+@torch.no_grad()
+def unpack_codes(packed: torch.Tensor, bits: int, numel: int) -> torch.Tensor:
+    """
+        Inverse of pack_codes. return: 1-D uint8 tensor of numel codes
+    """
+    if not 1 <= bits <= 8:
+        raise ValueError(f"Currently only support 1- to 8-bit packing, not {bits}-bit")
+    packed = packed.reshape(-1).to(torch.uint8)
+    if bits == 8:
+        return packed[:numel]
+
+    if bits == 4:
+        return torch.stack([packed & 0xF, packed >> 4], dim=1).reshape(-1)[:numel]
+
+    n_blocks = packed.numel() // bits
+    out = torch.empty(n_blocks * 8, dtype=torch.uint8, device=packed.device)
+    code_shift = torch.arange(8, device=packed.device, dtype=torch.int64) * bits
+    byte_shift = torch.arange(bits, device=packed.device, dtype=torch.int64) * 8
+    mask = (1 << bits) - 1
+    for b0 in range(0, n_blocks, _CHUNK_BLOCKS):
+        b1 = min(b0 + _CHUNK_BLOCKS, n_blocks)
+        byt = packed[b0 * bits:b1 * bits].to(torch.int64).view(-1, bits)
+        word = (byt << byte_shift).sum(dim=1)
+        out[b0 * 8:b1 * 8] = ((word.unsqueeze(1) >> code_shift) & mask).reshape(-1).to(torch.uint8)
+    return out[:numel]
@@ -0,0 +1,189 @@
+import os, re, csv
+import torch
+from typing import Optional
+from quant_utils.onnx_reader import OnnxReader
+from quant_utils.graph_index import load_index
+from quant_utils.quant_weight import quantize_weight_multi, _map_layers
+from quant_utils.quant_error import percentile
+from quant_utils.error_sketch import ErrorSketch, quantile_row, QUANTILE_FIELDS
+
+# =======================================================================
+#  In-memory quantization error analysis from the fp16 baseline ONNX
+#
+#  baseline MatMul/Gemm weights are read once and re-quantized in memory
+#  for every config (quantize_weight_multi, shared group statistics), then
+#  the statistics of the MSE&P99 / elwise_error scripts are computed on the
+#  weights as stored in the ONNX file and written to the same CSV layouts:
+#    multi  : quant_error_multi_weight.py, one <dtype>_<grouping>_errors.csv per config
+#             (per-vector MSE over input columns / column blocks)
+#    single : plot.py / quant_error_single_weight.py, one row per config for one tensor
+#             (per-vector MSE over rows / (row, group))
+#    elwise : onnx_error_cli.py statistics (|error| sum, max, P99) per tensor and config
+#    model  : whole-model |error| P50 / P99 / P99.9 per config (merged per-weight sketches)
+# =======================================================================
+
+MULTI_FIELDS  = ["initializer", "datatype", "granularity", "bits", "mse_tensor", "mse_rep", "mse_p99"]
+SINGLE_FIELDS = ["datatype", "granularity", "bits", "num_channels", "groups_per_channel",
+                 "mse_tensor", "mse_rep", "mse_p99"]
+ELWISE_FIELDS = ["initializer", "datatype", "granularity", "bits",
+                 "abs_err_sum", "abs_err_max", "abs_err_p99"]
+MODEL_FIELDS  = ["datatype", "granularity", "bits"] + QUANTILE_FIELDS[1:]
+
+
+def parse_config(spec: str):
+    """
+        "int4_asym:128" -> (4, "int4_asym", 128), "fp4:-1" -> (4, "fp4", -1)
+        bits: first number of the datatype (as in quant_error_multi_weight.sh) unless given as
+        "<dtype>:<gs>:<bits>". gs "none" -> None (per-channel), -1 -> per-tensor like export_and_quant.sh
+    """
+    parts = spec.split(":")
+    dtype = parts[0]
+    gs = parts[1] if len(parts) > 1 else "none"
+    gs = None if gs == "none" else int(gs)
+    if len(parts) > 2:
+        bits = int(parts[2])
+    else:
+        m = re.search(r"\d+", dtype)
+        if m is None:
+            raise ValueError(f"cannot infer bit width of {dtype}, use <dtype>:<gs>:<bits>")
+        bits = int(m.group())
+    return bits, dtype, gs
+
+
+def grouping_of(group_size: Optional[int]) -> str:
+    # directory naming of export_and_quant.py
+    return "per-group" if (group_size and group_size > 0) else "per-channel"
+
+
+def load_baseline_weights(onnx_path: str, names=None):
+    """
+        {name: (fp16 tensor as stored, stored_transposed)} of the compute weights (2-D only)
+        names: restrict to these initializers
+    """
+    index = load_index(onnx_path)
+    reader = OnnxReader(onnx_path, index)
+    weights = {}
+    for name, entry in index.items():
+        if (names is not None and name not in names) or len(entry.shape) != 2:
+            continue
+        # one copy out of the memory-mapped file per weight
+        arr = reader.get(name)
+        weights[name] = (torch.from_numpy(arr.copy()).to(torch.float16), entry.transposed)
+    reader.close()
+    return weights
+
+
+def _per_vec_mse(sq: torch.Tensor, grouping: str, gs: Optional[int], axis: str):
+    """
+        per-vector MSE of the squared error sq [R, C] (stored orientation)
+        axis "cols": quant_error_multi_weight.py (columns / column blocks)
+        axis "rows": quant_error_single_weight.py (rows / (row, group))
+    """
+    R, C = sq.shape
+    if grouping == "per-channel":
+        return sq.mean(dim=0 if axis == "cols" else 1)
+    assert gs and C % gs == 0, "group size mismatch"
+    g = sq.reshape(R, C // gs, gs)
+    return g.mean(dim=(0, 2)) if axis == "cols" else g.mean(dim=-1).reshape(-1)
+
+
+@torch.no_grad()
+def error_rows(name: str, w: torch.Tensor, w_deq: torch.Tensor, config, target: bool = False,
+               sketch: Optional[ErrorSketch] = None):
+    """
+        (multi row, elwise row, single row or None) for one stored weight and its dequantized value
+        sketch: |error| of the weight is added to it (whole-model quantiles)
+    """
+    bits, dtype, gs = config
+    grouping = grouping_of(gs)
+    diff = w.float() - w_deq.float()
+    abs_err = diff.abs()
+    if sketch is not None:
+        sketch.update(abs_err.numpy())
+    sq = diff.square_()
+    mse_tensor = sq.mean().item()
+    base = {"initializer": name, "datatype": dtype, "granularity": grouping, "bits": bits}
+
+    vec = _per_vec_mse(sq, grouping, gs, "cols")
+    multi = dict(base, mse_tensor=mse_tensor, mse_rep=vec.mean().item(), mse_p99=percentile(vec, 99))
+    elwise = dict(base, abs_err_sum=abs_err.sum(dtype=torch.float64).item(),
+                  abs_err_max=abs_err.max().item(), abs_err_p99=percentile(abs_err, 99))
+
+    single = None
+    if target:
+        K, C = w.shape
+        vec = _per_vec_mse(sq, grouping, gs, "rows")
+        single = {"datatype": dtype, "granularity": grouping, "bits": bits,
+                  "num_channels": K, "groups_per_channel": C // gs if grouping == "per-group" else "",
+                  "mse_tensor": mse_tensor, "mse_rep": vec.mean().item(), "mse_p99": percentile(vec, 99)}
+    return multi, elwise, single
+
+
+def analyze(weights: dict, configs, target: Optional[str] = None,
+            num_workers: int = 1, mem_budget: Optional[int] = None):
+    """
+        weights: load_baseline_weights() output, configs: [(bits, dtype, gs)]
+        return (multi rows per config {config: [row]}, elwise rows, single rows,
+                whole-model |error| sketch per config {config: ErrorSketch})
+    """
+    configs = [tuple(c) for c in configs]
+
+    def one_weight(item):
+        name, (w, transposed) = item
+        w_t = w.t() if transposed else w                    # quantize in torch [out, in] layout
+        results = quantize_weight_multi(w_t.contiguous(), configs, mem_budget=mem_budget)
+        rows = []
+        for c in configs:
+            w_deq = results[c].w_deq
+            sketch = ErrorSketch()
+            rows.append(error_rows(name, w, w_deq.t() if transposed else w_deq, c,
+                                   target=name == target, sketch=sketch) + (sketch,))
+        return rows
+
+    items = [(n, (n, wt)) for n, wt in weights.items()]
+    multi, elwise, single = {c: [] for c in configs}, [], []
+    model = {c: ErrorSketch() for c in configs}
+    for name, _, rows in _map_layers(items, one_weight, num_workers):
+        print(f"[Analyze] {name}")
+        for c, (m, e, s, sk) in zip(configs, rows):
+            multi[c].append(m)
+            elwise.append(e)
+            if s is not None:
+                single.append(s)
+            model[c].merge(sk)
+    return multi, elwise, single, model
+
+
+def write_csv(rows, fields, path: str):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"[Done] report saved -> {path}")
+
+
+def model_rows(model: dict):
+    """ one MODEL_FIELDS row per config of the whole-model sketches """
+    rows = []
+    for (bits, dtype, gs), sketch in model.items():
+        q = quantile_row("", sketch)
+        del q["initializer"]
+        rows.append(dict(q, datatype=dtype, granularity=grouping_of(gs), bits=bits))
+    return rows
+
+
+def write_reports(multi: dict, elwise, single, output_dir: str, model: Optional[dict] = None):
+    """ same file names as quant_error_multi_weight.sh (+ single / elementwise / whole-model reports) """
+    os.makedirs(output_dir, exist_ok=True)
+    for (bits, dtype, gs), rows in multi.items():
+        if rows:
+            # group sizes other than the scripts' default 128 get their own file
+            tag = f"_gs{gs}" if (grouping_of(gs) == "per-group" and gs != 128) else ""
+            write_csv(rows, MULTI_FIELDS,
+                      os.path.join(output_dir, f"{dtype}_{grouping_of(gs)}{tag}_errors.csv"))
+    if single:
+        write_csv(single, SINGLE_FIELDS, os.path.join(output_dir, "single_weight_error.csv"))
+    if elwise:
+        write_csv(elwise, ELWISE_FIELDS, os.path.join(output_dir, "elementwise_errors.csv"))
+    if model:
+        write_csv(model_rows(model), MODEL_FIELDS, os.path.join(output_dir, "model_error_quantiles.csv"))
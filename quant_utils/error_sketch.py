@@ -0,0 +1,143 @@
+import math
+import numpy as np
+from quant_utils.quant_weight import _map_layers
+
+# =======================================================================
+#  Streaming |error| quantiles (mergeable log-bin histogram)
+#
+#  np.percentile / kthvalue need the whole |error| array of one tensor and
+#  cannot be combined across tensors. ErrorSketch keeps a fixed histogram of
+#  log2|x| (bins_per_octave bins per power of two, relative error of a quantile
+#  <= 2**(1/bins_per_octave) - 1, 1.1% by default) plus exact zeros / min / max:
+#    - fed chunk by chunk (memory-mapped weights never materialized in fp32)
+#    - merge() of two sketches == sketch of the concatenated data, so per-layer
+#      or per-worker sketches add up to the whole-model distribution
+# =======================================================================
+
+SKETCH_QUANTILES = (50, 99, 99.9)
+QUANTILE_FIELDS = ["initializer", "numel", "abs_err_mean", "abs_err_max",
+                   "abs_err_p50", "abs_err_p99", "abs_err_p99_9"]
+_CHUNK = 1 << 20
+
+
+class ErrorSketch:
+    """
+        Log-bin histogram of |x| over [2**min_exp, 2**max_exp); smaller non-zero values
+        land in an underflow bin, larger / inf / NaN in an overflow bin.
+        quantile(q) is exact for zeros and clamped to the exact min / max.
+    """
+    def __init__(self, bins_per_octave: int = 64, min_exp: int = -40, max_exp: int = 16):
+        self.bins_per_octave = bins_per_octave
+        self.min_exp = min_exp
+        self.max_exp = max_exp
+        # [0]: underflow, [1:-1]: log bins, [-1]: overflow
+        self.counts = np.zeros((max_exp - min_exp) * bins_per_octave + 2, dtype=np.int64)
+        self.zeros = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def update(self, x) -> "ErrorSketch":
+        """ add the elements of x (np.ndarray or CPU torch tensor), |x| is taken here """
+        x = np.abs(np.asarray(x).reshape(-1))
+        if x.dtype != np.float64:
+            x = x.astype(np.float32, copy=False)
+        n = x.size
+        if n == 0:
+            return self
+        pos = x[x > 0]
+        zeros = n - np.count_nonzero(x)
+        self.count += n
+        self.zeros += zeros
+        self.counts[-1] += n - zeros - pos.size                 # NaN
+        if pos.size:
+            self.sum += float(pos.sum(dtype=np.float64))
+            self.min = min(self.min, float(pos.min()))
+            self.max = max(self.max, float(pos.max()))
+            e = np.floor(np.log2(pos) * self.bins_per_octave)
+            e -= self.min_exp * self.bins_per_octave - 1
+            np.clip(e, 0, self.counts.size - 1, out=e)
+            self.counts += np.bincount(e.astype(np.int64), minlength=self.counts.size)
+        if zeros:
+            self.min = min(self.min, 0.0)
+        return self
+
+    def merge(self, other: "ErrorSketch") -> "ErrorSketch":
+        if (other.bins_per_octave, other.min_exp, other.max_exp) != \
+           (self.bins_per_octave, self.min_exp, self.max_exp):
+            raise ValueError("cannot merge sketches with different bins")
+        self.counts += other.counts
+        self.zeros += other.zeros
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else math.nan
+
+    def _edges(self, i: int):
+        if i == 0:
+            return self.min, 2.0 ** self.min_exp
+        if i == self.counts.size - 1:
+            return 2.0 ** self.max_exp, self.max
+        e = (i - 1) / self.bins_per_octave + self.min_exp
+        return 2.0 ** e, 2.0 ** (e + 1 / self.bins_per_octave)
+
+    def quantile(self, q: float) -> float:
+        """ q-th percentile (0-100), rank as in np.percentile, geometric interpolation inside a bin """
+        if self.count == 0:
+            return math.nan
+        rank = (self.count - 1) * q / 100.0
+        if rank < self.zeros:
+            return 0.0
+        rank -= self.zeros
+        cum = np.cumsum(self.counts)
+        i = int(np.searchsorted(cum, rank, side="right"))
+        i = min(i, self.counts.size - 1)
+        frac = (rank - (cum[i] - self.counts[i])) / max(int(self.counts[i]), 1)
+        lo, hi = self._edges(i)
+        lo, hi = max(lo, self.min), min(hi, self.max)
+        val = lo * (hi / lo) ** frac if lo > 0 else hi * frac
+        return float(min(max(val, self.min), self.max))
+
+    def quantiles(self, qs=SKETCH_QUANTILES):
+        return [self.quantile(q) for q in qs]
+
+
+def sketch_error(a: np.ndarray, b: np.ndarray, sketch: ErrorSketch = None,
+                 chunk: int = _CHUNK) -> ErrorSketch:
+    """
+        |a - b| of two same-shape arrays (e.g. OnnxReader views) into sketch, chunk elements
+        at a time: only one fp32 chunk of the difference is alive
+    """
+    if a.shape != b.shape:
+        raise ValueError(f"shape mismatch {a.shape} vs {b.shape}")
+    sketch = sketch if sketch is not None else ErrorSketch()
+    a, b = a.reshape(-1), b.reshape(-1)
+    for s in range(0, a.size, chunk):
+        sketch.update(np.subtract(a[s:s + chunk], b[s:s + chunk], dtype=np.float32))
+    return sketch
+
+
+def sketch_layers(pairs, num_workers: int = 1, chunk: int = _CHUNK):
+    """
+        pairs: [(name, a, b)] -> ({name: ErrorSketch}, whole-model ErrorSketch)
+        layers are sketched on num_workers threads, the whole-model sketch is their merge
+    """
+    items = [(name, (a, b)) for name, a, b in pairs]
+    per_layer, total = {}, ErrorSketch()
+    for name, _, sk in _map_layers(items, lambda ab: sketch_error(ab[0], ab[1], chunk=chunk), num_workers):
+        per_layer[name] = sk
+        total.merge(sk)
+    return per_layer, total
+
+
+def quantile_row(name: str, sketch: ErrorSketch) -> dict:
+    """ one QUANTILE_FIELDS line of a sketch (SKETCH_QUANTILES) """
+    p50, p99, p999 = sketch.quantiles(SKETCH_QUANTILES)
+    return {"initializer": name, "numel": sketch.count, "abs_err_mean": sketch.mean,
+            "abs_err_max": sketch.max, "abs_err_p50": p50, "abs_err_p99": p99, "abs_err_p99_9": p999}
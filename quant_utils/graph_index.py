@@ -0,0 +1,144 @@
+import os, json, hashlib
+import onnx
+from onnx import TensorProto
+
+# =======================================================================
+#  MatMul/Gemm weight index of an exported ONNX graph
+#
+#  every analysis / plotting script needs the same set of compute weights
+#  (MatMul/Gemm input B, directly or through a Transpose node). The graph is
+#  walked once and the result cached next to the model as <model>.index.json,
+#  keyed by the sha256 of the .onnx file (graph only for external-data exports,
+#  the offsets of the tensors live in it too):
+#    name -> consumer node, op, stored orientation, layer, shape, dtype,
+#            external data location / offset / length
+# =======================================================================
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".index.json"
+
+
+class WeightEntry:
+    """
+        One MatMul/Gemm weight initializer.
+        node        : name of the first consumer node (MatMul / Gemm)
+        op_type     : "MatMul" | "Gemm"
+        transposed  : True when stored as [in, out] (MatMul B / Gemm transB=0),
+                      False when stored as torch's [out, in] (Transpose input / Gemm transB=1)
+        layer       : module name, e.g. model.decoder.layers.0.self_attn.k_proj
+        shape, data_type : dims and TensorProto data type enum
+        location, offset, length : external data of the tensor, location None when stored inline
+    """
+    FIELDS = ("name", "node", "op_type", "transposed", "layer", "shape", "data_type",
+              "location", "offset", "length")
+
+    def __init__(self, name, node, op_type, transposed, layer, shape, data_type,
+                 location=None, offset=0, length=None):
+        self.name = name
+        self.node = node
+        self.op_type = op_type
+        self.transposed = transposed
+        self.layer = layer
+        self.shape = tuple(shape)
+        self.data_type = data_type
+        self.location = location
+        self.offset = offset
+        self.length = length
+
+    def to_dict(self) -> dict:
+        d = {k: getattr(self, k) for k in self.FIELDS}
+        d["shape"] = list(self.shape)
+        return d
+
+    @classmethod
+    def from_dict(cls, d: dict):
+        return cls(**d)
+
+
+def _layer_name(init_name: str, node_name: str) -> str:
+    # "model.decoder.layers.0.fc1.weight" -> "model.decoder.layers.0.fc1"
+    if init_name.endswith(".weight"):
+        return init_name[:-len(".weight")]
+    # exporter-renamed weights (onnx::MatMul_123): "/model/decoder/layers.0/fc1/MatMul"
+    parts = [p for p in node_name.split("/") if p]
+    return ".".join(parts[:-1]) if len(parts) > 1 else init_name
+
+
+def build_index(model: onnx.ModelProto) -> dict:
+    """ {name: WeightEntry} of the MatMul/Gemm weights, initializer order """
+    initializer_map = {init.name: init for init in model.graph.initializer}
+    output_to_node = {out: node for node in model.graph.node for out in node.output}
+
+    found = {}
+    for node in model.graph.node:
+        if node.op_type not in ("MatMul", "Gemm") or len(node.input) < 2:
+            continue
+        inp = node.input[1]
+        # Case A) input B is the weight initializer itself
+        if inp in initializer_map:
+            trans_b = any(a.name == "transB" and a.i for a in node.attribute)
+            found.setdefault(inp, (node, not trans_b))
+            continue
+        # Case B) input B is the output of a Transpose node reading the initializer
+        tn = output_to_node.get(inp)
+        if tn and tn.op_type == "Transpose" and tn.input[0] in initializer_map:
+            found.setdefault(tn.input[0], (node, False))
+
+    index = {}
+    for init in model.graph.initializer:
+        if init.name not in found:
+            continue
+        node, transposed = found[init.name]
+        location, offset, length = None, 0, None
+        if init.data_location == TensorProto.EXTERNAL:
+            info = {e.key: e.value for e in init.external_data}
+            location = info["location"]
+            offset = int(info.get("offset", 0))
+            length = int(info["length"]) if "length" in info else None
+        index[init.name] = WeightEntry(init.name, node.name, node.op_type, transposed,
+                                       _layer_name(init.name, node.name), init.dims, init.data_type,
+                                       location, offset, length)
+    return index
+
+
+def file_hash(path: str, chunk: int = 1 << 24) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def index_path(onnx_path: str) -> str:
+    return onnx_path + INDEX_SUFFIX
+
+
+def load_index(onnx_path: str, model: onnx.ModelProto = None, refresh: bool = False) -> dict:
+    """
+        {name: WeightEntry} of onnx_path, from the cache when its hash matches the model file.
+        model: already parsed graph (skips the onnx.load on a cache miss)
+    """
+    digest = file_hash(onnx_path)
+    cache = index_path(onnx_path)
+    if not refresh and os.path.exists(cache):
+        try:
+            with open(cache) as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION and data.get("sha256") == digest:
+                return {d["name"]: WeightEntry.from_dict(d) for d in data["weights"]}
+        except (OSError, ValueError, KeyError, TypeError):
+            pass    # unreadable / stale cache -> rebuild
+
+    if model is None:
+        model = onnx.load(onnx_path, load_external_data=False)
+    index = build_index(model)
+    data = {"version": INDEX_VERSION, "sha256": digest,
+            "weights": [e.to_dict() for e in index.values()]}
+    try:
+        tmp = cache + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp, cache)
+    except OSError:
+        pass        # read-only model directory: index is used uncached
+    return index
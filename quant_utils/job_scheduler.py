@@ -0,0 +1,209 @@
+import os, sys, time, subprocess
+from typing import Optional
+
+# =======================================================================
+#  Memory-aware subprocess scheduler (export -> eval -> analysis pipeline)
+#
+#  every job is one script invocation with an estimated peak memory. A job is
+#  started when its dependencies succeeded and the estimates of the running
+#  jobs + its own fit the memory budget (a job larger than the budget only runs
+#  alone). Threads: the free cores are split between the ready jobs that fit
+#  the memory left, one job never gets more than cores // (running + ready
+#  jobs the budget lets run at once), at least 1; passed as OMP_NUM_THREADS
+#  and thread_arg (e.g. eval.py --ort_threads) -> concurrent evals share the cores
+#  measured peak RSS (wait4) is reported next to the estimate in the summary
+# =======================================================================
+
+GiB = 2**30
+
+
+class Job:
+    """
+        cmd        : argv of the job
+        mem        : estimated peak bytes
+        kind       : export | eval | analysis ... (grouped in the summary)
+        deps       : jobs that must succeed first (a failed dependency skips the job)
+        thread_arg : option receiving the thread count, None -> OMP_NUM_THREADS only
+    """
+    def __init__(self, name: str, kind: str, cmd, mem: int, deps=(), thread_arg: Optional[str] = None,
+                 max_threads: Optional[int] = None):
+        self.name = name
+        self.kind = kind
+        self.cmd = list(cmd)
+        self.mem = int(mem)
+        self.deps = list(deps)
+        self.thread_arg = thread_arg
+        self.max_threads = max_threads
+        self.state = "pending"          # pending | running | done | failed | skipped
+        self.threads = 0
+        self.start = self.end = None
+        self.returncode = None
+        self.peak_rss = None
+        self.log = None
+        self._proc = None
+        self._log_f = None
+
+    @property
+    def seconds(self) -> float:
+        return (self.end or time.perf_counter()) - self.start if self.start else 0.0
+
+
+def mem_available() -> Optional[int]:
+    """ MemAvailable of /proc/meminfo in bytes """
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class Scheduler:
+    def __init__(self, jobs, mem_budget: int, cores: Optional[int] = None, max_parallel: Optional[int] = None,
+                 log_dir: str = "logs", poll: float = 0.5, report_every: float = 30.0):
+        self.jobs = list(jobs)
+        self.mem_budget = mem_budget
+        self.cores = cores or os.cpu_count() or 1
+        self.max_parallel = max_parallel or self.cores
+        self.log_dir = log_dir
+        self.poll = poll
+        self.report_every = report_every
+
+    # ── state ──
+    def _running(self):
+        return [j for j in self.jobs if j.state == "running"]
+
+    def _ready(self):
+        ready = []
+        for j in self.jobs:
+            if j.state != "pending":
+                continue
+            if any(d.state in ("failed", "skipped") for d in j.deps):
+                j.state = "skipped"
+                print(f"[Skip] {j.name}: dependency failed")
+            elif all(d.state == "done" for d in j.deps):
+                ready.append(j)
+        return ready
+
+    # ── processes ──
+    def _start(self, job: Job, threads: int):
+        job.threads = threads
+        os.makedirs(self.log_dir, exist_ok=True)
+        job.log = os.path.join(self.log_dir, job.name.replace("/", "__") + ".log")
+        job._log_f = open(job.log, "w")
+        cmd = job.cmd + ([job.thread_arg, str(threads)] if job.thread_arg else [])
+        env = dict(os.environ, OMP_NUM_THREADS=str(threads))
+        job._proc = subprocess.Popen(cmd, stdout=job._log_f, stderr=subprocess.STDOUT, env=env)
+        job.state, job.start = "running", time.perf_counter()
+        print(f"[Start] {job.name} ({job.mem / GiB:.1f} GiB est., {threads} threads)")
+
+    def _reap(self) -> bool:
+        changed = False
+        for job in self._running():
+            # wait4: exit status + peak RSS of exactly this child
+            pid, status, usage = os.wait4(job._proc.pid, os.WNOHANG)
+            if pid == 0:
+                continue
+            job.returncode = job._proc.returncode = os.waitstatus_to_exitcode(status)
+            job.peak_rss = usage.ru_maxrss * 1024
+            job.end = time.perf_counter()
+            job._log_f.close()
+            job.state = "done" if job.returncode == 0 else "failed"
+            changed = True
+            if job.state == "done":
+                print(f"[Done] {job.name} ({job.seconds:.1f} s, peak {job.peak_rss / GiB:.1f} GiB"
+                      f" / {job.mem / GiB:.1f} GiB est.)")
+            else:
+                print(f"[Fail] {job.name} (exit {job.returncode}), log: {job.log}")
+        return changed
+
+    def _fitting(self, jobs, running):
+        """ jobs (in order) that fit first-fit next to running under the memory budget and max_parallel """
+        mem, n, fit = sum(j.mem for j in running), len(running), []
+        for j in jobs:
+            if n >= self.max_parallel:
+                break
+            if mem + j.mem <= self.mem_budget:
+                fit.append(j)
+                mem += j.mem
+                n += 1
+        return fit
+
+    def _share_cap(self, running, ready) -> int:
+        # jobs the budget lets run together now: running + ready ones that fit beside them
+        # (jobs still waiting for dependencies do not hold back cores)
+        parallel = len(running) + len(self._fitting(ready, running))
+        return max(1, self.cores // max(1, parallel))
+
+    def _admit(self) -> bool:
+        running, ready = self._running(), self._ready()
+        if not ready or len(running) >= self.max_parallel:
+            return False
+        cap = self._share_cap(running, ready)
+        starting = self._fitting(ready, running)
+        if not running and not starting:
+            job = ready[0]      # larger than the whole budget
+            print(f"[Warn] {job.name}: {job.mem / GiB:.1f} GiB est. exceeds the budget, running alone")
+            starting = [job]
+        for i, job in enumerate(starting):
+            # free cores split between the jobs starting now, capped at the fair share
+            free_cores = self.cores - sum(j.threads for j in running)
+            threads = max(1, min(cap, free_cores // (len(starting) - i)))
+            if job.max_threads:
+                threads = min(threads, job.max_threads)
+            self._start(job, threads)
+            running.append(job)
+        return bool(starting)
+
+    def progress(self, t0: float):
+        running = self._running()
+        n_done = sum(j.state in ("done", "failed", "skipped") for j in self.jobs)
+        mem = sum(j.mem for j in running)
+        cores = sum(j.threads for j in running)
+        names = ", ".join(f"{j.name} {j.seconds:.0f}s" for j in running)
+        print(f"[{time.perf_counter() - t0:7.0f}s] {n_done}/{len(self.jobs)} finished | "
+              f"mem {mem / GiB:.1f}/{self.mem_budget / GiB:.1f} GiB | cores {cores}/{self.cores} | {names}")
+        sys.stdout.flush()
+
+    def run(self) -> bool:
+        """ run every job, return True when none failed """
+        t0 = last = time.perf_counter()
+        try:
+            while any(j.state in ("pending", "running") for j in self.jobs):
+                changed = self._reap()
+                changed |= self._admit()
+                if not self._running() and not any(j.state == "pending" for j in self.jobs):
+                    break
+                if changed or time.perf_counter() - last >= self.report_every:
+                    self.progress(t0)
+                    last = time.perf_counter()
+                time.sleep(self.poll)
+        except KeyboardInterrupt:
+            for j in self._running():
+                j._proc.terminate()
+            raise
+        self.summary(time.perf_counter() - t0)
+        return not any(j.state == "failed" for j in self.jobs)
+
+    def summary(self, wall: float):
+        print("====================")
+        print(f"{'kind':10s} {'done':>5s} {'failed':>6s} {'skipped':>7s} {'job s':>9s} {'mean s':>8s} "
+              f"{'peak GiB':>9s} {'est GiB':>8s}")
+        for kind in dict.fromkeys(j.kind for j in self.jobs):
+            jobs = [j for j in self.jobs if j.kind == kind]
+            ran = [j for j in jobs if j.end is not None]
+            secs = sum(j.seconds for j in ran)
+            peak = max((j.peak_rss for j in ran), default=0)
+            est = max((j.mem for j in jobs), default=0)
+            print(f"{kind:10s} {sum(j.state == 'done' for j in jobs):5d} "
+                  f"{sum(j.state == 'failed' for j in jobs):6d} {sum(j.state == 'skipped' for j in jobs):7d} "
+                  f"{secs:9.1f} {secs / max(len(ran), 1):8.1f} {peak / GiB:9.2f} {est / GiB:8.2f}")
+        busy = sum(j.seconds for j in self.jobs if j.end is not None)
+        done = sum(j.state == "done" for j in self.jobs)
+        print(f"wall {wall:.1f} s, {done} jobs done ({done / max(wall, 1e-9) * 3600:.1f} jobs/h), "
+              f"parallel speedup {busy / max(wall, 1e-9):.2f}x")
+        for j in self.jobs:
+            if j.state == "failed":
+                print(f"  failed: {j.name} -> {j.log}")
@@ -0,0 +1,178 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from onnx import TensorProto
+from quant_utils.bitpack import pack_codes, unpack_codes
+
+# =======================================================================
+#  Real low-bit Linear for ONNX export (INT sym / asym only)
+#
+#  qdq         : DequantizeLinear(q, scale, zp) -> Cast -> Transpose -> MatMul
+#                codes kept in 8-bit containers (int8 sym / uint8 asym),
+#                per-group is expressed as per-axis over [K*Ng, gs] rows
+#  matmulnbits : com.microsoft::MatMulNBits, codes packed to 2/4/8 bits
+#                B[N, n_blocks, blob], dequant = (q - zp) * scale
+#                other widths (3,5,6,7-bit) are widened to the 8-bit kernel
+#
+#  torch.onnx.export(..., custom_opsets={"com.microsoft": 1}) for matmulnbits
+# =======================================================================
+
+EXPORT_FORMATS = ("fakequant", "qdq", "matmulnbits")
+
+_ONNX_FLOAT = {torch.float16: TensorProto.FLOAT16,
+               torch.float32: TensorProto.FLOAT}
+
+_NBITS_NATIVE = (2, 4, 8)       # widths the MatMulNBits kernels take as is
+_NBITS_BLOCK  = 128             # block_size used when the layout is per-channel / per-tensor
+
+
+class _DequantMatMul(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, x, q, scale, zp, N, K, out_dtype):
+        # q: [R, S] codes, scale/zp: [R] (per-axis over rows) or scalar
+        s = scale.reshape(-1, 1) if scale.dim() else scale
+        z = zp.reshape(-1, 1) if zp.dim() else zp
+        w = ((q.float() - z.float()) * s).reshape(N, K).to(x.dtype)
+        return x @ w.t()
+
+    @staticmethod
+    def symbolic(g, x, q, scale, zp, N, K, out_dtype):
+        if scale.type().dim() == 0:
+            w = g.op("DequantizeLinear", q, scale, zp)
+        else:
+            w = g.op("DequantizeLinear", q, scale, zp, axis_i=0)
+        w = g.op("Reshape", w, g.op("Constant", value_t=torch.tensor([N, K], dtype=torch.int64)))
+        if out_dtype != TensorProto.FLOAT:
+            w = g.op("Cast", w, to_i=out_dtype)
+        return g.op("MatMul", x, g.op("Transpose", w, perm_i=[1, 0]))
+
+
+class _MatMulNBits(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, x, qweight, scales, zero_points, N, K, bits, block_size):
+        n_blocks = qweight.size(1)
+        q = unpack_codes(qweight, bits, N * n_blocks * block_size).view(N, n_blocks, block_size)
+        zp = _unpack_rows(zero_points, bits, N, n_blocks)
+        w = (q.float() - zp.unsqueeze(-1).float()) * scales.view(N, n_blocks, 1).float()
+        w = w.reshape(N, -1)[:, :K].to(x.dtype)
+        return x @ w.t()
+
+    @staticmethod
+    def symbolic(g, x, qweight, scales, zero_points, N, K, bits, block_size):
+        return g.op("com.microsoft::MatMulNBits", x, qweight, scales, zero_points,
+                    K_i=K, N_i=N, bits_i=bits, block_size_i=block_size)
+
+
+def _pack_rows(codes: torch.Tensor, bits: int) -> torch.Tensor:
+    """
+        codes: [N, L] -> [N, ceil(L*bits/8)] uint8, every row packed on its own
+        (layout of the MatMulNBits zero_points input)
+    """
+    N, L = codes.shape
+    L8 = -(-L // 8) * 8
+    packed = pack_codes(F.pad(codes, (0, L8 - L)), bits).view(N, -1)
+    return packed[:, :(L * bits + 7) // 8].contiguous()
+
+
+def _unpack_rows(packed: torch.Tensor, bits: int, N: int, L: int) -> torch.Tensor:
+    """
+        Inverse of _pack_rows. return: [N, L] uint8
+    """
+    nb8 = -(-L // 8) * bits                     # bytes per row before trimming
+    rows = F.pad(packed.view(N, -1), (0, nb8 - packed.numel() // N))
+    return unpack_codes(rows, bits, N * (nb8 // bits) * 8).view(N, -1)[:, :L]
+
+
+class LowBitLinear(nn.Module):
+    """
+        nn.Linear replacement holding only INT codes, scales and zero-points of
+        a QuantResult. Exports as a real quantized MatMul (see EXPORT_FORMATS).
+    """
+    def __init__(self, src: nn.Linear, result, fmt: str = "matmulnbits"):
+        super().__init__()
+        if fmt not in ("qdq", "matmulnbits"):
+            raise ValueError(f"Unsupported low-bit export format {fmt}")
+        if result.q is None or not result.datatype.startswith("int"):
+            raise ValueError(f"Low-bit export supports int datatypes only, not {result.datatype}")
+
+        self.in_features, self.out_features = src.in_features, src.out_features
+        self.fmt, self.wq_bits, self.layout = fmt, result.wq_bits, result.layout
+        self.compute_dtype = src.weight.dtype
+        self.bias = None
+        if src.bias is not None:
+            self.bias = nn.Parameter(src.bias.detach())
+
+        if fmt == "qdq":
+            self._build_qdq(result)
+        else:
+            self._build_nbits(result)
+
+    # ---- DequantizeLinear + MatMul ---------------------------------------
+    def _build_qdq(self, result):
+        N, K = self.out_features, self.in_features
+        asym = result.zp is not None
+        if result.layout == "per-group":
+            rows = N * (K // result.group_size)      # [K,Ng,gs] -> per-axis over [K*Ng, gs]
+        elif result.layout == "per-channel":
+            rows = N
+        else:
+            rows = None
+
+        q = result.q.to(torch.uint8 if asym else torch.int8)
+        q = q.reshape(rows, -1) if rows else q.reshape(N, K)
+        scale = result.scale.to(torch.float32)      # opset<19: DequantizeLinear scale is fp32
+        scale = scale.reshape(rows) if rows else scale.reshape(())
+        if asym:
+            zp = result.zp.reshape(scale.shape).to(torch.uint8)
+        else:
+            zp = torch.zeros(scale.shape, dtype=torch.int8, device=q.device)
+
+        self.register_buffer("weight_q", q.contiguous())
+        self.register_buffer("weight_scale", scale.contiguous())
+        self.register_buffer("weight_zp", zp.contiguous())
+
+    # ---- com.microsoft::MatMulNBits ----------------------------------------
+    def _build_nbits(self, result):
+        N, K, bits = self.out_features, self.in_features, result.wq_bits
+        asym = result.zp is not None
+
+        if result.layout == "per-group":
+            block = result.group_size
+            if block < 16 or block & (block - 1):
+                raise ValueError(f"MatMulNBits needs a power-of-two group size >= 16, not {block}")
+        else:
+            block = _NBITS_BLOCK
+        n_blocks = -(-K // block)
+        kbits = bits if bits in _NBITS_NATIVE else 8
+
+        # codes: unsigned, [N, K] padded to [N, n_blocks*block]
+        q = result.q.reshape(N, K).to(torch.int16)
+        if asym:
+            zp = result.zp.reshape(N, -1) if result.zp.dim() else result.zp.reshape(1, 1)
+            zp = zp.to(torch.int16)
+        else:                                   # sym: offset binary around 2**(b-1)
+            q = q + 2 ** (kbits - 1)
+            zp = torch.full((N, 1), 2 ** (kbits - 1), dtype=torch.int16, device=q.device)
+        q = F.pad(q, (0, n_blocks * block - K)).to(torch.uint8)
+
+        # scale / zp: one entry per block (per-channel / per-tensor repeat over the blocks)
+        scale = result.scale.reshape(N, -1) if result.scale.dim() else result.scale.reshape(1, 1)
+        scale = scale.expand(N, n_blocks)
+        zp = zp.expand(N, n_blocks).to(torch.uint8)
+
+        self.block_size, self.kernel_bits = block, kbits
+        self.register_buffer("weight_q", pack_codes(q, kbits).view(N, n_blocks, block * kbits // 8))
+        self.register_buffer("weight_scale", scale.to(self.compute_dtype).reshape(-1).contiguous())
+        self.register_buffer("weight_zp", _pack_rows(zp, kbits).reshape(-1))
+
+    def forward(self, x):
+        N, K = self.out_features, self.in_features
+        if self.fmt == "qdq":
+            out = _DequantMatMul.apply(x, self.weight_q, self.weight_scale, self.weight_zp,
+                                       N, K, _ONNX_FLOAT[self.compute_dtype])
+        else:
+            out = _MatMulNBits.apply(x, self.weight_q, self.weight_scale, self.weight_zp,
+                                     N, K, self.kernel_bits, self.block_size)
+        if self.bias is not None:
+            out = out + self.bias
+        return out
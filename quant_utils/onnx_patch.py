@@ -0,0 +1,199 @@
+import os, shutil
+import torch
+import numpy as np
+from typing import Optional
+import onnx
+from onnx import TensorProto, helper
+from quant_utils.quant_weight import quantize_weight, dump_buffers, has_dump, _announce_quant, _map_layers
+from quant_utils.quant_error import report_row, write_error_report
+from quant_utils.graph_index import load_index, index_path
+from quant_utils.onnx_reader import OnnxReader
+from quant_utils.artifact_store import TensorStore, dedup_onnx, is_deduped, tensors_dir, stored_digest, \
+    _set_external, _save_graph
+
+# =======================================================================
+#  Fake-quant ONNX from the exported fp16 baseline, without re-export
+#
+#  a fake-quant graph differs from the baseline only in the values of the
+#  MatMul/Gemm weights. The baseline graph file is copied as is (its tensors
+#  keep their external data offsets), its .data file is copied and every
+#  compute weight is quantized from the memory-mapped baseline and written
+#  back in place at its offset -> no HF model load, no torch.onnx.export
+#
+#  with a TensorStore (artifact_store.py) nothing is copied: the baseline is
+#  moved into the store once, the patched graph links its unchanged tensors
+#  and only the quantized weights add files. Without a store, a baseline already
+#  moved into one gets its tensors copied and the quantized weights in a new .data
+#
+#  load_weight: the weights to quantize come from elsewhere (stream_quant.py:
+#  memory-mapped checkpoint shards) instead of the baseline's own tensors
+#  dump: weight_q / weight_scale / ... added as unused initializers, as export_onnx does
+# =======================================================================
+
+_TORCH_DTYPE = {np.dtype(np.float16): torch.float16, np.dtype(np.float32): torch.float32}
+
+
+def _external_locations(reader: OnnxReader):
+    locs = set()
+    for init in reader.model.graph.initializer:
+        if init.data_location == TensorProto.EXTERNAL:
+            locs.update(e.value for e in init.external_data if e.key == "location")
+    return sorted(locs)
+
+
+def _copy_file(src: str, dst: str):
+    # never write through an existing link to the baseline files
+    if os.path.lexists(dst):
+        os.remove(dst)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    shutil.copyfile(src, dst)
+
+
+def _graph_copy(reader: OnnxReader, out_path: str, skip, store: Optional[TensorStore] = None):
+    """
+        graph copy of a deduplicated baseline, its tensors (except skip) next to out_path:
+        linked from store, copied from the baseline without one
+    """
+    model = onnx.ModelProto()
+    model.CopyFrom(reader.model)
+    out_tensors = os.path.join(os.path.dirname(out_path), tensors_dir(out_path))
+    if os.path.isdir(out_tensors):
+        shutil.rmtree(out_tensors)      # links / copies of a previous run (store objects are kept)
+    for init in model.graph.initializer:
+        if init.data_location == TensorProto.EXTERNAL and init.name not in skip:
+            digest = stored_digest(init)
+            dst = os.path.join(out_tensors, f"{digest}.bin")
+            if store is not None:
+                store.link(digest, dst)
+            else:
+                _copy_file(os.path.join(reader.base_dir, tensors_dir(reader.path), f"{digest}.bin"), dst)
+    return model
+
+
+def _add_initializer(graph: onnx.ModelProto, name: str, arr: np.ndarray, location: str, offset: int = 0):
+    init = graph.graph.initializer.add()
+    init.name, init.data_type = name, helper.np_dtype_to_tensor_dtype(arr.dtype)
+    init.dims.extend(arr.shape)
+    _set_external(init, location, arr.nbytes, offset)
+
+
+def patch_quantized_onnx(baseline_onnx: str, out_dir: str,
+                         wq_bits: int, wq_datatype: str, wq_groupsize: Optional[int],
+                         num_workers: int = 1, max_inflight: Optional[int] = None,
+                         mem_budget: Optional[int] = None, error_report: Optional[str] = None,
+                         store: Optional[TensorStore] = None, load_weight=None, dump: bool = False) -> str:
+    """
+        Write <out_dir>/<baseline graph name> (+ its .data) with the quantized weights patched in.
+        Quantized: every 2-D MatMul/Gemm weight of the graph index (nn.Linear weights of the
+        export, a tied lm_head quantizes the shared embedding as quant_model does).
+        mem_budget, error_report: see quant_model
+        store: deduplicate through this TensorStore (the baseline export is moved into it)
+        load_weight: load_weight(entry) -> [out, in] tensor to quantize, None: the baseline's
+        dump: add <layer>.weight_q / weight_scale / ... (quant_model's dump, not for mx / mixed)
+        return: path of the patched graph
+    """
+    if not _announce_quant(wq_bits, wq_datatype, wq_groupsize):
+        raise ValueError("patching needs a quantization datatype")
+    if store is not None:
+        dedup_onnx(baseline_onnx, store)    # no-op once the baseline is in the store
+    index = load_index(baseline_onnx)
+    reader = OnnxReader(baseline_onnx, index)
+    weights = [(name, e) for name, e in index.items() if len(e.shape) == 2]
+    inline = [name for name, e in weights if e.location is None]
+    if inline:
+        raise ValueError(f"weights stored inside the graph cannot be patched: {inline[:3]}")
+
+    os.makedirs(out_dir, exist_ok=True)
+    out_path = os.path.join(out_dir, os.path.basename(baseline_onnx))
+    dump = dump and has_dump(wq_datatype)
+    rewrite = store is not None or is_deduped(reader)
+    graph, data_f, dump_f = None, None, None
+    if rewrite:
+        # graph rewritten below, only the quantized tensors get new locations
+        graph = _graph_copy(reader, out_path, {name for name, _ in weights}, store)
+        inits = {init.name: init for init in graph.graph.initializer}
+        if store is None:
+            # baseline moved into a store earlier: the quantized weights go to a fresh
+            # <graph>.data, never into files named after the baseline's hashes
+            data_loc = os.path.basename(out_path) + ".data"
+            data_f = open(os.path.join(out_dir, data_loc), "wb")
+    else:
+        # graph (+ cached index) and data files copied, the graph is not touched
+        _copy_file(baseline_onnx, out_path)
+        if os.path.exists(index_path(baseline_onnx)):
+            _copy_file(index_path(baseline_onnx), index_path(out_path))
+        for loc in _external_locations(reader):
+            _copy_file(os.path.join(reader.base_dir, loc), os.path.join(out_dir, loc))
+        if dump:
+            # dump initializers appended after the baseline tensors of the copied .data
+            graph = onnx.ModelProto()
+            graph.CopyFrom(reader.model)
+            dump_loc = _external_locations(reader)[0]
+            dump_f = open(os.path.join(out_dir, dump_loc), "ab")
+    if data_f is not None:
+        dump_loc, dump_f = data_loc, data_f
+
+    def quant_one(entry):
+        dtype = reader.dtype(entry.name)
+        w = load_weight(entry) if load_weight is not None else None
+        if w is None:
+            w = torch.from_numpy(reader.get(entry.name).copy())
+            w = w.t().contiguous() if entry.transposed else w      # torch [out, in] layout
+        else:
+            w = w.to(_TORCH_DTYPE[np.dtype(dtype)])
+        res = quantize_weight(w, wq_bits, wq_datatype, wq_groupsize, mem_budget,
+                              with_error=error_report is not None)
+        w_deq = res.w_deq.t() if entry.transposed else res.w_deq
+        arr = np.ascontiguousarray(w_deq.numpy(), dtype=dtype)
+        bufs = {k: v.contiguous().numpy() for k, v in dump_buffers(res).items()} if dump else {}
+        return arr, (res.error and report_row(f"{entry.layer}.weight", res)), bufs
+
+    files, rows = {}, []
+    try:
+        for name, entry, (arr, row, bufs) in _map_layers(weights, quant_one, num_workers, max_inflight):
+            print(f'Quantizing layer: {entry.layer}')
+            if entry.length is not None and arr.nbytes != entry.length:
+                raise ValueError(f"quantized '{name}' is {arr.nbytes} bytes, {entry.length} expected")
+            if data_f is not None:
+                _set_external(inits[name], data_loc, arr.nbytes, offset=data_f.tell())
+                data_f.write(memoryview(arr).cast("B"))
+            elif rewrite:
+                digest = store.put(arr)
+                rel = f"{tensors_dir(out_path)}/{digest}.bin"
+                store.link(digest, os.path.join(out_dir, rel))
+                _set_external(inits[name], rel, arr.nbytes)
+            else:
+                f = files.get(entry.location)
+                if f is None:
+                    f = files[entry.location] = open(os.path.join(out_dir, entry.location), "r+b")
+                f.seek(entry.offset)
+                f.write(memoryview(arr).cast("B"))
+            for b_name, buf in bufs.items():
+                if store is not None:
+                    digest = store.put(buf)
+                    rel = f"{tensors_dir(out_path)}/{digest}.bin"
+                    store.link(digest, os.path.join(out_dir, rel))
+                    _add_initializer(graph, f"{entry.layer}.{b_name}", buf, rel)
+                else:
+                    _add_initializer(graph, f"{entry.layer}.{b_name}", buf, dump_loc, dump_f.tell())
+                    dump_f.write(memoryview(buf).cast("B"))
+            if row:
+                rows.append(row)
+            del arr, bufs
+    finally:
+        for f in files.values():
+            f.close()
+        if dump_f is not None:
+            dump_f.close()
+        reader.close()
+
+    if graph is not None:
+        _save_graph(graph, out_path)
+        # full-size leftovers of an earlier run without the store, index of another graph
+        leftovers = [index_path(out_path)] + ([out_path + ".data"] if rewrite and data_f is None else [])
+        for stale in leftovers:
+            if os.path.exists(stale):
+                os.remove(stale)
+    if error_report is not None and rows:
+        write_error_report(rows, error_report)
+    return out_path
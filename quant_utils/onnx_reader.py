@@ -0,0 +1,142 @@
+import os
+import mmap
+import numpy as np
+import onnx
+from onnx import TensorProto, numpy_helper
+
+# =======================================================================
+#  Lazy ONNX initializer reader
+#
+#  onnx.load() reads every external tensor into memory (2.6 GB for opt-1.3b)
+#  only to look at one weight. Here only the graph structure is parsed
+#  (load_external_data=False) and the external data file is memory-mapped:
+#  an initializer is a zero-copy, read-only NumPy view at its offset / length,
+#  pages are read by the OS when the values are touched.
+#  tensors stored inside the .onnx file (raw_data) are viewed the same way.
+# =======================================================================
+
+# ONNX -> NumPy dtype mapping
+DTYPE_MAP = {
+    TensorProto.FLOAT:   np.float32,
+    TensorProto.FLOAT16: np.float16,
+    TensorProto.DOUBLE:  np.float64,
+    TensorProto.INT8:    np.int8,
+    TensorProto.UINT8:   np.uint8,
+    TensorProto.INT16:   np.int16,
+    TensorProto.UINT16:  np.uint16,
+    TensorProto.INT32:   np.int32,
+    TensorProto.INT64:   np.int64,
+    TensorProto.BOOL:    np.bool_,
+}
+
+
+class OnnxReader:
+    """
+        reader = OnnxReader("onnx_graph/.../model.onnx")
+        w = reader.get("model.decoder.layers.0.self_attn.k_proj.weight")   # np.ndarray view, read-only
+        reader.model: ModelProto without external tensor data (graph / node lookups)
+        index: graph_index.load_index() entries, external weights in it are read from their
+               recorded offset without parsing the graph (parsed on first other use)
+    """
+    def __init__(self, path: str, index: dict = None):
+        self.path = path
+        self.base_dir = os.path.dirname(os.path.abspath(path))
+        self.index = index or {}
+        self._model = None
+        self._inits = None
+        self._maps = {}     # external data location -> mmap
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = onnx.load(self.path, load_external_data=False)
+        return self._model
+
+    @property
+    def inits(self):
+        if self._inits is None:
+            self._inits = {init.name: init for init in self.model.graph.initializer}
+        return self._inits
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, name):
+        return name in self.index or name in self.inits
+
+    def __iter__(self):
+        return iter(self.inits)
+
+    def __len__(self):
+        return len(self.inits)
+
+    def names(self):
+        return list(self.inits)
+
+    def shape(self, name: str):
+        if name in self.index:
+            return tuple(self.index[name].shape)
+        return tuple(self.inits[name].dims)
+
+    def dtype(self, name: str):
+        if name in self.index:
+            return DTYPE_MAP.get(self.index[name].data_type)
+        return DTYPE_MAP.get(self.inits[name].data_type)
+
+    def _map(self, location: str):
+        mm = self._maps.get(location)
+        if mm is None:
+            with open(os.path.join(self.base_dir, location), "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[location] = mm
+        return mm
+
+    def _external(self, name, dims, data_type, location, offset, length) -> np.ndarray:
+        np_dtype = DTYPE_MAP.get(data_type)
+        if np_dtype is None:
+            raise TypeError(f"unsupported data type {data_type} of external tensor '{name}'")
+        count = int(np.prod(dims, dtype=np.int64))
+        if length is not None and length != count * np.dtype(np_dtype).itemsize:
+            raise ValueError(f"external data length of '{name}' does not match its shape {dims}")
+        arr = np.frombuffer(self._map(location), dtype=np_dtype, count=count, offset=offset)
+        return arr.reshape(dims)
+
+    def get(self, name: str) -> np.ndarray:
+        """ zero-copy view of initializer name (copy only for typed-field tensors, e.g. int32_data) """
+        entry = self.index.get(name)
+        if entry is not None and entry.location is not None:
+            return self._external(name, tuple(entry.shape), entry.data_type,
+                                  entry.location, entry.offset, entry.length)
+
+        init = self.inits.get(name)
+        if init is None:
+            raise KeyError(f"Initializer '{name}' not found in {self.path}")
+        dims = tuple(init.dims)
+        np_dtype = DTYPE_MAP.get(init.data_type)
+
+        if init.data_location == TensorProto.EXTERNAL:
+            info = {e.key: e.value for e in init.external_data}
+            length = int(info["length"]) if "length" in info else None
+            return self._external(name, dims, init.data_type, info["location"],
+                                  int(info.get("offset", 0)), length)
+
+        if init.raw_data and np_dtype is not None:
+            return np.frombuffer(init.raw_data, dtype=np_dtype).reshape(dims)
+        return numpy_helper.to_array(init)
+
+    def close(self):
+        # views returned by get() keep their mapping alive, those are released with the views
+        for mm in self._maps.values():
+            try:
+                mm.close()
+            except BufferError:
+                pass
+        self._maps.clear()
+
+
+def read_initializer(onnx_path: str, name: str) -> np.ndarray:
+    """ one initializer of an ONNX file without loading the others """
+    return OnnxReader(onnx_path).get(name)
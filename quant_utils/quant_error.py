@@ -0,0 +1,84 @@
+import csv
+import math
+import torch
+from typing import Optional
+
+# =======================================================================
+#  Quantization error statistics (fused into quantization)
+#
+#  computed while the original and the dequantized weight are both in
+#  memory, instead of exporting ONNX and reloading both models.
+#  per-vector MSE follows the quantization layout (MSE&P99/quant_error_single_weight.py):
+#    per-channel : one MSE per output row        -> [K]
+#    per-group   : one MSE per (row, group)      -> [K, Ng]
+#    per-tensor  : no vector (mse_rep / mse_p99 left empty)
+#  element-wise |error| sum / max / P99 as in elwise_error/onnx_error_cli.py
+# =======================================================================
+
+REPORT_FIELDS = ["initializer", "datatype", "granularity", "bits", "group_size", "numel",
+                 "mse_tensor", "mse_rep", "mse_p99",
+                 "abs_err_sum", "abs_err_max", "abs_err_p99"]
+
+
+def percentile(x: torch.Tensor, q: float) -> float:
+    """
+        q-th percentile of all elements, linear interpolation like np.percentile.
+        kthvalue instead of torch.quantile (no input size limit, no full sort).
+    """
+    x = x.reshape(-1)
+    n = x.numel()
+    pos = (n - 1) * q / 100.0
+    lo = math.floor(pos)
+    a = x.kthvalue(lo + 1).values.item()
+    if pos == lo:
+        return a
+    b = x.kthvalue(lo + 2).values.item()
+    return a + (b - a) * (pos - lo)
+
+
+@torch.no_grad()
+def weight_error_stats(w: torch.Tensor, w_deq: torch.Tensor, layout: str,
+                       group_size: Optional[int] = None) -> dict:
+    """
+        Error statistics of one quantized weight (fp32 math).
+        layout: QuantResult.layout ('per-tensor' | 'per-channel' | 'per-group')
+    """
+    diff = w.float() - w_deq.float()
+    abs_err = diff.abs()
+    sq = diff.square_()
+    stats = {
+        "numel":       w.numel(),
+        "mse_tensor":  sq.mean(dtype=torch.float64).item(),
+        "abs_err_sum": abs_err.sum(dtype=torch.float64).item(),
+        "abs_err_max": abs_err.max().item(),
+        "abs_err_p99": percentile(abs_err, 99),
+        "mse_rep":     "",
+        "mse_p99":     "",
+    }
+    del abs_err
+
+    per_vec = None
+    if w.dim() == 2 and layout == "per-channel":
+        per_vec = sq.mean(dim=-1)
+    elif w.dim() == 2 and layout == "per-group":
+        K, C = w.shape
+        per_vec = sq.reshape(K, C // group_size, group_size).mean(dim=-1)
+    if per_vec is not None:
+        stats["mse_rep"] = per_vec.mean(dtype=torch.float64).item()
+        stats["mse_p99"] = percentile(per_vec, 99)
+    return stats
+
+
+def report_row(name: str, result) -> dict:
+    """ one report line for the QuantResult of initializer name (result.error must be set) """
+    return {"initializer": name, "datatype": result.datatype, "granularity": result.layout,
+            "bits": result.wq_bits, "group_size": result.group_size, **result.error}
+
+
+def write_error_report(rows, path: str):
+    """ per-layer error report as CSV (REPORT_FIELDS columns) """
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"[Done] error report saved -> {path}")
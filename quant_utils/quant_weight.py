@@ -1,9 +1,13 @@
 import types
-import torch.nn.functional as F
 import torch
 import torch.nn as nn
 from typing import Optional
-import time
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from quant_utils.bitpack import pack_codes
+from quant_utils.lowbit_linear import LowBitLinear, EXPORT_FORMATS
+from quant_utils.quant_error import weight_error_stats, report_row, write_error_report
 
 
 #################################  3-bit Datatypes  #################################
@@ -204,6 +208,339 @@ DATATYPE_MAPPING_8_BIT = {'int8': INT8,
 # -------------------------------------------------------------
 
 
+# ---------- compiled codebooks -------------------------------------------------
+class Codebook:
+    """
+        One datatype compiled into tensors for a given (device, dtype):
+        sorted levels, midpoints between neighbours, max-abs value,
+        bit width and level count.
+    """
+    def __init__(self, name: str, allow_value, wq_bits: int,
+                 device: torch.device, dtype: torch.dtype):
+        values = sorted(allow_value)
+        mid_value = [(values[i] + values[i + 1]) /
+                     2 for i in range(len(values) - 1)]
+        self.name = name
+        self.wq_bits = wq_bits
+        self.n_levels = len(values)
+        self.qmax = max(abs(x) for x in values)   # python float, keeps scale math unchanged
+        self.levels = torch.tensor(values, dtype=dtype, device=device)
+        self.mid = torch.tensor(mid_value, dtype=dtype, device=device)
+
+
+class CodebookRegistry:
+    """
+        name -> value list, compiled lazily and cached per (device, dtype).
+    """
+    def __init__(self):
+        self._values = {}
+        self._bits = {}
+        self._compiled = {}
+
+    def register(self, name: str, allow_value, wq_bits: int):
+        self._values[name] = list(allow_value)
+        self._bits[name] = wq_bits
+        for key in [k for k in self._compiled if k[0] == name]:
+            del self._compiled[key]
+
+    def __contains__(self, name: str):
+        return name in self._values
+
+    def get(self, name: str, device=None, dtype: torch.dtype = torch.float32) -> Codebook:
+        device = torch.device(device if device is not None else "cpu")
+        key = (name, device, dtype)
+        cb = self._compiled.get(key)
+        if cb is None:
+            if name not in self._values:
+                raise KeyError(f"unexpected data type {name}.")
+            cb = self._compiled.setdefault(
+                key, Codebook(name, self._values[name], self._bits[name], device, dtype))
+        return cb
+
+
+CODEBOOKS = CodebookRegistry()
+for _bits, _mapping in ((3, DATATYPE_MAPPING_3_BIT), (3, DATATYPE_MAPPING_3_BIT_MX),
+                        (4, DATATYPE_MAPPING_4_BIT), (4, DATATYPE_MAPPING_4_BIT_MX),
+                        (5, DATATYPE_MAPPING_5_BIT), (6, DATATYPE_MAPPING_6_BIT),
+                        (8, DATATYPE_MAPPING_8_BIT)):
+    for _name, _values in _mapping.items():
+        CODEBOOKS.register(_name, _values, _bits)
+
+
+# ---------- nearest-codebook rounding ------------------------------------------
+@torch.no_grad()
+def _round_to_codebook(x: torch.Tensor, cb: Codebook) -> torch.Tensor:
+    """
+        Round every element of x to the nearest entry of the compiled codebook.
+        Midpoints are searched with bucketize (O(N log L)), ties go to the lower
+        entry exactly like the former where-cascade (mid[i-1] < x <= mid[i]).
+    """
+    return cb.levels[torch.bucketize(x, cb.mid)]
+
+
+# ---------- analytic ExMy rounding ---------------------------------------------
+class ExMy:
+    """
+        Sign + E exponent bits + M mantissa bits, no inf/NaN (all codes are values).
+        subnormal=True : IEEE-style subnormals, binades e_min..e_min+2^E-2
+                         (default e_min=M -> smallest subnormal is 1, like FP3..FP6 lists)
+        subnormal=False: every exponent code is a binade e_min..e_min+2^E-1 and the
+                         (e_min, m=0) code is zero (default e_min=-bias, like the FP8 lists)
+    """
+    def __init__(self, E: int, M: int, subnormal: bool = True, e_min: Optional[int] = None):
+        self.E, self.M, self.subnormal = E, M, subnormal
+        if e_min is None:
+            e_min = M if subnormal else -(2 ** (E - 1) - 1)
+        self.e_min = e_min
+        self.e_max = e_min + 2 ** E - (2 if subnormal else 1)
+        self.qmax = (2 - 2.0 ** -M) * 2.0 ** self.e_max
+        self.v_min = (1 + 2.0 ** -M) * 2.0 ** e_min      # smallest non-zero without subnormals
+
+    def values(self):
+        """ sorted value list, the same form as the hand-written DATATYPE lists """
+        pos = [(1 + m / 2 ** self.M) * 2.0 ** e
+               for e in range(self.e_min, self.e_max + 1) for m in range(2 ** self.M)]
+        if self.subnormal:
+            pos = [m / 2 ** self.M * 2.0 ** self.e_min for m in range(1, 2 ** self.M)] + pos
+        else:
+            pos = pos[1:]
+        return sorted([-v for v in pos]) + [0.0] + pos
+
+
+@torch.no_grad()
+def _round_to_exmy(x: torch.Tensor, fmt: ExMy) -> torch.Tensor:
+    """
+        Round x to the nearest ExMy value in O(N): the binade comes from the exponent (frexp), the
+        mantissa is rounded on that binade's grid, out-of-range values saturate.
+        Ties go to the lower value, the same as _round_to_codebook on fmt.values().
+    """
+    x32 = x.float()
+    # floor(log2|x|) and 2^(e-M) straight from the fp32 exponent field (cheaper than frexp/ldexp);
+    # zero / fp32 subnormals read as -127 and are clamped up to e_min
+    e = x32.view(torch.int32).bitwise_right_shift(23).bitwise_and_(0xFF)
+    e = e.sub_(127).clamp_(fmt.e_min, fmt.e_max)
+    step = e.add_(127 - fmt.M).bitwise_left_shift_(23).view(torch.float32)
+    n = x32 / step                                   # exact, step is a power of two
+    lo = torch.floor(n)
+    q = n.gt_(lo + 0.5).add_(lo).mul_(step)         # n > lo+0.5 (exact), not n-lo > 0.5
+    q = torch.nan_to_num_(q.clamp_(-fmt.qmax, fmt.qmax), nan=fmt.qmax)   # NaN sorts last, as in bucketize
+    if not fmt.subnormal:                            # only 0 and ±v_min below v_min
+        small = x32.abs() < fmt.v_min
+        if small.any():
+            xs, h = x32[small], fmt.v_min / 2
+            q[small] = torch.where(xs > h, fmt.v_min, torch.where(xs > -h, 0.0, -fmt.v_min))
+    return q.to(x.dtype)
+
+
+# name -> ExMy, the FP lists these formats reproduce are rounded analytically
+EXMY_FORMATS = {
+    'fp3': ExMy(2, 0), 'mx_fp3': ExMy(2, 0),
+    'fp4': ExMy(2, 1), 'mx_fp4': ExMy(2, 1),
+    'fp5': ExMy(2, 2), 'fp5_e2m2': ExMy(2, 2), 'fp5_e3m1': ExMy(3, 1),
+    'fp6': ExMy(2, 3), 'fp6_e2m3': ExMy(2, 3), 'fp6_e3m2': ExMy(3, 2),
+    'fp8_e2m5': ExMy(2, 5, subnormal=False), 'fp8_e3m4': ExMy(3, 4, subnormal=False),
+    'fp8_e4m3': ExMy(4, 3, subnormal=False), 'fp8_e5m2': ExMy(5, 2, subnormal=False),
+}
+
+# new formats only need an ExMy entry: the value list is generated
+DATATYPE_MAPPING_7_BIT = {}
+for _name, _fmt in (('fp7_e2m4', ExMy(2, 4)), ('fp7_e3m3', ExMy(3, 3)), ('fp7_e4m2', ExMy(4, 2))):
+    EXMY_FORMATS[_name] = _fmt
+    DATATYPE_MAPPING_7_BIT[_name] = _fmt.values()
+    CODEBOOKS.register(_name, DATATYPE_MAPPING_7_BIT[_name], 7)
+
+
+def _round_fp(x: torch.Tensor, cb: Codebook) -> torch.Tensor:
+    """ analytic rounding for ExMy formats, codebook search for everything else """
+    fmt = EXMY_FORMATS.get(cb.name)
+    return _round_to_codebook(x, cb) if fmt is None else _round_to_exmy(x, fmt)
+
+
+# ---------- compute-dtype policy -----------------------------------------------
+#   fp16 : float16 arithmetic, the original rounding bit for bit (default)
+#   fp32 : float32 arithmetic, scales rounded to fp16 before use
+#   outputs (dequantized weight, scales, zero-points) are stored as float16 in both modes
+#   (bf16 is not offered: it cannot hold the stored fp16 scale exactly)
+_COMPUTE_DTYPES = {"fp16": torch.float16, "fp32": torch.float32}
+_STORAGE_DTYPE = torch.float16
+_compute_dtype = torch.float16
+
+
+def set_compute_dtype(name: str):
+    global _compute_dtype
+    if name not in _COMPUTE_DTYPES:
+        raise ValueError(f"Unsupported compute dtype {name}, choose from {list(_COMPUTE_DTYPES)}")
+    _compute_dtype = _COMPUTE_DTYPES[name]
+
+
+def get_compute_dtype() -> torch.dtype:
+    return _compute_dtype
+
+
+@contextmanager
+def compute_dtype(name: str):
+    prev = _compute_dtype
+    set_compute_dtype(name)
+    try:
+        yield
+    finally:
+        globals()["_compute_dtype"] = prev
+
+
+def _store_round(t: torch.Tensor) -> torch.Tensor:
+    """
+        Round t to the storage dtype but keep its dtype, so the codes are computed
+        with exactly the scale that is stored (no-op under the fp16 policy).
+    """
+    return t if t.dtype == _STORAGE_DTYPE else t.to(_STORAGE_DTYPE).to(t.dtype)
+
+
+# ---------- clipping-ratio scale search ----------------------------------------
+#   off (default): scale = rmax / qmax (absmax)
+#   on           : the range of every channel / group (the tensor for per-tensor) is
+#                  shrunk by the ratio of the grid with the lowest sum |deq - w|^norm,
+#                  all ratios evaluated in one broadcast [R, rows, ..., gs] pass
+_clip_ratios = None
+_clip_norm = 2.0
+_clip_mem_budget = None
+_CLIP_BYTES_PER_ELEM = 24       # deq (<= fp32) + fp32 error + rounding temporaries per ratio·element
+_CLIP_DEFAULT_BUDGET = 512 * 2**20  # search temporaries per weight when no mem_budget is set
+
+
+def clip_grid(n: int = 20, min_ratio: float = 0.5):
+    """ n ratios 1.0 ... min_ratio, evenly spaced """
+    if n <= 1:
+        return [1.0]
+    return [1.0 - (1.0 - min_ratio) * i / (n - 1) for i in range(n)]
+
+
+def set_clip_search(ratios=None, norm: float = 2.0, mem_budget: Optional[int] = None):
+    """
+        ratios    : clipping ratios to try (e.g. clip_grid()), None turns the search off.
+                    1.0 is always tried first, so absmax wins ties.
+        norm      : p of the per-group error sum |deq - w|^p
+        mem_budget: approx. bytes of the [R, rows, ...] search temporaries, rows are tiled to fit
+                    (None: _CLIP_DEFAULT_BUDGET, the R-fold temporaries are never built for the whole weight)
+    """
+    global _clip_ratios, _clip_norm, _clip_mem_budget
+    if ratios is not None:
+        ratios = list(dict.fromkeys([1.0] + [float(r) for r in ratios]))
+        if any(not 0.0 < r <= 1.0 for r in ratios):
+            raise ValueError(f"Clipping ratios must be in (0, 1], not {ratios}")
+    _clip_ratios, _clip_norm, _clip_mem_budget = ratios, float(norm), mem_budget
+
+
+def get_clip_search():
+    return _clip_ratios, _clip_norm, _clip_mem_budget
+
+
+@contextmanager
+def clip_search(ratios=None, norm: float = 2.0, mem_budget: Optional[int] = None):
+    prev = get_clip_search()
+    set_clip_search(ratios, norm, mem_budget)
+    try:
+        yield
+    finally:
+        set_clip_search(*prev)
+
+
+@torch.no_grad()
+def _clip_range(w, rmin, rmax, deq_fn, dtype: Optional[torch.dtype] = None):
+    """
+        (rmin, rmax) shrunk by the best clipping ratio of every group, unchanged when the search is off.
+        w       : [K, ...] weight view, groups along the last axis (cast to dtype tile by tile)
+        rmin    : same shape as rmax, or None for absmax quantizers
+        rmax    : [..., 1] per channel / group, or a scalar: one ratio for the whole tensor
+        deq_fn  : deq_fn(w, lo, hi) -> dequantized w for the range (lo, hi), broadcasting
+    """
+    if _clip_ratios is None:
+        return rmin, rmax
+    R, per_tensor = len(_clip_ratios), rmax.dim() == 0
+    ratios = torch.tensor(_clip_ratios, dtype=rmax.dtype, device=rmax.device)
+    r_view = ratios.view((R,) + (1,) * (w.dim() if per_tensor else rmax.dim()))
+
+    K = w.size(0)
+    budget = _clip_mem_budget if _clip_mem_budget is not None else _CLIP_DEFAULT_BUDGET
+    rows = max(1, min(K, budget // (R * w[0].numel() * _CLIP_BYTES_PER_ELEM)))
+    err_sum = torch.zeros(R, dtype=torch.float32, device=w.device) if per_tensor else None
+    best = None if per_tensor else torch.empty_like(rmax)
+    for r0 in range(0, K, rows):
+        r1 = min(r0 + rows, K)
+        t = w[r0:r1] if dtype is None else w[r0:r1].to(dtype)
+        if per_tensor:
+            lo, hi = rmin, rmax
+        else:
+            lo, hi = (None if rmin is None else rmin[r0:r1]), rmax[r0:r1]
+        lo = None if lo is None else lo * r_view
+        deq = deq_fn(t.unsqueeze(0), lo, hi * r_view)               # [R, rows, ..., gs]
+        err = (deq.float() - t.float()).abs_().pow_(_clip_norm)
+        err = torch.nan_to_num_(err, nan=float('inf'))
+        del deq
+        if per_tensor:
+            err_sum += err.sum(dim=tuple(range(1, err.dim())))
+        else:
+            best[r0:r1] = ratios[err.sum(-1, keepdim=True).argmin(0)]  # first minimum (1.0) wins ties
+        del err
+    if per_tensor:
+        best = ratios[err_sum.argmin()]
+    return (None if rmin is None else rmin * best), rmax * best
+
+
+def _clip_deq_int(wq_bits: int, asym: bool):
+    """ deq_fn of the INT kernels (sym uses max(-lo, hi) when lo is given) """
+    if asym:
+        qmax = 2 ** wq_bits - 1
+        def deq(w, lo, hi):
+            scale = _store_round(((hi - lo) / qmax).clamp(min=1e-5, max=1e4))
+            zp = torch.round(-lo / scale).clamp(min=0, max=qmax)
+            return (torch.clamp(torch.round(w / scale) + zp, min=0, max=qmax) - zp) * scale
+    else:
+        qmax = 2 ** (wq_bits - 1) - 1
+        def deq(w, lo, hi):
+            rabs = hi if lo is None else torch.maximum(-lo, hi)
+            scale = _store_round((rabs / qmax).clamp(min=1e-5, max=1e4))
+            return torch.round(w / scale).clamp_(min=-qmax, max=qmax) * scale
+    return deq
+
+
+def _clip_deq_fp(cb: Codebook, store: bool = True):
+    """ deq_fn of the FP codebook kernels (store=False: fp32 scale as in the per-tensor / e5m2 paths) """
+    def deq(w, lo, hi):
+        rabs = hi if lo is None else torch.maximum(-lo, hi)
+        scale = (rabs / cb.qmax).clamp(min=1e-5, max=1e4)
+        if store:
+            scale = _store_round(scale)
+        return _round_fp(w / scale, cb) * scale
+    return deq
+
+
+def _clip_deq_mx(cb: Codebook):
+    """ deq_fn of quant_mx: the clipped max sets the shared power-of-two exponent """
+    def deq(w, lo, hi):
+        shared = 2 ** torch.floor(torch.log2(hi))
+        scale = 1 / (cb.qmax / 2)
+        return _round_fp(w / shared / scale, cb) * scale * shared
+    return deq
+
+
+def _clip_rrange(w, rrange, wq_bits: int, wq_datatype: str, int_kernel: bool):
+    """
+        Clip the whole-tensor (min, max) of a per-tensor weight that is quantized in row tiles,
+        the same way the untiled kernel clips its own range (None / unchanged when the search is off).
+        int_kernel: _int_quant_meta (else _fp_quant_meta, also for int codebooks via quant_datatype)
+    """
+    if rrange is None or _clip_ratios is None:
+        return rrange
+    if int_kernel:
+        dtype = get_compute_dtype()
+        deq_fn = _clip_deq_int(wq_bits, "asym" in wq_datatype)
+    else:                                   # FP per-tensor paths compute in fp32
+        dtype = torch.float32
+        deq_fn = _clip_deq_fp(CODEBOOKS.get(wq_datatype, w.device, dtype), store=False)
+    rmin, rmax = (r.to(dtype) for r in rrange)
+    return _clip_range(w, rmin, rmax, deq_fn, dtype=dtype)
+
+
 """ @torch.no_grad()
 def quant_int(w_fp16, wq_bits:int=4, group_size: Optional[int]=None):  
     if (group_size is None) or (group_size <= 0):
@@ -237,29 +574,32 @@ def quant_int(w_fp16, wq_bits: int = 4, group_size: Optional[int] = None):
     """
     qmax = 2 ** (wq_bits-1)-1
     qmin = -qmax
+    cdtype = get_compute_dtype()
 
     if group_size == -1:  # per -tensor
-        w_fp16_new = w_fp16.to(torch.float16)
+        w_fp16_new = w_fp16.to(cdtype)
         rmax = w_fp16_new.abs().amax()
-        scale_fp = (rmax/qmax).clamp(min=1e-5, max=1e4)
+        _, rmax = _clip_range(w_fp16_new, None, rmax, _clip_deq_int(wq_bits, False))
+        scale_fp = _store_round((rmax/qmax).clamp(min=1e-5, max=1e4))
         q_tensor = torch.clamp(torch.round(
             w_fp16_new / scale_fp), min=qmin, max=qmax)
-        return (q_tensor*scale_fp)
+        return (q_tensor*scale_fp).to(_STORAGE_DTYPE)
 
     if (group_size is None) or (group_size <= 0):  # per-channel
-        w_fp16_new = w_fp16.to(torch.float16)
+        w_fp16_new = w_fp16.to(cdtype)
     else:
         K, C = w_fp16.size()                      # per-group
         NUM_GROUP = C // group_size
         w_fp16_new = w_fp16.unsqueeze(-1).reshape(K,
-                                                  NUM_GROUP, group_size).to(torch.float16)
+                                                  NUM_GROUP, group_size).to(cdtype)
 
     rmax = torch.amax(w_fp16_new.abs(), dim=-1, keepdim=True)
+    _, rmax = _clip_range(w_fp16_new, None, rmax, _clip_deq_int(wq_bits, False))
     scale_fp = rmax / qmax
-    scale_fp = scale_fp.clamp(min=1e-5, max=1e4)
+    scale_fp = _store_round(scale_fp.clamp(min=1e-5, max=1e4))
     q_tensor = torch.clamp(torch.round(
         w_fp16_new / scale_fp), min=qmin, max=qmax)
-    deq_tensor = q_tensor * scale_fp
+    deq_tensor = (q_tensor * scale_fp).to(_STORAGE_DTYPE)
     if (group_size is None) or (group_size <= 0):
         return deq_tensor
     else:
@@ -305,30 +645,33 @@ def quant_int_asym(w_fp16, wq_bits: int = 4, group_size: Optional[int] = None):
            >0       :per-group
     """
     qmin, qmax = 0, 2**wq_bits - 1
+    cdtype = get_compute_dtype()
 
     if group_size == -1:  # per-tensor
-        w_fp16_new = w_fp16.to(torch.float16)
+        w_fp16_new = w_fp16.to(cdtype)
         rmin = w_fp16_new.amin()
         rmax = w_fp16_new.amax()
-        scale_fp = ((rmax - rmin) / (qmax - qmin)).clamp(min=1e-5, max=1e4)
+        rmin, rmax = _clip_range(w_fp16_new, rmin, rmax, _clip_deq_int(wq_bits, True))
+        scale_fp = _store_round(((rmax - rmin) / (qmax - qmin)).clamp(min=1e-5, max=1e4))
         zp = torch.round(-rmin / scale_fp).clamp(min=qmin, max=qmax)
         q_tensor = torch.clamp(torch.round(
             w_fp16_new / scale_fp) + zp, min=qmin, max=qmax)
-        return (q_tensor - zp)*scale_fp
+        return ((q_tensor - zp)*scale_fp).to(_STORAGE_DTYPE)
 
     if (group_size is None) or (group_size <= 0):
-        w_fp16_new = w_fp16.to(torch.float16)
+        w_fp16_new = w_fp16.to(cdtype)
     else:
         K, C = w_fp16.size()
         Ng = C // group_size
-        w_fp16_new = w_fp16.unsqueeze(-1).reshape(K, Ng, group_size).to(torch.float16)
+        w_fp16_new = w_fp16.unsqueeze(-1).reshape(K, Ng, group_size).to(cdtype)
 
     rmin = torch.amin(w_fp16_new, dim=-1, keepdim=True)
     rmax = torch.amax(w_fp16_new, dim=-1, keepdim=True)
-    scale_fp = ((rmax - rmin) / (qmax - qmin)).clamp(min=1e-5, max=1e4)
+    rmin, rmax = _clip_range(w_fp16_new, rmin, rmax, _clip_deq_int(wq_bits, True))
+    scale_fp = _store_round(((rmax - rmin) / (qmax - qmin)).clamp(min=1e-5, max=1e4))
     zp = torch.round(-rmin / scale_fp).clamp(min=qmin, max=qmax)
     q_tensor = torch.clamp(torch.round(w_fp16_new / scale_fp) + zp, min=qmin, max=qmax)
-    deq_tensor = (q_tensor - zp) * scale_fp
+    deq_tensor = ((q_tensor - zp) * scale_fp).to(_STORAGE_DTYPE)
     if (group_size is None) or (group_size <= 0):
         return deq_tensor
     else:
@@ -350,31 +693,21 @@ def quant_mx(w_fp16, wq_bits: int = 4, datatype: str = "", group_size: int = 32)
 
     assert datatype in DATATYPE_MAPPING, f"unexpected data type {datatype}."
 
-    allow_value = DATATYPE_MAPPING[datatype]
-    mid_value = [(allow_value[i] + allow_value[i + 1]) /
-                 2 for i in range(len(allow_value) - 1)]
     K, C = w_fp16.size()  # output channel, input channel
     NUM_GROUP = C // group_size
     w_fp16_new = w_fp16.unsqueeze(-1).reshape(K,
                                               NUM_GROUP, group_size).to(torch.float32)
+    cb = CODEBOOKS.get(datatype, w_fp16_new.device, w_fp16_new.dtype)
 
     shared_exp, _ = torch.max(w_fp16_new.abs(), dim=-1, keepdim=True)
+    _, shared_exp = _clip_range(w_fp16_new, None, shared_exp, _clip_deq_mx(cb))
     shared_exp = torch.floor(torch.log2(shared_exp))
     w_fp16_new = w_fp16_new / (2**shared_exp)
-    qmax = max([abs(x) for x in allow_value])
+    qmax = cb.qmax
     scale = 1 / (qmax / 2)
     x = w_fp16_new / scale
 
-    q_tensor = torch.zeros_like(x)
-    for i in range(len(allow_value)):
-        data = allow_value[i]
-        if i == 0:
-            q_tensor += torch.where(x <= mid_value[i], data, 0)
-        elif i == len(allow_value) - 1:
-            q_tensor += torch.where(x > mid_value[i - 1], data, 0)
-        else:
-            q_tensor += torch.where((mid_value[i - 1] < x)
-                                    & (x <= mid_value[i]), data, 0)
+    q_tensor = _round_fp(x, cb)
 
     w_fp16_new = q_tensor * scale * (2**shared_exp)
     return w_fp16_new.reshape(K, C).to(torch.float16)
@@ -501,108 +834,22 @@ def quant_datatype(w_fp16, wq_bits: int = 4, datatype: str = "", group_size: Opt
         return w_fp16_new.reshape(K, C) """
         
 @torch.no_grad()
-def quant_datatype(w_fp16, wq_bits: int = 4, datatype: str = "", group_size: Optional[int] = None):
-    if datatype == "fp8_e5m2":
-        from torch import tensor
-        w = w_fp16.to(torch.float32)
-        
-        if group_size == -1:  # per-tensor
-            rmax  = w.abs().amax()
-            allow = tensor(DATATYPE_MAPPING_8_BIT[datatype], dtype=torch.float32, device=w.device)
-            qmax  = allow.abs().amax()
-            scale = (rmax / qmax).clamp(min=1e-5, max=1e4)
-            x   = w / scale
-            mid = (allow[:-1] + allow[1:]) * 0.5
-            q   = torch.zeros_like(x, dtype=torch.float32)
-            edges = torch.cat([tensor([-float('inf')], device=w.device), mid, tensor([float('inf')], device=w.device)])
-            for i, v in enumerate(allow):
-                mask = (edges[i] < x) & (x <= edges[i+1])
-                q = torch.where(mask, v, q)
-            w_deq = q * scale
-            return w_deq  
-
-        # per-channel/per-group 
-        if group_size and group_size > 0:
-            K, C = w.size()
-            w = w.unsqueeze(-1).reshape(K, C // group_size, group_size)
-        rmax   = torch.amax(w.abs(), dim=-1, keepdim=True)
-        allow  = tensor(DATATYPE_MAPPING_8_BIT[datatype], dtype=torch.float32, device=w.device)
-        qmax   = allow.abs().amax()
-        scale  = (rmax / qmax).clamp(min=1e-5, max=1e4)
-        x      = w / scale
-        mid    = (allow[:-1] + allow[1:]) * 0.5
-        q      = torch.zeros_like(x, dtype=torch.float32)
-        edges  = torch.cat([tensor([-float('inf')], device=w.device), mid, tensor([float('inf')], device=w.device)])
-        for i, v in enumerate(allow):
-            mask = (edges[i] < x) & (x <= edges[i+1])
-            q = torch.where(mask, v, q)
-        w_deq = q * scale
-        return (w_deq.reshape_as(w_fp16) if group_size and group_size > 0 else w_deq)
-    
-    if wq_bits == 3:
-        DATATYPE_MAPPING = DATATYPE_MAPPING_3_BIT
-    elif wq_bits == 4:
-        DATATYPE_MAPPING = DATATYPE_MAPPING_4_BIT
-    elif wq_bits == 5:
-        DATATYPE_MAPPING = DATATYPE_MAPPING_5_BIT
-    elif wq_bits == 6:
-        DATATYPE_MAPPING = DATATYPE_MAPPING_6_BIT
-    elif wq_bits == 8:                              # inseo
-        DATATYPE_MAPPING = DATATYPE_MAPPING_8_BIT
-    else:
-        raise ValueError(
-            f"Currently only support 3-, 4-, 5-,6- and 8-bit quantization, not {wq_bits}-bit")
-
-    assert datatype in DATATYPE_MAPPING, f"unexpected data type {datatype}."
-
-    allow_value = DATATYPE_MAPPING[datatype]
-    mid_value = [(allow_value[i] + allow_value[i + 1]) /
-                 2 for i in range(len(allow_value) - 1)]
-
-    if group_size == -1:  # per-tensor
-        w32 = w_fp16.to(torch.float32)
-        rmax = w32.abs().amax()
-        qmax = max(abs(x) for x in allow_value)
-        scale = (rmax / qmax).clamp(min=1e-5, max=1e4)
-        x = w32 / scale
-
-        q = torch.zeros_like(x)
-        for i in range(len(allow_value)):
-            data = allow_value[i]
-            if i == 0:                  q += torch.where(x <= mid_value[i], data, 0)
-            elif i == len(allow_value)-1: q += torch.where(x >  mid_value[i-1], data, 0)
-            else:                       q += torch.where((mid_value[i-1] < x) & (x <= mid_value[i]), data, 0)
-        return (q * scale).to(torch.float16)
-
-    # per-channel/per-group 
-    if (group_size is None) or (group_size <= 0):
-        w_view = w_fp16.to(torch.float16)
-    else:
-        K, C = w_fp16.size()
-        Ng = C // group_size
-        w_view = w_fp16.unsqueeze(-1).reshape(K, Ng, group_size).to(torch.float16)
-
-    rmax = torch.amax(w_view.abs(), dim=-1, keepdim=True)
-    qmax = max([abs(x) for x in allow_value])
-    scale_fp = (rmax / qmax).clamp(min=1e-5, max=1e4)
-    x = w_view / scale_fp
-
-    q_tensor = torch.zeros_like(x)
-    for i in range(len(allow_value)):
-        data = allow_value[i]
-        if i == 0:                  q_tensor += torch.where(x <= mid_value[i], data, 0)
-        elif i == len(allow_value)-1: q_tensor += torch.where(x >  mid_value[i-1], data, 0)
-        else:                       q_tensor += torch.where((mid_value[i-1] < x) & (x <= mid_value[i]), data, 0)
-
-    deq = q_tensor * scale_fp
-    if (group_size is None) or (group_size <= 0):
-        return deq
-    else:
-        return deq.reshape(K, C)
-
-
-@torch.no_grad()
-def search_datatype(w_fp16, wq_bits: int = 4, datatype: str = 'mixed_bitmod', group_size: Optional[int] = None):
+def quant_datatype(w_fp16, wq_bits: int = 4, datatype: str = "", group_size: Optional[int] = None,
+                   mem_budget: Optional[int] = None):
+    # codebook (FP / INT-grid) fake quantization, shares its single pass with _fp_quant_meta
+    rows = _tile_rows(w_fp16, mem_budget)
+    rrange = _value_range(w_fp16, rows) if (group_size == -1 and rows < w_fp16.size(0)) else None
+    rrange = _clip_rrange(w_fp16, rrange, wq_bits, datatype, int_kernel=False)
+    w_deq, _, _ = _run_tiled(
+        lambda t: _fp_quant_meta(t, wq_bits=wq_bits, datatype=datatype,
+                                 group_size=group_size, rrange=rrange), w_fp16, rows)
+    return w_deq
+
+
+def _mixed_candidates(wq_bits: int, datatype: str):
+    """
+        Candidate datatypes searched per group by search_datatype.
+    """
     if wq_bits == 3:
         if datatype == 'mixed_bitmod':
             datatype_list = ['fp3_er_pos', 'fp3_er_neg',
@@ -613,6 +860,8 @@ def search_datatype(w_fp16, wq_bits: int = 4, datatype: str = 'mixed_bitmod', gr
             datatype_list = ['fp3_ea_pos', 'fp3_ea_neg']
         elif datatype == 'mixed_ant':
             datatype_list = ['int3', 'fp3']
+        else:
+            raise ValueError(f"unexpected mixed data type {datatype}.")
     elif wq_bits == 4:
         if datatype == 'mixed_bitmod':
             datatype_list = ['fp4_er_pos', 'fp4_er_neg',
@@ -623,87 +872,158 @@ def search_datatype(w_fp16, wq_bits: int = 4, datatype: str = 'mixed_bitmod', gr
             datatype_list = ['fp4_ea_pos', 'fp4_ea_neg']
         elif datatype == 'mixed_ant':
             datatype_list = ['int4', 'flint4']
+        else:
+            raise ValueError(f"unexpected mixed data type {datatype}.")
     else:
         raise ValueError(
             f"Currently only support 3-bit and 4-bit mixed quantization, not {wq_bits}-bit")
+    return datatype_list
+
+
+@torch.no_grad()
+def search_datatype(w_fp16, wq_bits: int = 4, datatype: str = 'mixed_bitmod', group_size: Optional[int] = None,
+                    mem_budget: Optional[int] = None, return_index: bool = False):
+    """
+        Per-group datatype search, all candidates evaluated in one pass.
+        Candidate codebooks are stacked to [D, L] (shorter ones padded with +inf
+        midpoints) and the per-group squared error of every candidate is computed
+        together; the first candidate with the lowest error wins, as before.
+        mem_budget : approx. bytes for the stacked [D, rows, C] work, rows are tiled to fit
+        return_index: also return the [K, NUM_GROUP] index into the candidate list
+    """
+    datatype_list = _mixed_candidates(wq_bits, datatype)
 
     K, C = w_fp16.size()  # output channel, input channel
     if (group_size is None) or (group_size <= 0):
         group_size = C
     NUM_GROUP = C // group_size
     w_fp16 = w_fp16.unsqueeze(-1).reshape(K, NUM_GROUP, group_size)
-    q_tensor = torch.zeros_like(w_fp16)
-
-    error = torch.full([K, NUM_GROUP], 1e3,
-                       dtype=w_fp16.dtype, device=w_fp16.device)
-    for datatype in datatype_list:
-        w_fp16_tmp = quant_datatype(
-            w_fp16, wq_bits=wq_bits, datatype=datatype, group_size=None)
-        quant_error = (w_fp16_tmp - w_fp16).pow(2).mean(-1)
-        update_mask = torch.lt(quant_error, error)
-        error[update_mask] = quant_error[update_mask]
-        q_tensor[update_mask] = w_fp16_tmp[update_mask]
-
-        del w_fp16_tmp, quant_error, update_mask
+    w_view = w_fp16.to(get_compute_dtype())
+
+    # ---- stacked codebooks [D, L] ----
+    cbs = [CODEBOOKS.get(dt, w_view.device, w_view.dtype) for dt in datatype_list]
+    D, L = len(cbs), max(cb.n_levels for cb in cbs)
+    levels = torch.zeros(D, L, dtype=w_view.dtype, device=w_view.device)
+    mid = torch.full((D, L - 1), float('inf'), dtype=w_view.dtype, device=w_view.device)
+    for d, cb in enumerate(cbs):
+        levels[d, :cb.n_levels] = cb.levels
+        mid[d, :cb.n_levels - 1] = cb.mid
+    qmax = torch.tensor([cb.qmax for cb in cbs], dtype=w_view.dtype,
+                        device=w_view.device).view(D, 1, 1, 1)
 
+    q_tensor = torch.zeros_like(w_fp16)
+    best_idx = torch.zeros(K, NUM_GROUP, dtype=torch.long, device=w_fp16.device)
+    if mem_budget is None:
+        rows = K
+    else:   # x, deq (compute dtype) + int64 codebook index per stacked element
+        rows = max(1, mem_budget // (D * C * (2 * w_view.element_size() + 8)))
+
+    for r0 in range(0, K, rows):
+        r1 = min(r0 + rows, K)
+        w_tile, w_view_tile = w_fp16[r0:r1], w_view[r0:r1]
+
+        rmax = torch.amax(w_view_tile.abs(), dim=-1, keepdim=True)
+        scale = _store_round((rmax / qmax).clamp(min=1e-5, max=1e4))   # [D,R,Ng,1]
+        x = w_view_tile / scale                                   # [D,R,Ng,gs]
+        idx = torch.searchsorted(mid, x.reshape(D, -1))
+        deq = torch.gather(levels, 1, idx).view_as(x) * scale
+        del x, idx
+
+        quant_error = (deq - w_tile).pow(2).mean(-1)              # [D,R,Ng]
+        quant_error = torch.nan_to_num(quant_error, nan=float('inf'))
+        best = quant_error.argmin(dim=0)                          # first minimum wins
+        update_mask = quant_error.gather(0, best.unsqueeze(0)).squeeze(0) < 1e3
+
+        best_deq = deq.gather(0, best[None, ..., None].expand(1, -1, -1, group_size)).squeeze(0)
+        q_tensor[r0:r1] = torch.where(update_mask.unsqueeze(-1), best_deq.to(q_tensor.dtype), 0)
+        best_idx[r0:r1] = best
+
+        del deq, quant_error, best, update_mask, best_deq
+
+    if return_index:
+        return q_tensor.reshape(K, C), best_idx
     return q_tensor.reshape(K, C)
 
 
-def quant_model(model, wq_bits: Optional[int] = None, wq_datatype: Optional[str] = None, wq_groupsize: Optional[int] = None):
+def _announce_quant(wq_bits: Optional[int] = None, wq_datatype: Optional[str] = None, wq_groupsize: Optional[int] = None):
+    """
+        Print which quantization is applied. return False when not quantizing.
+    """
     if (wq_datatype is None) or (wq_datatype in ["fp16", "fp32"]):
         print("Not applying quantization")
-        time.sleep(2)
+        return False
     elif (wq_datatype.startswith("int")) and ("asym" in wq_datatype):
         print(
             f"Applying asymmetric INT quantization with bits: {wq_bits}, group size: {wq_groupsize}")
-        time.sleep(2)
-        for n, m in model.named_modules():
-            if isinstance(m, torch.nn.Linear):
-                print(f'Quantizing layer: {n}')
-                m.weight.data = quant_int_asym(
-                    m.weight.data, wq_bits=wq_bits, group_size=wq_groupsize)
     elif (wq_datatype.startswith("int")) and ("asym" not in wq_datatype):
         print(
             f"Applying symmetric INT quantization with bits: {wq_bits}, group size: {wq_groupsize}")
-        time.sleep(2)
-        for n, m in model.named_modules():
-            if isinstance(m, torch.nn.Linear):
-                print(f'Quantizing layer: {n}')
-                m.weight.data = quant_int(
-                    m.weight.data, wq_bits=wq_bits, group_size=wq_groupsize)
     elif ("mx" in wq_datatype):
-        '''
-            We use hard-coded group size 32 based on the Open Compute Standard
-            https://www.opencompute.org/documents/ocp-microscaling-formats-mx-v1-0-spec-final-pdf
-        '''
         print(
             f"Applying MX quantization with bits: {wq_bits}, datatype: {wq_datatype}, group size: 32")
-        time.sleep(2)
-        for n, m in model.named_modules():
-            if isinstance(m, torch.nn.Linear):
-                print(f'Quantizing layer: {n}')
-                m.weight.data = quant_mx(
-                    m.weight.data, wq_bits=wq_bits, datatype=wq_datatype, group_size=32)
     elif ("mixed" in wq_datatype):
         print(
             f"Applying mixed datatype quantization with bits: {wq_bits}, datatype: {wq_datatype}, group size: {wq_groupsize}")
-        time.sleep(2)
-        for n, m in model.named_modules():
-            if isinstance(m, torch.nn.Linear):
-                print(f'Quantizing layer: {n}')
-                m.weight.data = search_datatype(
-                    m.weight.data, wq_bits=wq_bits, datatype=wq_datatype, group_size=wq_groupsize)
     elif ("fp" in wq_datatype):
         print(
             f"Applying floating-point datatype quantization with bits: {wq_bits}, group size: {wq_groupsize}")
-        time.sleep(2)
-        for n, m in model.named_modules():
-            if isinstance(m, torch.nn.Linear):
-                print(f'Quantizing layer: {n}')
-                m.weight.data = quant_datatype(
-                    m.weight.data, wq_bits=wq_bits, datatype=wq_datatype, group_size=wq_groupsize)
     else:
         raise ValueError(f"Unsupported datatype {wq_datatype}")
+    return True
+
+
+def _map_layers(layers, fn, num_workers: int = 1, max_inflight: Optional[int] = None):
+    """
+        Apply fn to every (name, module) in layers, yield (name, module, fn(module)) in order.
+        num_workers > 1  : run fn on a thread pool (torch kernels release the GIL)
+        max_inflight     : cap on layers submitted but not yet consumed (default 2*num_workers),
+                           bounds the number of quantized copies alive at once
+    """
+    if (num_workers is None) or (num_workers <= 1):
+        for n, m in layers:
+            yield n, m, fn(m)
+        return
+
+    max_inflight = max(1, max_inflight or 2 * num_workers)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        for n, m in layers:
+            if len(pending) >= max_inflight:
+                pn, pm, fut = pending.popleft()
+                yield pn, pm, fut.result()
+            pending.append((n, m, pool.submit(fn, m)))
+        while pending:
+            pn, pm, fut = pending.popleft()
+            yield pn, pm, fut.result()
+
+
+def _quantize_layers(model, wq_bits: Optional[int] = None, wq_datatype: Optional[str] = None, wq_groupsize: Optional[int] = None,
+                     num_workers: int = 1, max_inflight: Optional[int] = None,
+                     mem_budget: Optional[int] = None, with_error: bool = False):
+    """
+        One quantization pass per nn.Linear: the weight is replaced by its
+        dequantized value and (name, module, QuantResult) is yielded in order.
+        mem_budget: bytes of kernel temporaries per layer (see quantize_weight)
+        with_error: error statistics computed in the same pass (QuantResult.error)
+    """
+    if not _announce_quant(wq_bits, wq_datatype, wq_groupsize):
+        return
+
+    layers = [(n, m) for n, m in model.named_modules() if isinstance(m, torch.nn.Linear)]
+    one_shot = lambda m: quantize_weight(m.weight.data, wq_bits, wq_datatype, wq_groupsize, mem_budget,
+                                         with_error)
+    for n, m, res in _map_layers(layers, one_shot, num_workers, max_inflight):
+        print(f'Quantizing layer: {n}')
+        m.weight.data = res.w_deq
+        yield n, m, res
+
+
+def quant_model(model, wq_bits: Optional[int] = None, wq_datatype: Optional[str] = None, wq_groupsize: Optional[int] = None,
+                num_workers: int = 1, max_inflight: Optional[int] = None,
+                mem_budget: Optional[int] = None):
+    for _ in _quantize_layers(model, wq_bits, wq_datatype, wq_groupsize, num_workers, max_inflight,
+                              mem_budget):
+        pass
 
 
 ''' Inseo '''
@@ -718,106 +1038,114 @@ def quant_model(model, wq_bits: Optional[int] = None, wq_datatype: Optional[str]
 def _int_quant_meta(w_fp16: torch.Tensor,
                     wq_bits: int = 4,
                     asym: bool = False,
-                    group_size: Optional[int] = None):
+                    group_size: Optional[int] = None,
+                    rrange: Optional[tuple] = None,
+                    stats: Optional["_SharedStats"] = None):
     """
     return
     • de-quant FP16  
     • q_tensor[int8] (=-7‥7 / 0‥15)
     simultaneously
+    rrange: (min, max) of the whole tensor, per-tensor only (row tiles of a larger weight)
+    stats : shared views / min·max of w_fp16 (quantize_weight_multi)
     """
+    cdtype, sdtype = get_compute_dtype(), _STORAGE_DTYPE
     if group_size == -1:  # per-tensor
-        w_view = w_fp16.to(torch.float16)
+        w_view = w_fp16.to(cdtype) if stats is None else stats.view(None, cdtype)
+        if rrange is None:                  # (tiled callers pass an already clipped range)
+            rrange = _clip_range(w_view, w_view.amin(), w_view.amax(), _clip_deq_int(wq_bits, asym))
+        rmin, rmax = (r.to(cdtype) for r in rrange)
         if asym:
             qmin, qmax = 0, 2**wq_bits - 1
-            rmin = w_view.amin()
-            rmax = w_view.amax()
-            scale = ((rmax - rmin) / (qmax - qmin)).clamp(min=1e-5, max=1e4)
+            scale = _store_round(((rmax - rmin) / (qmax - qmin)).clamp(min=1e-5, max=1e4))
             zp = torch.round(-rmin / scale).clamp(min=qmin, max=qmax)
             q = torch.clamp(torch.round(w_view / scale) + zp, min=qmin, max=qmax)
-            w_deq = (q - zp) * scale
-            return w_deq.reshape_as(w_fp16), q.to(torch.int8), scale, zp
+            w_deq = ((q - zp) * scale).to(sdtype)
+            return w_deq.reshape_as(w_fp16), q.to(torch.uint8), scale.to(sdtype), zp.to(sdtype)
         else:
             qmax = 2 ** (wq_bits - 1) - 1
-            rmax = w_view.abs().amax()
-            scale = (rmax / qmax).clamp_(min=1e-5, max=1e4)
+            rmax = torch.maximum(-rmin, rmax)          # == w_view.abs().amax()
+            scale = _store_round((rmax / qmax).clamp_(min=1e-5, max=1e4))
             q = torch.round(w_view / scale).clamp_(min=-qmax, max=qmax)
-            w_deq = q * scale
-            return w_deq.reshape_as(w_fp16), q.to(torch.uint8), scale, None # unit8 반영 안된채로 export되어있음 (int8로 export됨)
+            w_deq = (q * scale).to(sdtype)
+            return w_deq.reshape_as(w_fp16), q.to(torch.int8), scale.to(sdtype), None   # signed codes, same as per-channel
     
     # ---- per-channel·per-group reshape ---------------------------------
-    if (group_size is None) or (group_size <= 0):
-        w_view = w_fp16.to(torch.float16)
+    if stats is not None:                   # shared across configs: no reshape / reduction here
+        w_view = stats.view(group_size, cdtype)
+        rmin, rmax, rabs = stats.minmax(group_size, cdtype)
+    elif (group_size is None) or (group_size <= 0):
+        w_view = w_fp16.to(cdtype)
     else:                                   # [K,C] → [K,Ng,gs]
         K, C = w_fp16.size()
         Ng = C // group_size
         w_view = w_fp16.unsqueeze(-1).reshape(K, Ng,
-                                              group_size).to(torch.float16)
+                                              group_size).to(cdtype)
 
     if asym:                                # ---------- Asymmetric -------
-        rmin = torch.amin(w_view, dim=-1, keepdim=True)
-        rmax = torch.amax(w_view, dim=-1, keepdim=True)
+        if stats is None:
+            rmin = torch.amin(w_view, dim=-1, keepdim=True)
+            rmax = torch.amax(w_view, dim=-1, keepdim=True)
+        rmin, rmax = _clip_range(w_view, rmin, rmax, _clip_deq_int(wq_bits, True))
         qmin, qmax = 0, 2 ** wq_bits - 1
         scale = (rmax - rmin) / (qmax - qmin)
-        scale = scale.clamp(min=1e-5, max=1e4)
+        scale = _store_round(scale.clamp(min=1e-5, max=1e4))
         zp = torch.round(-rmin / scale).clamp(min=qmin, max=qmax)
         q = torch.round(w_view / scale) + zp
         q = torch.clamp(q, min=qmin, max=qmax)
-        w_deq = (q - zp) * scale
-        return w_deq.reshape_as(w_fp16), q.to(torch.uint8), scale.squeeze(-1), zp.squeeze(-1)
+        w_deq = ((q - zp) * scale).to(sdtype)
+        return (w_deq.reshape_as(w_fp16), q.to(torch.uint8),
+                scale.squeeze(-1).to(sdtype), zp.squeeze(-1).to(sdtype))
 
     else:                                   # ---------- Symmetric --------
-        rmax = torch.amax(w_view.abs(), dim=-1, keepdim=True)
+        rmax = torch.amax(w_view.abs(), dim=-1, keepdim=True) if stats is None else rabs
+        _, rmax = _clip_range(w_view, None, rmax, _clip_deq_int(wq_bits, False))
         qmax = 2 ** (wq_bits - 1) - 1
-        scale = (rmax / qmax).clamp_(min=1e-5, max=1e4)
+        scale = _store_round((rmax / qmax).clamp_(min=1e-5, max=1e4))
         q = torch.round(w_view / scale).clamp_(
             min=-qmax, max=qmax)            # -7‥+7(4bit) / -127‥+127(8bit)
-        w_deq = q * scale
-        return w_deq.reshape_as(w_fp16), q.to(torch.int8), scale.squeeze(-1), None
+        w_deq = (q * scale).to(sdtype)
+        return w_deq.reshape_as(w_fp16), q.to(torch.int8), scale.squeeze(-1).to(sdtype), None
 
 # ----------  FP-quantization + metadata  ---------------------------------
 @torch.no_grad()
-def _fp_quant_meta(w_fp16, wq_bits:int=4, datatype: str="", group_size: Optional[int]=None):
-    if wq_bits == 3:
-        DATATYPE_MAPPING = DATATYPE_MAPPING_3_BIT
-    elif wq_bits == 4:
-        DATATYPE_MAPPING = DATATYPE_MAPPING_4_BIT
-    elif wq_bits == 5:
-        DATATYPE_MAPPING = DATATYPE_MAPPING_5_BIT
-    elif wq_bits == 6:
-        DATATYPE_MAPPING = DATATYPE_MAPPING_6_BIT
-    elif wq_bits == 8:
-        DATATYPE_MAPPING = DATATYPE_MAPPING_8_BIT
-    else:
-        raise ValueError(f"Currently only support 3-, 4-, 5-,6- and 8-bit quantization, not {wq_bits}-bit")
-
-    assert datatype in DATATYPE_MAPPING, f"unexpected data type {datatype}."
-
+def _fp_quant_meta(w_fp16, wq_bits:int=4, datatype: str="", group_size: Optional[int]=None,
+                   rrange: Optional[tuple] = None, stats: Optional["_SharedStats"] = None):
+    # rrange: (min, max) of the whole tensor, per-tensor only (row tiles of a larger weight)
+    # stats : shared views / min·max of w_fp16 (quantize_weight_multi)
     # ===== FP8_E5M2:FP32 =====
+    if group_size == -1 and rrange is not None:
+        rabs = torch.maximum(-rrange[0], rrange[1]).to(torch.float32)   # == w.abs().amax()
+
     if datatype == "fp8_e5m2":
-        w = w_fp16.to(torch.float32)
+        if stats is not None:
+            w = stats.view(group_size, torch.float32)
+            if group_size and group_size > 0:
+                K, C = w_fp16.size()
+        else:
+            w = w_fp16.to(torch.float32)
 
         # per-group: [K,C] -> [K,Ng,gs]
-        if group_size and group_size > 0:
+        if group_size and group_size > 0 and stats is None:
             K, C = w.size()
             Ng = C // group_size
             w = w.unsqueeze(-1).reshape(K, Ng, group_size)
 
-        allow = torch.tensor(DATATYPE_MAPPING_8_BIT[datatype],
-                             dtype=torch.float32, device=w.device)
-        qmax  = allow.abs().amax()
+        cb = CODEBOOKS.get(datatype, w.device, w.dtype)
+        qmax  = cb.qmax
 
         # per-tensor는 스칼라 scale, 그 외엔 마지막 축 기준
-        rmax = w.abs().amax() if group_size == -1 else torch.amax(w.abs(), dim=-1, keepdim=True)
+        if group_size == -1:
+            rmax = w.abs().amax() if rrange is None else rabs
+        elif stats is not None:
+            rmax = stats.minmax(group_size, torch.float32)[2]
+        else:
+            rmax = torch.amax(w.abs(), dim=-1, keepdim=True)
+        if group_size != -1 or rrange is None:
+            _, rmax = _clip_range(w, None, rmax, _clip_deq_fp(cb, store=False))
         scale = (rmax / qmax).clamp(min=1e-5, max=1e4)
         x = w / scale
-
-        mid   = (allow[:-1] + allow[1:]) * 0.5
-        q     = torch.zeros_like(x, dtype=torch.float32)
-        edges = torch.cat([torch.tensor([-float('inf')], device=w.device),
-                           mid, torch.tensor([float('inf')], device=w.device)])
-        for i, v in enumerate(allow):
-            mask = (edges[i] < x) & (x <= edges[i+1])
-            q = torch.where(mask, v, q)
+        q = _round_fp(x, cb)
 
         w_deq = q * scale
         if group_size and group_size > 0:
@@ -825,93 +1153,379 @@ def _fp_quant_meta(w_fp16, wq_bits:int=4, datatype: str="", group_size: Optional
         else:
             return w_deq.reshape_as(w_fp16), q.reshape_as(w_fp16), (scale if scale.ndim == 0 else scale.squeeze(-1))
 
-    # ===== 그 외 FP format: FP16 return =====
-    allow_value = DATATYPE_MAPPING[datatype]
-    mid_value = [(allow_value[i] + allow_value[i + 1]) / 2 for i in range(len(allow_value) - 1)]
+    if wq_bits == 3:
+        DATATYPE_MAPPING = DATATYPE_MAPPING_3_BIT
+    elif wq_bits == 4:
+        DATATYPE_MAPPING = DATATYPE_MAPPING_4_BIT
+    elif wq_bits == 5:
+        DATATYPE_MAPPING = DATATYPE_MAPPING_5_BIT
+    elif wq_bits == 6:
+        DATATYPE_MAPPING = DATATYPE_MAPPING_6_BIT
+    elif wq_bits == 7:
+        DATATYPE_MAPPING = DATATYPE_MAPPING_7_BIT
+    elif wq_bits == 8:
+        DATATYPE_MAPPING = DATATYPE_MAPPING_8_BIT
+    else:
+        raise ValueError(f"Currently only support 3-, 4-, 5-, 6-, 7- and 8-bit quantization, not {wq_bits}-bit")
+
+    assert datatype in DATATYPE_MAPPING, f"unexpected data type {datatype}."
 
-    # --- per-tensor ---
+    # ===== 그 외 FP format: FP16 return =====
+    # --- per-tensor (FP32 compute) ---
     if group_size == -1:
-        w16 = w_fp16.to(torch.float16)
-        rmax = w16.abs().amax()
-        qmax = max(abs(x) for x in allow_value)
+        w32 = w_fp16.to(torch.float32) if stats is None else stats.view(None, torch.float32)
+        cb = CODEBOOKS.get(datatype, w32.device, w32.dtype)
+        if rrange is None:
+            _, rmax = _clip_range(w32, None, w32.abs().amax(), _clip_deq_fp(cb, store=False))
+        else:
+            rmax = rabs
+        qmax = cb.qmax
         scale_fp = (rmax / qmax).clamp(min=1e-5, max=1e4)
-        x = w16 / scale_fp
-
-        q_tensor = torch.zeros_like(x)
-        for i, data in enumerate(allow_value):
-            if i == 0:                    q_tensor += torch.where(x <= mid_value[i], data, 0)
-            elif i == len(allow_value)-1: q_tensor += torch.where(x >  mid_value[i-1], data, 0)
-            else:                         q_tensor += torch.where((mid_value[i-1] < x) & (x <= mid_value[i]), data, 0)
+        x = w32 / scale_fp
+        q_tensor = _round_fp(x, cb)
 
-        w_deq = q_tensor * scale_fp
+        w_deq = (q_tensor * scale_fp).to(torch.float16)
         return w_deq.reshape_as(w_fp16), q_tensor.to(torch.float16), scale_fp  # scale: scalar
 
-    # --- per-channel / per-group ---
-    if (group_size is None) or (group_size <= 0):   # per-channel
-        w_view = w_fp16.to(torch.float16)
+    # --- per-channel / per-group (compute-dtype policy) ---
+    cdtype, sdtype = get_compute_dtype(), _STORAGE_DTYPE
+    if stats is not None:
+        w_view = stats.view(group_size, cdtype)
+        K, C = w_fp16.size()
+    elif (group_size is None) or (group_size <= 0):   # per-channel
+        w_view = w_fp16.to(cdtype)
     else:                                           # per-group: [K,C]→[K,Ng,gs]
         K, C = w_fp16.size()
         Ng = C // group_size
-        w_view = w_fp16.unsqueeze(-1).reshape(K, Ng, group_size).to(torch.float16)
+        w_view = w_fp16.unsqueeze(-1).reshape(K, Ng, group_size).to(cdtype)
 
-    rmax = torch.amax(w_view.abs(), dim=-1, keepdim=True)
-    qmax = max(abs(x) for x in allow_value)
-    scale_fp = (rmax / qmax).clamp(min=1e-5, max=1e4)
+    cb = CODEBOOKS.get(datatype, w_view.device, w_view.dtype)
+    if stats is None:
+        rmax = torch.amax(w_view.abs(), dim=-1, keepdim=True)
+    else:
+        rmax = stats.minmax(group_size, cdtype)[2]
+    _, rmax = _clip_range(w_view, None, rmax, _clip_deq_fp(cb))
+    qmax = cb.qmax
+    scale_fp = _store_round((rmax / qmax).clamp(min=1e-5, max=1e4))
     x = w_view / scale_fp
+    q_tensor = _round_fp(x, cb)
 
-    q_tensor = torch.zeros_like(x)
-    for i, data in enumerate(allow_value):
-        if i == 0:                    q_tensor += torch.where(x <= mid_value[i], data, 0)
-        elif i == len(allow_value)-1: q_tensor += torch.where(x >  mid_value[i-1], data, 0)
-        else:                         q_tensor += torch.where((mid_value[i-1] < x) & (x <= mid_value[i]), data, 0)
-
-    w_deq = q_tensor * scale_fp
+    w_deq = (q_tensor * scale_fp).to(sdtype)
+    scale_fp = scale_fp.squeeze(-1).to(sdtype)
     if (group_size is None) or (group_size <= 0):
-        return w_deq, q_tensor.to(torch.float16), scale_fp.squeeze(-1)       # scale: [K]
+        return w_deq, q_tensor.to(sdtype), scale_fp       # scale: [K]
+    else:
+        return w_deq.reshape(K, C), q_tensor.to(sdtype), scale_fp  # scale: [K,Ng]
+
+
+
+# ----------  one-shot quantization result  ---------------------------------
+class QuantResult:
+    """
+        Everything one quantization pass produces for a weight.
+        w_deq      : dequantized weight (what the fake-quant model uses)
+        q          : INT codes / FP codebook values, None for mx and mixed
+        scale      : scalar (per-tensor), [K] (per-channel) or [K,Ng] (per-group)
+        zp         : zero-point for asymmetric INT, else None
+        layout     : 'per-tensor' | 'per-channel' | 'per-group'
+        error      : quant_error.weight_error_stats dict when requested (with_error), else None
+    """
+    def __init__(self, w_deq, q=None, scale=None, zp=None,
+                 datatype: Optional[str] = None, wq_bits: Optional[int] = None,
+                 group_size: Optional[int] = None):
+        self.w_deq = w_deq
+        self.q = q
+        self.scale = scale
+        self.zp = zp
+        self.datatype = datatype
+        self.wq_bits = wq_bits
+        self.group_size = group_size
+        self.error = None
+        if group_size == -1:
+            self.layout = "per-tensor"
+        elif (group_size is None) or (group_size <= 0):
+            self.layout = "per-channel"
+        else:
+            self.layout = "per-group"
+
+
+# ----------  row tiling under a memory budget  ---------------------------------
+_TILE_BYTES_PER_ELEM = 32       # upper bound of live temporaries per weight element inside a kernel
+
+
+def _tile_rows(w: torch.Tensor, mem_budget: Optional[int]) -> int:
+    """
+        Rows per tile so that one kernel call stays within mem_budget bytes (None: whole weight).
+        Tiles are whole rows, so per-channel / per-group statistics never span two tiles.
+    """
+    K = w.size(0)
+    if mem_budget is None:
+        return K
+    return max(1, min(K, mem_budget // (w[0].numel() * _TILE_BYTES_PER_ELEM)))
+
+
+@torch.no_grad()
+def _value_range(w: torch.Tensor, rows: int):
+    """
+        (min, max) of the whole weight, reduced tile by tile (exact, no full-size copy).
+    """
+    rmin, rmax = None, None
+    for r0 in range(0, w.size(0), rows):
+        t = w[r0:r0 + rows]
+        tmin, tmax = t.amin(), t.amax()
+        rmin = tmin if rmin is None else torch.minimum(rmin, tmin)
+        rmax = tmax if rmax is None else torch.maximum(rmax, tmax)
+    return rmin, rmax
+
+
+@torch.no_grad()
+def _run_tiled(fn, w: torch.Tensor, rows: int):
+    """
+        Apply the row-independent kernel fn to w in tiles of rows, writing every
+        returned tensor into an output preallocated on the first tile.
+        Scalars (per-tensor scale / zp) and None are taken from the first tile.
+    """
+    K = w.size(0)
+    if rows >= K:
+        return fn(w)
+
+    outs, single = None, False
+    for r0 in range(0, K, rows):
+        r1 = min(r0 + rows, K)
+        res = fn(w[r0:r1])
+        if outs is None:
+            single = torch.is_tensor(res)
+            res = (res,) if single else res
+            outs = [t if (t is None or t.dim() == 0)
+                    else torch.empty((K,) + tuple(t.shape[1:]), dtype=t.dtype, device=t.device)
+                    for t in res]
+        elif single:
+            res = (res,)
+        for o, t in zip(outs, res):
+            if t is not None and t.dim() > 0:
+                o[r0:r1] = t
+        del res
+    return outs[0] if single else tuple(outs)
+
+
+@torch.no_grad()
+def quantize_weight(w_fp16, wq_bits: int, wq_datatype: str, group_size: Optional[int] = None,
+                    mem_budget: Optional[int] = None, with_error: bool = False) -> QuantResult:
+    """
+        Quantize one weight once and return dequantized weight, codes, scales
+        and zero-points together (same dispatch order as quant_model).
+        mem_budget: approx. bytes of kernel temporaries, rows are tiled to fit
+                    (bit-identical to the untiled result)
+        with_error: also fill result.error (MSE / P99 against w_fp16, see quant_error)
+    """
+    res = _quantize_weight(w_fp16, wq_bits, wq_datatype, group_size, mem_budget)
+    if with_error:
+        res.error = weight_error_stats(w_fp16, res.w_deq, res.layout, res.group_size)
+    return res
+
+
+def _quantize_weight(w_fp16, wq_bits: int, wq_datatype: str, group_size: Optional[int] = None,
+                     mem_budget: Optional[int] = None) -> QuantResult:
+    rows = _tile_rows(w_fp16, mem_budget)
+    rrange = None
+    if group_size == -1 and rows < w_fp16.size(0):      # per-tensor: global range first
+        rrange = _value_range(w_fp16, rows)
+        if _shares_stats(wq_datatype):                  # INT / FP kernels
+            rrange = _clip_rrange(w_fp16, rrange, wq_bits, wq_datatype,
+                                  int_kernel=wq_datatype.startswith("int"))
+
+    if wq_datatype.startswith("int"):
+        w_deq, q, scale, zp = _run_tiled(
+            lambda t: _int_quant_meta(t, wq_bits=wq_bits, asym="asym" in wq_datatype,
+                                      group_size=group_size, rrange=rrange), w_fp16, rows)
+    elif ("mx" in wq_datatype):
+        w_deq = _run_tiled(
+            lambda t: quant_mx(t, wq_bits=wq_bits, datatype=wq_datatype, group_size=32), w_fp16, rows)
+        return QuantResult(w_deq, datatype=wq_datatype, wq_bits=wq_bits, group_size=32)
+    elif ("mixed" in wq_datatype):
+        w_deq = search_datatype(w_fp16, wq_bits=wq_bits, datatype=wq_datatype, group_size=group_size,
+                                mem_budget=mem_budget)
+        return QuantResult(w_deq, datatype=wq_datatype, wq_bits=wq_bits, group_size=group_size)
+    elif ("fp" in wq_datatype):
+        w_deq, q, scale = _run_tiled(
+            lambda t: _fp_quant_meta(t, wq_bits=wq_bits, datatype=wq_datatype,
+                                     group_size=group_size, rrange=rrange), w_fp16, rows)
+        zp = None
     else:
-        return w_deq.reshape(K, C), q_tensor.to(torch.float16), scale_fp.squeeze(-1)  # scale: [K,Ng]
+        raise ValueError(f"Unsupported datatype {wq_datatype}")
+    return QuantResult(w_deq, q, scale, zp, datatype=wq_datatype,
+                       wq_bits=wq_bits, group_size=group_size)
 
 
+# ----------  many configs of one weight, shared statistics  ---------------------------------
+class _SharedStats:
+    """
+        Group views [K,C] / [K,Ng,gs] of one weight (tile) and their min / max / abs-max,
+        computed once per (group size, dtype) and reused by every config.
+        Per-channel and per-tensor share the [K,C] view (group_size None / <= 0).
+    """
+    def __init__(self, w: torch.Tensor):
+        self.w = w
+        self._views, self._minmax = {}, {}
+
+    @staticmethod
+    def _key(group_size, dtype):
+        return (group_size if (group_size and group_size > 0) else None, dtype)
+
+    def view(self, group_size, dtype):
+        key = self._key(group_size, dtype)
+        if key not in self._views:
+            w, gs = self.w, key[0]
+            if gs is not None:
+                K, C = w.size()
+                w = w.unsqueeze(-1).reshape(K, C // gs, gs)
+            self._views[key] = w.to(dtype)
+        return self._views[key]
+
+    def minmax(self, group_size, dtype):
+        """ (rmin, rmax, rabs) over the last axis, keepdim. rabs == view.abs().amax(-1) """
+        key = self._key(group_size, dtype)
+        if key not in self._minmax:
+            v = self.view(group_size, dtype)
+            rmin, rmax = torch.aminmax(v, dim=-1, keepdim=True)
+            self._minmax[key] = (rmin, rmax, torch.maximum(-rmin, rmax))
+        return self._minmax[key]
+
+
+def _shares_stats(wq_datatype: str) -> bool:
+    # INT and plain FP kernels take _SharedStats, mx (fixed gs 32) and mixed do not
+    if wq_datatype.startswith("int"):
+        return True
+    return ("mx" not in wq_datatype) and ("mixed" not in wq_datatype) and ("fp" in wq_datatype)
+
+
+@torch.no_grad()
+def quantize_weight_multi(w_fp16, configs, mem_budget: Optional[int] = None,
+                          with_error: bool = False) -> dict:
+    """
+        Quantize one weight under many configs in one pass over its statistics.
+        configs: iterable of (wq_bits, wq_datatype, group_size),
+                 e.g. [(4, "int4", 128), (4, "int4_asym", 128), (3, "fp3", None)]
+        Group reshapes and min/max reductions are done once per (group size, compute dtype)
+        and row tile, then every INT/FP config only runs its rounding.
+        mx / mixed configs fall back to quantize_weight.
+        mem_budget: as quantize_weight (the shared views of a tile stay alive for all configs)
+        with_error: also fill result.error of every config
+        return {config: QuantResult}, each bit-identical to quantize_weight(w_fp16, *config)
+    """
+    configs = list(dict.fromkeys(tuple(c) for c in configs))
+    shared = [c for c in configs if _shares_stats(c[1])]
+
+    out = {}
+    if shared:
+        rows = _tile_rows(w_fp16, mem_budget)
+        rrange, clipped = None, {}
+        if any(gs == -1 for _, _, gs in shared):        # per-tensor: global range once
+            rrange = _value_range(w_fp16, rows)
+            clipped = {c: _clip_rrange(w_fp16, rrange, c[0], c[1], int_kernel=c[1].startswith("int"))
+                       for c in shared if c[2] == -1}
+
+        def run(t):
+            stats, res = _SharedStats(t), []
+            for bits, dt, gs in shared:
+                rr = clipped.get((bits, dt, gs), rrange)
+                if dt.startswith("int"):
+                    res += _int_quant_meta(t, wq_bits=bits, asym="asym" in dt, group_size=gs,
+                                           rrange=rr, stats=stats)
+                else:
+                    res += _fp_quant_meta(t, wq_bits=bits, datatype=dt, group_size=gs,
+                                          rrange=rr, stats=stats) + (None,)
+            return tuple(res)
+
+        flat = _run_tiled(run, w_fp16, rows)
+        for i, (bits, dt, gs) in enumerate(shared):
+            w_deq, q, scale, zp = flat[4 * i:4 * i + 4]
+            out[(bits, dt, gs)] = QuantResult(w_deq, q, scale, zp, datatype=dt,
+                                              wq_bits=bits, group_size=gs)
+
+    for c in configs:
+        if c not in out:
+            out[c] = quantize_weight(w_fp16, *c, mem_budget=mem_budget)
+        if with_error and out[c].error is None:
+            out[c].error = weight_error_stats(w_fp16, out[c].w_deq, out[c].layout, out[c].group_size)
+    return {c: out[c] for c in configs}
+
+
+def _code_indices(result: QuantResult):
+    """
+        Codes of a QuantResult as unsigned indices in [0, 2**bits-1] for pack_codes.
+          INT sym : q + 2**(bits-1) (offset binary)
+          INT asym: q as is
+          FP      : index into the sorted codebook (returned as well)
+        return (indices[uint8], bits, codebook or None)
+    """
+    if result.datatype.startswith("int"):
+        q = result.q.to(torch.int16)
+        if result.zp is None:
+            q = q + 2 ** (result.wq_bits - 1)
+        return q.to(torch.uint8), result.wq_bits, None
+    cb = CODEBOOKS.get(result.datatype, result.q.device, result.q.dtype)
+    assert cb.n_levels <= 2 ** cb.wq_bits, f"{cb.name} does not fit in {cb.wq_bits} bits."
+    idx = torch.searchsorted(cb.levels, result.q.reshape(-1).contiguous())
+    return idx.to(torch.uint8), cb.wq_bits, cb.levels
+
+
+def has_dump(wq_datatype: Optional[str]) -> bool:
+    # 기타 datatype (mx, mixed) 은 dump 없이 fake-quant 만
+    return (wq_datatype not in (None, "fp16", "fp32")
+            and (wq_datatype.startswith("int") or wq_datatype.startswith("fp")))
+
+
+def dump_buffers(result: QuantResult) -> dict:
+    """ {"weight_q", "weight_scale"[, "weight_codebook"][, "weight_zp"]: tensor} of one layer """
+    # weight_q: packed uint8 bitstream (quant_utils.bitpack), bits/8 byte per weight
+    codes, code_bits, codebook = _code_indices(result)
+    bufs = {"weight_q": pack_codes(codes, code_bits)}
+    if result.datatype == "fp8_e5m2":
+        bufs["weight_scale"] = result.scale                      # FP32
+    else:
+        bufs["weight_scale"] = result.scale.to(torch.float16)
+    if codebook is not None:                                     # FP: index -> value
+        bufs["weight_codebook"] = codebook.to(bufs["weight_scale"].dtype)
+    if result.zp is not None:
+        bufs["weight_zp"] = result.zp
+    return bufs
+
 
 class _LinearDump(nn.Linear):
     def __init__(self, src: nn.Linear, wq_bits: int,
-                 mode: str, group_size: Optional[int]):
+                 mode: str, group_size: Optional[int],
+                 result: Optional[QuantResult] = None):
 
+        # meta: skip allocating/initializing a weight that is replaced right away
         super().__init__(src.in_features, src.out_features,
-                         bias=src.bias is not None)
+                         bias=src.bias is not None, device="meta")
         self.weight = nn.Parameter(src.weight.detach())
         if src.bias is not None:
             self.bias = nn.Parameter(src.bias.detach())
 
-        if mode.startswith("int"):
-            asym = "asym" in mode
-            _, q, scale, zp = _int_quant_meta(
-                self.weight.data, wq_bits=wq_bits,
-                asym=asym, group_size=group_size)
-        else:
-            # e.g. fp4 / fp8_e2m5 / fp8_e3m4 ...
-            _, q, scale = _fp_quant_meta(
-                self.weight.data, wq_bits=wq_bits,
-                datatype=mode, group_size=group_size)
-            zp = None
-
-        if mode == "fp8_e5m2":
-            self.register_buffer("weight_q", q)                  # FP32
-            self.register_buffer("weight_scale", scale)          # FP32
-        else:
-            self.register_buffer("weight_q", q.to(torch.float16))
-            self.register_buffer("weight_scale", scale.to(torch.float16))
-        if zp is not None:
-            self.register_buffer("weight_zp", zp)
+        if result is None:      # stand-alone use: quantize the source weight here
+            result = quantize_weight(self.weight.data, wq_bits, mode, group_size)
+        for b_name, buf in dump_buffers(result).items():
+            self.register_buffer(b_name, buf)
 
-    def forward(self, x):
-        out = F.linear(x, self.weight, self.bias)
-        
-        dummy  = self.weight_q.float().sum()
-        dummy += self.weight_scale.float().sum()
-        if hasattr(self, "weight_zp"):
-            dummy += self.weight_zp.float().sum()
-        return out + dummy * 0.0
+    # forward is nn.Linear's: the dump buffers stay out of the compute graph,
+    # export_and_quant.py attaches them to the ONNX file via dump_initializers()
+
+
+def dump_initializers(model: nn.Module):
+    """
+        Quantization metadata of every _LinearDump in model, keyed like the
+        state_dict ("<layer>.weight_q", "<layer>.weight_scale", ...).
+        return: {name: np.ndarray}
+    """
+    out = {}
+    for name, mod in model.named_modules():
+        if not isinstance(mod, _LinearDump):
+            continue
+        for b_name, buf in mod.named_buffers(recurse=False):
+            out[f"{name}.{b_name}" if name else b_name] = buf.detach().cpu().numpy()
+    return out
 
 
 # ---------- 3) original quant_model ➜ wrapping  -------------------------------
@@ -919,21 +1533,42 @@ _original_quant_model = quant_model  # keep original
 
 
 def quant_model(model, wq_bits=None, wq_datatype=None,
-                wq_groupsize=None, _dump_int=True):
-
-    _original_quant_model(model, wq_bits, wq_datatype, wq_groupsize)
-
-    if not _dump_int or wq_datatype in (None, "fp16", "fp32"):
-        return
-
-    if not (wq_datatype.startswith("int") or wq_datatype.startswith("fp")):
-        return  # 기타 datatype 무시
-
-    for name, mod in list(model.named_modules()):
-        if isinstance(mod, nn.Linear):
+                wq_groupsize=None, _dump_int=True,
+                num_workers=1, max_inflight=None,
+                export_format="fakequant", mem_budget=None, error_report=None):
+    """
+        mem_budget: bytes of kernel temporaries per layer, rows are tiled to fit
+        error_report: CSV path, per-layer MSE / P99 of the weights (quant_error.REPORT_FIELDS)
+                      computed during quantization, no export / reload needed
+        export_format:
+          fakequant   : dequantized weights (+ weight_q / weight_scale / weight_zp dump)
+          qdq         : INT only, LowBitLinear -> DequantizeLinear + MatMul
+          matmulnbits : INT only, LowBitLinear -> com.microsoft::MatMulNBits
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format {export_format}")
+    lowbit = export_format != "fakequant" and wq_datatype not in (None, "fp16", "fp32")
+    if lowbit and not wq_datatype.startswith("int"):
+        raise ValueError(f"{export_format} export supports int datatypes only, not {wq_datatype}")
+
+    dump = _dump_int and has_dump(wq_datatype)
+
+    # one pass per layer: the dequantized weight and the dumped codes come from the same result
+    rows = []
+    for name, mod, res in _quantize_layers(model, wq_bits, wq_datatype, wq_groupsize,
+                                           num_workers, max_inflight, mem_budget,
+                                           with_error=error_report is not None):
+        if error_report is not None:
+            rows.append(report_row(f"{name}.weight", res))
+        if lowbit:
+            parent, attr = _find_parent(model, name)
+            setattr(parent, attr, LowBitLinear(mod, res, export_format))
+        elif dump:
             parent, attr = _find_parent(model, name)
             setattr(parent, attr,
-                    _LinearDump(mod, wq_bits, wq_datatype, wq_groupsize))
+                    _LinearDump(mod, wq_bits, wq_datatype, wq_groupsize, result=res))
+    if error_report is not None and rows:
+        write_error_report(rows, error_report)
 
 
 def _find_parent(root: nn.Module, target_name: str):
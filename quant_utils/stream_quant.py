@@ -0,0 +1,67 @@
+import os, json, glob
+import torch
+from safetensors import safe_open
+
+# =======================================================================
+#  Streaming weight source: memory-mapped safetensors checkpoint shards
+#
+#  the fake-quant export of a config never loads the model. Every MatMul/Gemm
+#  weight of the fp16 baseline graph is read from the checkpoint shard that
+#  holds it, quantized and written into a copy of the baseline's external data
+#  (onnx_patch.patch_quantized_onnx with load_weight=CheckpointReader.weight)
+#  -> peak memory ~ a few copies of the largest tensor.
+#  the fp16 baseline graph itself is one full-model export per model
+# =======================================================================
+
+_CKPT_PATTERNS = ["*.safetensors", "*.json", "*.model", "*.txt", "*.py", "*.tiktoken"]
+
+
+def resolve_checkpoint(model_name: str) -> str:
+    """
+        Local directory as is, HF hub name -> snapshot directory (files on disk, nothing loaded)
+    """
+    if os.path.isdir(model_name):
+        return model_name
+    from huggingface_hub import snapshot_download
+    return snapshot_download(model_name, allow_patterns=_CKPT_PATTERNS)
+
+
+def _shard_files(model_dir: str):
+    index = os.path.join(model_dir, "model.safetensors.index.json")
+    if os.path.exists(index):
+        with open(index) as f:
+            return sorted(set(json.load(f)["weight_map"].values()))
+    files = sorted(os.path.basename(p) for p in glob.glob(os.path.join(model_dir, "*.safetensors")))
+    if not files:
+        raise FileNotFoundError(f"No safetensors checkpoint in {model_dir}")
+    return files
+
+
+class CheckpointReader:
+    """
+        Tensors of a safetensors checkpoint, memory-mapped, read one at a time.
+        weight(entry): torch-layout [out, in] weight of a graph_index.WeightEntry
+    """
+    def __init__(self, model_name: str):
+        self.dir = resolve_checkpoint(model_name)
+        self._shards, self._where = [], {}
+        for shard in _shard_files(self.dir):
+            f = safe_open(os.path.join(self.dir, shard), framework="pt")
+            self._shards.append(f)
+            for name in f.keys():
+                self._where[name] = f
+        self.misses = 0         # weights not found under their graph / module name
+
+    @torch.no_grad()
+    def weight(self, entry):
+        """
+            checkpoint tensor named like the initializer or <layer>.weight with the graph's shape,
+            None when there is none (exporter-renamed tied weights): read from the graph instead
+        """
+        shape = tuple(entry.shape[::-1] if entry.transposed else entry.shape)
+        for name in (entry.name, f"{entry.layer}.weight"):
+            f = self._where.get(name)
+            if f is not None and tuple(f.get_slice(name).get_shape()) == shape:
+                return f.get_tensor(name)
+        self.misses += 1
+        return None
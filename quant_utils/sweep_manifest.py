@@ -0,0 +1,254 @@
+import os, json, glob, time, fcntl, hashlib
+from onnx import TensorProto
+from quant_utils.onnx_reader import OnnxReader
+from quant_utils.graph_index import file_hash
+from quant_utils.artifact_store import TensorStore, TENSORS_SUFFIX
+
+# =======================================================================
+#  Resumable sweep manifest: onnx_graph/<model_slug>/manifest.json
+#
+#  one entry per exported graph (key: path relative to the model directory,
+#  e.g. per-group/int4/w_4_gs_128/model.onnx) with
+#    export : inputs (model revision, quant-code version, quant options),
+#             artifact (sha256 + size/mtime of the graph and its external data)
+#    eval   : inputs (artifact sha256, dataset, seqlen, eval-code version), results
+#  a step is skipped when its recorded inputs equal the current ones and the
+#  artifact files are unchanged on disk (size/mtime, no re-hashing).
+#  updates are merged under an flock: concurrent export/eval jobs share the file
+# =======================================================================
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# sources whose change invalidates exports / evaluations: only the modules the written
+# graph depends on (scheduler, analysis and manifest edits keep recorded exports valid)
+EXPORT_CODE = ("quant_utils/quant_weight.py", "quant_utils/bitpack.py", "quant_utils/lowbit_linear.py",
+               "quant_utils/stream_quant.py", "quant_utils/onnx_patch.py", "quant_utils/artifact_store.py",
+               "quant_utils/graph_index.py", "quant_utils/onnx_reader.py", "export_and_quant.py")
+EVAL_CODE = ("eval.py",)
+
+_code_versions = {}
+
+
+def code_version(patterns=EXPORT_CODE) -> str:
+    """ sha256 (16 hex) over the repo files matching patterns """
+    if patterns not in _code_versions:
+        h = hashlib.sha256()
+        for pat in patterns:
+            for path in sorted(glob.glob(os.path.join(_REPO, pat))):
+                h.update(os.path.relpath(path, _REPO).encode())
+                h.update(file_hash(path).encode())
+        _code_versions[patterns] = h.hexdigest()[:16]
+    return _code_versions[patterns]
+
+
+def model_revision(model_name: str):
+    """
+        commit of the HF cache snapshot (refs/main under HF_HUB_CACHE / HF_HOME),
+        size/mtime digest for a local checkpoint directory, None when not downloaded yet
+    """
+    if os.path.isdir(model_name):
+        h = hashlib.sha256()
+        for f in sorted(os.listdir(model_name)):
+            p = os.path.join(model_name, f)
+            if os.path.isfile(p):
+                st = os.stat(p)
+                h.update(f"{f}:{st.st_size}:{st.st_mtime_ns}".encode())
+        return "local:" + h.hexdigest()[:16]
+    ref = os.path.join(_hub_repo(model_name), "refs", "main")
+    try:
+        with open(ref) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _hub_repo(model_name: str) -> str:
+    hub = os.environ.get("HF_HUB_CACHE") or os.path.join(
+        os.environ.get("HF_HOME", os.path.expanduser("~/.cache/huggingface")), "hub")
+    return os.path.join(hub, "models--" + model_name.replace("/", "--"))
+
+
+def hf_snapshot_dir(model_name: str):
+    """ local checkpoint directory or cached HF snapshot of model_name, None when not on disk """
+    if os.path.isdir(model_name):
+        return model_name
+    rev = model_revision(model_name)
+    path = rev and os.path.join(_hub_repo(model_name), "snapshots", rev)
+    return path if path and os.path.isdir(path) else None
+
+
+def export_inputs(model_name, bits, dtype, groupsize, export_format="fakequant", mode="full",
+                  compute_dtype="fp16", clip=(0, 0.5, 2.0), error_report=False) -> dict:
+    """ everything an export depends on (mode: full | stream | patch | baseline) """
+    if mode == "baseline":      # plain export, quant options do not apply
+        export_format, compute_dtype, clip, error_report = "fakequant", None, (), False
+    return {"revision": model_revision(model_name), "code": code_version(EXPORT_CODE),
+            "bits": bits, "dtype": dtype, "groupsize": groupsize, "export_format": export_format,
+            "mode": mode, "compute_dtype": compute_dtype, "clip": list(clip),
+            "error_report": bool(error_report)}
+
+
+def eval_inputs(model_name, artifact_sha, dataset, seqlen=1024) -> dict:
+    return {"revision": model_revision(model_name), "code": code_version(EVAL_CODE),
+            "artifact": artifact_sha, "dataset": dataset, "seqlen": seqlen}
+
+
+def config_key(onnx_path: str, model_dir: str) -> str:
+    return os.path.relpath(onnx_path, model_dir).replace(os.sep, "/")
+
+
+def clip_tag(args) -> str:
+    """ config directory suffix of clipped scales: _clip<grid>[_m<min>][_p<norm>] ("" without clipping) """
+    if args.quant_clip_grid <= 0:
+        return ""
+    tag = f"_clip{args.quant_clip_grid}"
+    if args.quant_clip_min != 0.5:
+        tag += f"_m{args.quant_clip_min:g}"
+    if args.quant_clip_norm != 2.0:
+        tag += f"_p{args.quant_clip_norm:g}"
+    return tag
+
+
+def artifact_files(onnx_path: str):
+    """ the graph and every external data file it references """
+    reader = OnnxReader(onnx_path)
+    locs = {e.value for init in reader.model.graph.initializer
+            if init.data_location == TensorProto.EXTERNAL
+            for e in init.external_data if e.key == "location"}
+    reader.close()
+    return [onnx_path] + [os.path.join(reader.base_dir, loc) for loc in sorted(locs)]
+
+
+def _linked_digest(path: str, st: os.stat_result, store: TensorStore):
+    """ digest of a <graph>.tensors/<sha256>.bin file that is a hard link to its store object, else None """
+    if store is None or st.st_nlink < 2:
+        return None
+    digest = os.path.basename(path)[:-len(".bin")]
+    try:
+        return digest if os.path.samestat(st, os.stat(store.object_path(digest))) else None
+    except OSError:
+        return None
+
+
+def artifact_record(onnx_path: str, store: TensorStore = None) -> dict:
+    """
+        {path, sha256, files: {rel: sha256}, stat: {rel: [size, mtime_ns]}}
+        file names are trusted as hashes only for hard links into store, anything else is hashed
+    """
+    base = os.path.dirname(onnx_path)
+    files, stats = {}, {}
+    for p in artifact_files(onnx_path):
+        rel = os.path.relpath(p, base).replace(os.sep, "/")
+        st = os.stat(p)
+        digest = None
+        if os.path.dirname(rel).endswith(TENSORS_SUFFIX):
+            digest = _linked_digest(p, st, store)
+        files[rel] = digest or file_hash(p)
+        stats[rel] = [st.st_size, st.st_mtime_ns]
+    h = hashlib.sha256()
+    for rel in sorted(files):
+        h.update(f"{rel}:{files[rel]}\n".encode())
+    return {"path": onnx_path, "sha256": h.hexdigest(), "files": files, "stat": stats}
+
+
+def artifact_unchanged(artifact: dict) -> bool:
+    base = os.path.dirname(artifact["path"])
+    for rel, (size, mtime) in artifact["stat"].items():
+        try:
+            st = os.stat(os.path.join(base, rel))
+        except OSError:
+            return False
+        if (st.st_size, st.st_mtime_ns) != (size, mtime):
+            return False
+    return True
+
+
+class SweepManifest:
+    """
+        export_done / eval_done: recorded artifact path / results when up to date, else None
+        record_export / record_eval: merge one step into the file
+    """
+    def __init__(self, path: str, store: TensorStore = None):
+        self.path = path
+        self.store = store          # hard links into it are not re-hashed
+        self.entries = self._read()
+
+    @classmethod
+    def for_model(cls, model_dir: str, store: TensorStore = None):
+        return cls(os.path.join(model_dir, MANIFEST_NAME), store)
+
+    def reload(self):
+        self.entries = self._read()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data.get("configs", {}) if data.get("version") == MANIFEST_VERSION else {}
+
+    def _update(self, key: str, config: dict, merge=None, **sections):
+        """ merge(entry): called on the entry as re-read under the lock, before sections are set """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = self._read()
+            entry = entries.setdefault(key, {})
+            if merge is not None:
+                merge(entry)
+            entry.update(config)
+            entry.update(sections)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump({"version": MANIFEST_VERSION, "configs": entries}, f, indent=1)
+            os.replace(tmp, self.path)
+        self.entries = entries
+
+    def export_done(self, key: str, inputs: dict):
+        e = self.entries.get(key, {}).get("export")
+        if e and e["inputs"] == inputs and artifact_unchanged(e["artifact"]):
+            return e["artifact"]["path"]
+        return None
+
+    def record_export(self, key: str, config: dict, inputs: dict, onnx_path: str, seconds: float) -> dict:
+        artifact = artifact_record(onnx_path, self.store)
+        export = {"inputs": inputs, "artifact": artifact, "seconds": seconds,
+                  "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+        def drop_stale_eval(entry):
+            if (entry.get("export") or {}).get("artifact", {}).get("sha256") != artifact["sha256"]:
+                entry["eval"] = None        # new weights: results are stale
+        self._update(key, config, merge=drop_stale_eval, export=export)
+        return artifact
+
+    def artifact_sha(self, key: str, onnx_path: str) -> str:
+        """
+            sha256 of the graph at onnx_path, the recorded one when its files are unchanged.
+            graphs written outside the manifest are recorded with unknown inputs (hashed once)
+        """
+        e = self.entries.get(key, {}).get("export")
+        if e and e["artifact"]["path"] == onnx_path and artifact_unchanged(e["artifact"]):
+            return e["artifact"]["sha256"]
+        return self.record_export(key, {}, None, onnx_path, None)["sha256"]
+
+    def relocate(self, key: str):
+        """ re-record the artifact of key after its files were rewritten with the same tensors (dedup_onnx) """
+        entry = self.entries.get(key, {})
+        e = entry.get("export")
+        if not e or not os.path.exists(e["artifact"]["path"]) or artifact_unchanged(e["artifact"]):
+            return
+        artifact = artifact_record(e["artifact"]["path"], self.store)
+        def move_eval(entry):
+            ev = entry.get("eval")
+            if ev and ev["inputs"]["artifact"] == e["artifact"]["sha256"]:
+                ev["inputs"]["artifact"] = artifact["sha256"]
+        self._update(key, {}, merge=move_eval, export=dict(e, artifact=artifact))
+
+    def eval_done(self, key: str, inputs: dict):
+        e = self.entries.get(key, {}).get("eval")
+        return e["results"] if e and e["inputs"] == inputs else None
+
+    def record_eval(self, key: str, config: dict, inputs: dict, results: dict):
+        self._update(key, config, eval={"inputs": inputs, "results": results,
+                                        "time": time.strftime("%Y-%m-%d %H:%M:%S")})
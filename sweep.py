@@ -0,0 +1,203 @@
+# sweep.py
+# models × bit widths × datatypes × group sizes in one process:
+# the HF model, tokenizer and tokenized corpus are loaded once per model,
+# every config is quantized from a pristine copy, exported and evaluated.
+
+import os, copy, csv, time, argparse
+import torch
+from onnxruntime import SessionOptions
+from transformers import AutoTokenizer
+from quant_utils.quant_weight import quant_model, set_compute_dtype, set_clip_search, clip_grid
+from quant_utils.lowbit_linear import EXPORT_FORMATS
+from quant_utils.onnx_patch import patch_quantized_onnx
+from quant_utils.artifact_store import TensorStore
+from quant_utils.sweep_manifest import SweepManifest, export_inputs, eval_inputs, config_key, clip_tag
+from export_and_quant import load_causal_lm, export_onnx, ensure_baseline, quant_dir, store_export
+from eval import load_corpus, eval_ppl
+
+# datatypes per bit width (export_and_quant.sh / eval.sh)
+DATATYPES = {
+    3: ["int3", "int3_asym", "fp3"],
+    4: ["int4", "int4_asym", "fp4"],
+    5: ["int5", "int5_asym", "fp5_e2m2", "fp5_e3m1"],
+    6: ["int6", "int6_asym", "fp6_e2m3", "fp6_e3m2"],
+    7: ["int7", "int7_asym"],
+    8: ["int8", "int8_asym", "fp8_e2m5", "fp8_e3m4", "fp8_e4m3", "fp8_e5m2"],
+}
+SWEEP_FIELDS = ["model", "bits", "datatype", "group_size", "onnx", "export_s", "ppl", "tok_s", "size_mb"]
+
+def parse_args():
+    p = argparse.ArgumentParser(
+        description="Quantize, export and evaluate many configs with one model load."
+    )
+    p.add_argument("--model_names", type=str, nargs="+", required=True)
+    p.add_argument("--wq_bits", type=int, nargs="+", default=[4])
+    p.add_argument("--wq_datatypes", type=str, nargs="+", default=None,
+                   help="datatypes to sweep (default: every datatype of each bit width, see DATATYPES)")
+    p.add_argument("--wq_groupsizes", type=int, nargs="+", default=[128, -1],
+                   help="group sizes, -1 as in export_and_quant.sh")
+    p.add_argument("--dataset", type=str, default="wikitext-2-raw-v1")
+    p.add_argument("--no_eval", action="store_true", help="export only")
+    p.add_argument("--eval_baseline", action="store_true", help="also evaluate the fp16 baseline")
+    p.add_argument("--export_format", type=str, default="fakequant", choices=EXPORT_FORMATS)
+    p.add_argument("--patch_baseline", action="store_true",
+                   help="fakequant configs patched into the fp16 baseline export (see export_and_quant.py)")
+    p.add_argument("--tensor_store", type=str, default=None,
+                   help="content-addressed tensor store shared by all configs (see export_and_quant.py)")
+    p.add_argument("--quant_workers", type=int, default=1)
+    p.add_argument("--quant_max_inflight", type=int, default=None)
+    p.add_argument("--quant_mem_budget_mb", type=int, default=None)
+    p.add_argument("--quant_compute_dtype", type=str, default="fp16", choices=["fp16", "fp32"])
+    p.add_argument("--quant_clip_grid", type=int, default=0)
+    p.add_argument("--quant_clip_min", type=float, default=0.5)
+    p.add_argument("--quant_clip_norm", type=float, default=2.0)
+    p.add_argument("--ort_threads", type=int, default=0,
+                   help="ONNX Runtime intra-op threads (0 = ORT default)")
+    p.add_argument("--resume", action="store_true",
+                   help="skip exports / evaluations recorded as up to date in onnx_graph/<model>/manifest.json")
+    p.add_argument("--results_csv", type=str, default="sweep_results.csv")
+    return p.parse_args()
+
+def sweep_configs(args):
+    for bits in args.wq_bits:
+        if bits not in DATATYPES:
+            print(f"Unsupported bit width: {bits}")
+            continue
+        dtypes = DATATYPES[bits] if args.wq_datatypes is None \
+            else [d for d in args.wq_datatypes if d in DATATYPES[bits]]
+        for dtype in dtypes:
+            for gs in args.wq_groupsizes:
+                yield bits, dtype, gs
+
+def write_rows(rows, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SWEEP_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def main():
+    args = parse_args()
+    set_compute_dtype(args.quant_compute_dtype)
+    mem_budget = args.quant_mem_budget_mb * 2**20 if args.quant_mem_budget_mb else None
+    if args.quant_clip_grid > 0:
+        set_clip_search(clip_grid(args.quant_clip_grid, args.quant_clip_min),
+                        norm=args.quant_clip_norm, mem_budget=mem_budget)
+    onnx_name = "model.onnx" if args.export_format == "fakequant" else f"model_{args.export_format}.onnx"
+    store = TensorStore(args.tensor_store) if args.tensor_store else None
+
+    # one ONNX Runtime session configuration for every evaluated graph
+    sess_options = SessionOptions()
+    if args.ort_threads > 0:
+        sess_options.intra_op_num_threads = args.ort_threads
+
+    rows = []
+    for MODEL in args.model_names:
+        model_dir = os.path.join("onnx_graph", MODEL.replace("/", "__"))
+        manifest = SweepManifest.for_model(model_dir, store)
+        # tokenizer / corpus loaded on first use: a fully resumed model loads nothing
+        loaded = {}
+        def tokenizer():
+            if "tokenizer" not in loaded:
+                loaded["tokenizer"] = AutoTokenizer.from_pretrained(MODEL, use_fast=False, trust_remote_code=True)
+            return loaded["tokenizer"]
+        def corpus():
+            if "input_ids" not in loaded:
+                loaded["input_ids"] = load_corpus(tokenizer(), args.dataset)
+            return loaded["input_ids"]
+
+        # pristine weights as loaded (export_and_quant.py default), loaded on first use:
+        # every config quantizes a copy of it, so nothing is reloaded between configs
+        pristine = {}
+        def fresh_model(dtype):
+            if "model" not in pristine:
+                pristine["model"] = load_causal_lm(MODEL)
+            model = copy.deepcopy(pristine["model"]).to(dtype)
+            model.eval()
+            return model
+
+        def baseline():
+            path = os.path.join(model_dir, "fp16_baseline", "model.onnx")
+            if os.path.exists(path):
+                return path
+            path = ensure_baseline(model_dir, MODEL, fresh_model(torch.float16), tokenizer())
+            manifest.reload()       # recorded by ensure_baseline
+            return path
+
+        def evaluate(row, onnx_path, desc):
+            if not args.no_eval:
+                key = config_key(onnx_path, model_dir)
+                inputs = eval_inputs(MODEL, manifest.artifact_sha(key, onnx_path), args.dataset)
+                results = manifest.eval_done(key, inputs) if args.resume else None
+                if results is None:
+                    ppl, tok_s, size_mb = eval_ppl(onnx_path, corpus(), sess_options=sess_options, desc=desc)
+                    results = {"ppl": ppl, "tok_s": tok_s, "size_mb": size_mb}
+                    manifest.record_eval(key, {"model": MODEL}, inputs, results)
+                else:
+                    print(f"[Skip] {desc}: evaluation up to date")
+                row.update(results)
+                print(f"{desc:40s} PPL: {results['ppl']:.3f}  "
+                      f"({results['tok_s']:.1f} tok/s, {results['size_mb']:.1f} MiB on disk)")
+            rows.append(row)
+            write_rows(rows, args.results_csv)
+
+        if args.eval_baseline:
+            t0 = time.perf_counter()
+            base_path = baseline()
+            evaluate({"model": MODEL, "bits": 16, "datatype": "fp16", "group_size": "", "onnx": base_path,
+                      "export_s": time.perf_counter() - t0}, base_path, "fp16_baseline")
+
+        for bits, dtype, gs in sweep_configs(args):
+            print("--------------------")
+            print(f"[Sweep] Model={MODEL} Bits={bits}, Datatype={dtype}, GroupSize={gs}")
+            out_dir = quant_dir(model_dir, bits, dtype, gs, clip_tag(args))
+            os.makedirs(out_dir, exist_ok=True)
+            out_path = os.path.join(out_dir, onnx_name)
+            patch = args.patch_baseline and args.export_format == "fakequant" and dtype != "fp8_e5m2"
+            # same inputs as export_and_quant.py: either tool resumes the other's exports
+            key = config_key(out_path, model_dir)
+            config = {"model": MODEL, "bits": bits, "dtype": dtype, "group_size": gs,
+                      "export_format": args.export_format}
+            inputs = lambda: export_inputs(MODEL, bits, dtype, gs, args.export_format,
+                                           "patch" if patch else "full", args.quant_compute_dtype,
+                                           (args.quant_clip_grid, args.quant_clip_min, args.quant_clip_norm))
+            t0 = time.perf_counter()
+
+            if args.resume and manifest.export_done(key, inputs()):
+                print(f"[Skip] {out_path} is up to date")
+                row = {"model": MODEL, "bits": bits, "datatype": dtype, "group_size": gs, "onnx": out_path,
+                       "export_s": 0.0}
+                evaluate(row, out_path, os.path.relpath(out_dir, model_dir))
+                continue
+
+            if patch:
+                base_path = baseline()
+                out_path = patch_quantized_onnx(
+                    base_path, out_dir, bits, dtype, gs,
+                    num_workers=args.quant_workers, max_inflight=args.quant_max_inflight,
+                    mem_budget=mem_budget, store=store)
+                if store is not None:
+                    manifest.relocate(config_key(base_path, model_dir))
+            else:
+                # overflow issue is occured if fp8_e5m2 is casted to fp16
+                model = fresh_model(torch.float32 if dtype == "fp8_e5m2" else torch.float16)
+                quant_model(model, bits, dtype, gs,
+                            num_workers=args.quant_workers, max_inflight=args.quant_max_inflight,
+                            export_format=args.export_format, mem_budget=mem_budget)
+                export_onnx(model, MODEL, out_path, args.export_format, tokenizer())
+                store_export(out_path, store)
+                del model
+            manifest.record_export(key, config, inputs(), out_path, time.perf_counter() - t0)
+
+            row = {"model": MODEL, "bits": bits, "datatype": dtype, "group_size": gs, "onnx": out_path,
+                   "export_s": time.perf_counter() - t0}
+            print(f"[Export] {dtype} → {out_path} ({row['export_s']:.1f} s)")
+            evaluate(row, out_path, os.path.relpath(out_dir, model_dir))
+
+        pristine.clear()
+    if store is not None:
+        n, total = store.usage()
+        print(f"[Store] {n} distinct tensors, {total / 2**20:.1f} MiB in {store.root}")
+    print(f"[Done] sweep results → {args.results_csv}")
+
+if __name__ == "__main__":
+    main()
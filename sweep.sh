@@ -0,0 +1,15 @@
+#!/bin/bash
+set -euo pipefail
+
+# data save directory 
+export HF_HOME="results_quant"
+
+# one process per sweep: model / tokenizer / corpus loaded once per model
+python sweep.py \
+  --model_names "facebook/opt-1.3b" \
+  --wq_bits 4 8 \
+  --wq_groupsizes 128 -1 \
+  --dataset "wikitext-2-raw-v1" \
+  --eval_baseline \
+  --patch_baseline \
+  --results_csv "sweep_results.csv"